@@ -0,0 +1,35 @@
+import argparse
+import time
+
+import numpy as np
+
+from python_mlir_toy.ch2 import interpreter, batching, toy
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('batched execution benchmark')
+    arg_parser.add_argument('-batch', type=int, default=10000, help='number of independent input sets')
+    args = arg_parser.parse_args(argv)
+
+    module = toy.load_mlir(toy.build_arg_parser().parse_args(['tests/transpose.toy']))
+    rng = np.random.default_rng(0)
+    a = rng.random((args.batch, 2, 3))
+    b = rng.random((args.batch, 2, 3))
+
+    runner = interpreter.Interpreter(module)
+    start = time.perf_counter()
+    looped = np.stack([runner.run('multiply_transpose', a[index], b[index]) for index in range(args.batch)])
+    loop_time = time.perf_counter() - start
+
+    batched_runner = batching.BatchedInterpreter(module)
+    start = time.perf_counter()
+    batched = batched_runner.call_batched('multiply_transpose', a, b)
+    batch_time = time.perf_counter() - start
+
+    assert np.array_equal(looped, batched)
+    print(f'   loop: {loop_time * 1e3:8.3f} ms ({loop_time / args.batch * 1e6:.3f} us/input)')
+    print(f'batched: {batch_time * 1e3:8.3f} ms ({batch_time / args.batch * 1e6:.3f} us/input)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import argparse
+import time
+
+import numpy as np
+
+from python_mlir_toy.ch2 import interpreter, py_codegen, toy
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('small function call overhead benchmark')
+    arg_parser.add_argument('-calls', type=int, default=100000, help='number of calls per engine')
+    args = arg_parser.parse_args(argv)
+
+    module = toy.load_mlir(toy.build_arg_parser().parse_args(['tests/transpose.toy']))
+    a = np.ones((2, 2))
+    engines = {
+        'interpreter': interpreter.Interpreter(module).compile(interpreter.lookup_function(module, 'multiply_transpose')),
+        'py': py_codegen.CodegenEngine(module).compile(interpreter.lookup_function(module, 'multiply_transpose')),
+    }
+    for name, function in engines.items():
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            function(a, a)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>12}: {elapsed / args.calls * 1e6:.3f} us/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import datetime
+import json
+import math
+import subprocess
+import sys
+
+from frontend_stages import run_stages
+from python_mlir_toy.ch1 import generator
+from python_mlir_toy.ch2 import toy
+
+# each axis grows one dimension of the generated programs, a stage that is linear overall can still be quadratic in
+# the length of a line, a function or a name
+axes = {
+    'functions': (generator.ProgramShape(num_functions=8), 'num_functions'),
+    'statements': (generator.ProgramShape(num_functions=2, statements_per_function=32), 'statements_per_function'),
+    'literal': (generator.ProgramShape(num_functions=2, statements_per_function=4, literal_size=16), 'literal_size'),
+    'names': (generator.ProgramShape(num_functions=4, statements_per_function=4, name_length=256), 'name_length'),
+}
+
+
+def fit_exponent(sizes, seconds) -> float:
+    """Least squares slope of log(seconds) over log(size): 1 for linear, 2 for quadratic."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(second, 1e-9)) for second in seconds]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+
+
+def measure_axis(shape: generator.ProgramShape, field: str, steps: int, factor: float, repeat: int) -> dict:
+    sizes, stage_seconds = [], {}
+    for step in range(steps):
+        value = max(1, round(getattr(shape, field) * factor ** step))
+        source = generator.generate_program(shape._replace(**{field: value}))
+        # the fastest run is the least disturbed one
+        runs = [run_stages(source)['seconds'] for _ in range(repeat)]
+        sizes.append(len(source.encode()))
+        for stage in runs[0]:
+            stage_seconds.setdefault(stage, []).append(min(run[stage] for run in runs))
+    return {
+        'sizes': sizes, 'seconds': stage_seconds,
+        'exponents': {stage: fit_exponent(sizes, seconds) for stage, seconds in stage_seconds.items()},
+    }
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('empirical complexity of each frontend stage along each program dimension')
+    arg_parser.add_argument('-steps', type=int, default=5, help='number of sizes per axis')
+    arg_parser.add_argument('-factor', type=float, default=2.0, help='growth of the scaled dimension between sizes')
+    arg_parser.add_argument('-repeat', type=int, default=3, help='runs per size, the fastest one counts')
+    arg_parser.add_argument('-max-exponent', type=float, default=1.3,
+                            help='fail when a stage grows faster than size ** max-exponent')
+    arg_parser.add_argument('-tolerance', type=float, default=0.15,
+                            help='fail when an exponent exceeds its baseline by more than this')
+    arg_parser.add_argument('-axis', dest='axes', action='append', choices=list(axes), help='axes to measure')
+    arg_parser.add_argument('-history', type=str, default='complexity_history.jsonl',
+                            help='JSON lines file every run is appended to')
+    arg_parser.add_argument('-baseline', type=str, default=None, help='exponents to compare against')
+    arg_parser.add_argument('-save-baseline', type=str, default=None, help='write the exponents of this run here')
+    args = arg_parser.parse_args(argv)
+    toy.register_lazy_modules()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['exponents']
+
+    failures = []
+    exponents = {}
+    results = {}
+    for axis in args.axes or list(axes):
+        shape, field = axes[axis]
+        results[axis] = measure_axis(shape, field, args.steps, args.factor, args.repeat)
+        exponents[axis] = results[axis]['exponents']
+        for stage, exponent in exponents[axis].items():
+            limit = args.max_exponent
+            if stage in baseline.get(axis, {}):
+                limit = min(limit, baseline[axis][stage] + args.tolerance)
+            ok = exponent <= limit
+            if not ok:
+                failures.append(f'{axis}/{stage}')
+            print(f'{axis:>10} {stage:>10}: exponent {exponent:5.2f} (limit {limit:.2f}) {"ok" if ok else "FAILED"}',
+                  flush=True)
+
+    record = {
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(), 'commit': get_commit(),
+        'exponents': exponents, 'results': results,
+    }
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'commit': record['commit'], 'exponents': exponents}, f, indent=2)
+
+    if failures:
+        print(f'worse than linear: {", ".join(failures)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
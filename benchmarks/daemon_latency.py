@@ -0,0 +1,44 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from python_mlir_toy.ch2 import daemon, toy_client
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('per-request latency of the compile daemon against a fresh process')
+    arg_parser.add_argument('-requests', type=int, default=50, help='number of compiles per mode')
+    arg_parser.add_argument('-input', type=str, default='tests/transpose.toy', help='file compiled by every request')
+    args = arg_parser.parse_args(argv)
+    compile_argv = [args.input, '-emit=mlir']
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        subprocess.run([sys.executable, '-c', 'import sys; from python_mlir_toy.ch2 import toy; toy.main(sys.argv[1:])',
+                        *compile_argv], check=True, capture_output=True)
+    process_elapsed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        server = daemon.ToyServer(os.path.join(temp_dir, 'toy.sock'))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                assert toy_client.request(compile_argv, server.socket_path)['status'] == 0
+            daemon_elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    print(f'{"process":>8}: {process_elapsed / args.requests * 1e3:.3f} ms/request')
+    print(f'{"daemon":>8}: {daemon_elapsed / args.requests * 1e3:.3f} ms/request')
+
+
+if __name__ == '__main__':
+    main()
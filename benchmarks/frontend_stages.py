@@ -0,0 +1,82 @@
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+
+from python_mlir_toy.ch1 import generator
+from python_mlir_toy.ch1.lexer import LexerBuffer, ReplayLexer, tokenize
+from python_mlir_toy.ch1.parser import Parser
+from python_mlir_toy.ch2 import toy
+from python_mlir_toy.ch2.mlir_gen import MlirGenImpl
+from python_mlir_toy.common import mlir_op, scoped_text_parser, scoped_text_printer
+
+
+def print_module(module: mlir_op.ModuleOp) -> str:
+    file = io.StringIO()
+    printer = scoped_text_printer.ScopedTextPrinter(file=file)
+    module.print(printer)
+    printer.print_newline()
+    return file.getvalue()
+
+
+def parse_module(text: str) -> mlir_op.ModuleOp:
+    return mlir_op.parse_module(scoped_text_parser.ScopedTextParser(io.StringIO(text), 'bench.mlir'))
+
+
+def run_stages(source: str) -> dict:
+    stages = {}
+
+    def timed(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        stages[name] = time.perf_counter() - start
+        return result
+
+    # each stage gets the previous stage's output, so their times are independent of each other
+    records = timed('lex', lambda: tokenize(LexerBuffer(io.StringIO(source), 'bench.toy')))
+    module_ast = timed('parse', lambda: Parser(ReplayLexer(records, 'bench.toy')).parse_module())
+    module = timed('mlir-gen', lambda: MlirGenImpl().mlir_gen(module_ast))
+    text = timed('print', print_module, module)
+    parsed = timed('mlir-parse', parse_module, text)
+    round_tripped = timed('round-trip', lambda: print_module(parse_module(print_module(parsed))))
+    assert round_tripped == text
+    return {
+        'source_bytes': len(source.encode()), 'mlir_bytes': len(text.encode()), 'num_tokens': len(records),
+        'num_ops': sum(len(func.body) for func in module.body), 'seconds': stages,
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('per stage timings of the frontend on generated toy programs')
+    arg_parser.add_argument('-min-bytes', type=int, default=10_000, help='source size of the smallest program')
+    arg_parser.add_argument('-max-bytes', type=int, default=100_000_000, help='source size of the largest program')
+    arg_parser.add_argument('-factor', type=float, default=10.0, help='growth of the source size between programs')
+    arg_parser.add_argument('-seed', type=int, default=0, help='seed of the program generator')
+    arg_parser.add_argument('-o', dest='output', type=str, default='frontend_stages.json', help='JSON result file')
+    for name, default in generator.ProgramShape()._asdict().items():
+        arg_parser.add_argument(f'-{name.replace("_", "-")}', dest=name, type=int, default=default,
+                                help=f'program shape, default {default}')
+    args = arg_parser.parse_args(argv)
+    toy.register_lazy_modules()
+
+    shape = generator.ProgramShape(**{name: getattr(args, name) for name in generator.ProgramShape._fields})
+    results = []
+    target_bytes = args.min_bytes
+    while target_bytes <= args.max_bytes:
+        source = generator.generate_program_of_size(int(target_bytes), shape, args.seed)
+        result = {'target_bytes': int(target_bytes), **run_stages(source)}
+        results.append(result)
+        stage_text = ' '.join(f'{name} {seconds:.3f}s' for name, seconds in result['seconds'].items())
+        print(f'{result["source_bytes"]:>12} bytes: {stage_text}', flush=True)
+        target_bytes *= args.factor
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': platform.python_version(), 'shape': shape._asdict(), 'seed': args.seed, 'results': results,
+        }, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops, interpreter, fusion
+from python_mlir_toy.common import location, mlir_type, mlir_op, td, block
+
+
+def build_module(size: int, terms: int) -> mlir_op.ModuleOp:
+    # sum of products a0 * b0 + a1 * b1 + ..., every op allocates a full-size temporary unless fused
+    loc = location.UnknownLocation()
+    ty = mlir_type.RankedF64TensorType([size, size])
+    arguments = [td.Value(ty) for _ in range(2 * terms)]
+    body = block.Block()
+    total = None
+    for index in range(terms):
+        product = body.append(ops.MulOp(loc, arguments[2 * index], arguments[2 * index + 1])).output
+        total = product if total is None else body.append(ops.AddOp(loc, total, product)).output
+    body.append(ops.ReturnOp(loc, total))
+    names = [f'%x{index}' for index in range(len(arguments))]
+    func = ops.ToyFuncOp(
+        loc, mlir_type.FunctionType([ty] * len(arguments), [ty]), '@kernel', names, arguments,
+        [loc] * len(arguments), body
+    )
+    return mlir_op.ModuleOp(loc, [func])
+
+
+def measure(module: mlir_op.ModuleOp, inputs, repeat: int):
+    runner = interpreter.Interpreter(module)
+    runner.run('kernel', *inputs)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        runner.run('kernel', *inputs)
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('elementwise fusion benchmark')
+    arg_parser.add_argument('-size', type=int, default=2048, help='edge length of the square input tensors')
+    arg_parser.add_argument('-terms', type=int, default=4, help='number of products summed')
+    arg_parser.add_argument('-repeat', type=int, default=5, help='number of timed runs')
+    args = arg_parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    inputs = [rng.random((args.size, args.size)) for _ in range(2 * args.terms)]
+    for fused in (False, True):
+        module = build_module(args.size, args.terms)
+        if fused:
+            fusion.ElementwiseFusionPass().run_on_function(next(iter(module.body)))
+        elapsed, peak = measure(module, inputs, args.repeat)
+        print(f'{"fused" if fused else "unfused":>8}: {elapsed * 1e3:8.3f} ms/run, peak {peak / 2 ** 20:8.2f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import time
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops, interpreter
+from python_mlir_toy.common import location, mlir_type, mlir_op, td, block
+
+
+def build_module(size: int, depth: int) -> mlir_op.ModuleOp:
+    loc = location.UnknownLocation()
+    ty = mlir_type.RankedF64TensorType([size, size])
+    a, b = td.Value(ty), td.Value(ty)
+    body = block.Block()
+    lhs, rhs = a, b
+    for _ in range(depth):
+        transposed = body.append(ops.TransposeOp(loc, rhs)).output
+        added = body.append(ops.AddOp(loc, lhs, transposed)).output
+        lhs, rhs = body.append(ops.MulOp(loc, added, lhs)).output, added
+    body.append(ops.ReturnOp(loc, lhs))
+    func = ops.ToyFuncOp(
+        loc, mlir_type.FunctionType([ty, ty], [ty]), '@kernel', ['%a', '%b'], [a, b], [loc, loc], body
+    )
+    return mlir_op.ModuleOp(loc, [func])
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('interpreter throughput benchmark')
+    arg_parser.add_argument('-size', type=int, default=1024, help='edge length of the square input tensors')
+    arg_parser.add_argument('-depth', type=int, default=8, help='number of transpose/add/mul groups')
+    arg_parser.add_argument('-repeat', type=int, default=10, help='number of timed runs')
+    args = arg_parser.parse_args(argv)
+
+    module = build_module(args.size, args.depth)
+    runner = interpreter.Interpreter(module)
+    rng = np.random.default_rng(0)
+    a = rng.random((args.size, args.size))
+    b = rng.random((args.size, args.size))
+    runner.run('kernel', a, b)
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        runner.run('kernel', a, b)
+    elapsed = (time.perf_counter() - start) / args.repeat
+
+    # transposes are strided views, only the adds and muls produce new elements
+    num_elements = 2 * args.depth * args.size * args.size
+    print(f'size={args.size} depth={args.depth} ops={3 * args.depth}')
+    print(f'{elapsed * 1e3:.3f} ms/run, {num_elements / elapsed / 1e9:.3f} Gelem/s, '
+          f'{num_elements * 8 / elapsed / 1e9:.3f} GB/s written')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops, interpreter, memory_planner
+from python_mlir_toy.common import location, mlir_type, mlir_op, td, block
+
+
+def build_module(size: int, depth: int) -> mlir_op.ModuleOp:
+    # a long chain where every intermediate dies one op after it is defined
+    loc = location.UnknownLocation()
+    ty = mlir_type.RankedF64TensorType([size, size])
+    a, b = td.Value(ty), td.Value(ty)
+    body = block.Block()
+    value = body.append(ops.AddOp(loc, a, b)).output
+    for index in range(depth):
+        other = a if index % 2 else body.append(ops.TransposeOp(loc, b)).output
+        value = body.append(ops.MulOp(loc, value, other)).output
+        value = body.append(ops.AddOp(loc, value, a)).output
+    body.append(ops.ReturnOp(loc, value))
+    func = ops.ToyFuncOp(
+        loc, mlir_type.FunctionType([ty, ty], [ty]), '@kernel', ['%a', '%b'], [a, b], [loc, loc], body
+    )
+    return mlir_op.ModuleOp(loc, [func])
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('memory planner benchmark')
+    arg_parser.add_argument('-size', type=int, default=2048, help='edge length of the square input tensors')
+    arg_parser.add_argument('-depth', type=int, default=16, help='number of mul/add pairs in the chain')
+    arg_parser.add_argument('-repeat', type=int, default=3, help='number of timed runs')
+    args = arg_parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    a = rng.random((args.size, args.size))
+    b = rng.random((args.size, args.size))
+    module = build_module(args.size, args.depth)
+    for name, function_cls in [('plain', interpreter.CompiledFunction), ('planned', memory_planner.PlannedFunction)]:
+        runner = interpreter.Interpreter(module, function_cls=function_cls)
+        compiled = runner.compile(interpreter.lookup_function(module, 'kernel'))
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            compiled(a, b)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name:>8}: {elapsed * 1e3:8.3f} ms/run, traced peak {peak / 2 ** 20:8.2f} MiB')
+        if function_cls is memory_planner.PlannedFunction:
+            print(f'{"":>8}  planned peak {compiled.plan.planned_peak_bytes / 2 ** 20:.2f} MiB, '
+                  f'without reuse {compiled.plan.unplanned_bytes / 2 ** 20:.2f} MiB')
+
+
+if __name__ == '__main__':
+    main()
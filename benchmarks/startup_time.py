@@ -0,0 +1,66 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# argv of ch2/toy.py, the import time budget in milliseconds (None: only reported) and modules that must stay unloaded
+scenarios = {
+    'help': (['-h'], 15.0, ['python_mlir_toy.ch1', 'python_mlir_toy.ch2.ops', 'python_mlir_toy.common.mlir_op', 'numpy']),
+    'mlir-roundtrip': (['tests/transpose.mlir', '-emit=mlir'], 40.0, ['python_mlir_toy.ch1', 'numpy']),
+    'toy-to-mlir': (['tests/transpose.toy', '-emit=mlir'], None, []),
+}
+
+script = '''
+import sys
+try:
+    from python_mlir_toy.ch2 import toy
+    toy.main(sys.argv[1:])
+except SystemExit:
+    pass
+print(' '.join(sorted(sys.modules)), file=sys.stderr)
+'''
+
+
+def measure(toy_argv):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script, *toy_argv],
+                            capture_output=True, text=True, check=True)
+    lines = result.stderr.splitlines()
+    loaded_modules = set(lines[-1].split())
+    # the imports done by the script are the top-level entries after the interpreter's own site import
+    import_us = 0
+    after_site = False
+    for line in lines[:-1]:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            if after_site:
+                import_us += int(cumulative)
+            after_site = after_site or name.strip() == 'site'
+    return import_us / 1e3, loaded_modules
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser('startup import time of the ch2 driver, measured with python -X importtime')
+    arg_parser.add_argument('-repeat', type=int, default=5, help='number of runs per scenario, the median is reported')
+    args = arg_parser.parse_args(argv)
+
+    failed = False
+    for name, (toy_argv, budget_ms, unloaded_modules) in scenarios.items():
+        samples = [measure(toy_argv) for _ in range(args.repeat)]
+        import_ms = statistics.median(sample[0] for sample in samples)
+        loaded = sorted(
+            module for module in samples[0][1]
+            if any(module == prefix or module.startswith(prefix + '.') for prefix in unloaded_modules)
+        )
+        ok = (budget_ms is None or import_ms <= budget_ms) and not loaded
+        failed = failed or not ok
+        budget = f'budget {budget_ms:.1f} ms' if budget_ms is not None else 'no budget'
+        print(f'{name:>16}: {import_ms:8.3f} ms imports ({budget}) {"ok" if ok else "FAILED"}')
+        if loaded:
+            print(f'{"":>16}  unexpectedly loaded: {", ".join(loaded)}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -106,6 +106,22 @@ class ModuleAST:
         self.functions = functions
 
 
+def count_nodes(node: Union[ModuleAST, FunctionAST, PrototypeAST, ExprAST]) -> int:
+    """Number of AST nodes in the tree of node, node included."""
+    node_types = (ModuleAST, FunctionAST, PrototypeAST, ExprAST)
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for value in vars(node).values():
+            if isinstance(value, node_types):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(item for item in value if isinstance(item, node_types))
+    return count
+
+
 class ASTDumper:
     def __init__(self):
         self.indent = scoped.Indent()
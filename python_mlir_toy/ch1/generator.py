@@ -0,0 +1,111 @@
+import random
+import typing
+
+
+class ProgramShape(typing.NamedTuple):
+    num_functions: int = 8
+    statements_per_function: int = 8
+    expression_depth: int = 3
+    # literals are literal_size x literal_size values below 1, one row per line
+    literal_size: int = 2
+    # number of distinct earlier functions each function calls
+    call_fan_out: int = 2
+    # function and variable names are padded up to this length
+    name_length: int = 0
+
+
+class ProgramGenerator:
+    """Deterministic toy programs of a given shape.
+
+    Every function takes two square tensors and only calls functions defined before it, so the programs are free of
+    recursion, go through mlir-gen, shape inference and the interpreter, and the same shape and seed always produce
+    the same text."""
+
+    def __init__(self, shape: ProgramShape, seed: int = 0):
+        self.shape = shape
+        self.rng = random.Random(seed)
+
+    def get_name(self, name: str) -> str:
+        if len(name) >= self.shape.name_length:
+            return name
+        return name + '_' * (self.shape.name_length - len(name))
+
+    def generate_literal(self, indent: str) -> str:
+        rows = []
+        for _ in range(self.shape.literal_size):
+            values = ', '.join(str(self.rng.randrange(1, 100) / 100) for _ in range(self.shape.literal_size))
+            rows.append(f'[{values}]')
+        return '[' + f',\n{indent}    '.join(rows) + ']'
+
+    def generate_expression(self, depth: int, leaf: typing.Callable[[], str], with_transpose: bool) -> str:
+        if depth == 0:
+            return leaf()
+        kind = self.rng.randrange(3 if with_transpose else 2)
+        if kind == 2:
+            return f'transpose({self.generate_expression(depth - 1, leaf, with_transpose)})'
+        lhs = self.generate_expression(depth - 1, leaf, with_transpose)
+        rhs = self.generate_expression(depth - 1, leaf, with_transpose)
+        return f'({lhs} {"+" if kind == 0 else "*"} {rhs})'
+
+    def generate_function(self, index: int) -> str:
+        # arguments and call results are unranked while literals are ranked, and mlir-gen only combines values of
+        # the same type, so literals get statements of their own; transpose results are unranked as well
+        a, b = self.get_name('a'), self.get_name('b')
+        lines = [f'def {self.get_name(f"f{index}")}({a}, {b}) {{']
+        variables = [a, b]
+        literal_variables = []
+        callees = self.rng.sample(range(index), min(index, self.shape.call_fan_out))
+        calls = [self.get_name(f'f{callee}') for callee in callees]
+
+        def leaf() -> str:
+            if calls and self.rng.random() < 0.5:
+                return f'{calls.pop()}({self.rng.choice(variables)}, {self.rng.choice(variables)})'
+            return self.rng.choice(variables)
+
+        def literal_leaf() -> str:
+            if literal_variables and self.rng.random() < 0.5:
+                return self.rng.choice(literal_variables)
+            return self.generate_literal('  ')
+
+        for statement in range(self.shape.statements_per_function):
+            name = self.get_name(f'v{statement}')
+            if self.rng.random() < 0.25:
+                expression = self.generate_expression(self.shape.expression_depth, literal_leaf, False)
+                literal_variables.append(name)
+            else:
+                expression = self.generate_expression(self.shape.expression_depth, leaf, True)
+                variables.append(name)
+            lines.append(f'  var {name} = {expression};')
+        # calls that found no leaf to replace still happen
+        expression = variables[-1]
+        for callee in calls:
+            expression = f'({expression} + {callee}({self.rng.choice(variables)}, {self.rng.choice(variables)}))'
+        lines.append(f'  return {expression};')
+        lines.append('}')
+        return '\n'.join(lines)
+
+    def generate_main(self) -> str:
+        size = self.shape.literal_size
+        lines = ['def main() {']
+        lines.append(f'  var a<{size}, {size}> = {self.generate_literal("  ")};')
+        lines.append(f'  var b<{size}, {size}> = {self.generate_literal("  ")};')
+        for index in range(max(0, self.shape.num_functions - self.shape.call_fan_out), self.shape.num_functions):
+            lines.append(f'  print({self.get_name(f"f{index}")}(a, b));')
+        lines.append('}')
+        return '\n'.join(lines)
+
+    def generate(self) -> str:
+        functions = [self.generate_function(index) for index in range(self.shape.num_functions)]
+        return '\n\n'.join([*functions, self.generate_main()]) + '\n'
+
+
+def generate_program(shape: ProgramShape = ProgramShape(), seed: int = 0) -> str:
+    return ProgramGenerator(shape, seed).generate()
+
+
+def generate_program_of_size(target_bytes: int, shape: ProgramShape = ProgramShape(), seed: int = 0) -> str:
+    """A program of shape, with as many functions as it takes to reach about target_bytes."""
+    sample_functions = 16
+    sample = generate_program(shape._replace(num_functions=sample_functions), seed)
+    num_functions = max(1, round(target_bytes * sample_functions / len(sample)))
+    return generate_program(shape._replace(num_functions=num_functions), seed)
@@ -1,4 +1,5 @@
 import enum
+import typing
 
 
 class Location:
@@ -46,7 +47,11 @@ class Lexer:
         self.cur_token: Token = Token.EOF
         self.identifier = ''
         self.number_value = 0
+        # counted for -timing, an increment per token is all it costs otherwise
+        self.num_tokens = 0
         self.line_buffer = ''
+        # position of the next char in line_buffer, slicing the consumed char off would copy the line for every char
+        self.line_pos = 0
         self.cur_line_num = 1
         self.cur_column = 0
         self.last_char = ' '
@@ -58,14 +63,15 @@ class Lexer:
         raise NotImplementedError()
 
     def get_next_char(self):
-        if not self.line_buffer:
+        if self.line_pos >= len(self.line_buffer):
             return Token.EOF
 
         self.cur_column += 1
-        next_char = self.line_buffer[0]
-        self.line_buffer = self.line_buffer[1:]
-        if not self.line_buffer:
+        next_char = self.line_buffer[self.line_pos]
+        self.line_pos += 1
+        if self.line_pos >= len(self.line_buffer):
             self.line_buffer = self.read_next_line()
+            self.line_pos = 0
         if next_char == '\n':
             self.cur_line_num += 1
             self.cur_column = 0
@@ -86,10 +92,11 @@ class Lexer:
         self.location.column = self.cur_column
 
         if self.last_char.isalpha():
-            identifier = ''
+            identifier_chars = []
             while self.last_char.isalnum() or self.last_char == '_':
-                identifier += self.last_char
+                identifier_chars.append(self.last_char)
                 self.last_char = self.get_next_char()
+            identifier = ''.join(identifier_chars)
             if identifier == 'return':
                 self.cur_token = Token.Return
             elif identifier == 'var':
@@ -99,15 +106,17 @@ class Lexer:
             else:
                 self.cur_token = Token.Identifier
             self.identifier = identifier
+            self.num_tokens += 1
             return self.cur_token
 
         if self.last_char.isdigit() or self.last_char == '.':
-            number_str = ''
+            number_chars = []
             while self.last_char.isdigit() or self.last_char == '.':
-                number_str += self.last_char
+                number_chars.append(self.last_char)
                 self.last_char = self.get_next_char()
-            self.number_value = float(number_str)
+            self.number_value = float(''.join(number_chars))
             self.cur_token = Token.Number
+            self.num_tokens += 1
             return self.cur_token
 
         if self.last_char == '#':
@@ -119,6 +128,7 @@ class Lexer:
         token = Token(self.last_char)
         self.last_char = self.get_next_char()
         self.cur_token = token
+        self.num_tokens += 1
         return self.cur_token
 
     def consume(self, token: Token):
@@ -143,3 +153,43 @@ class LexerBuffer(Lexer):
             self.current_line_index += 1
 
         return ret
+
+
+class TokenRecord(typing.NamedTuple):
+    token: Token
+    identifier: str
+    number_value: float
+    line: int
+    column: int
+
+
+def tokenize(lexer: Lexer) -> typing.List[TokenRecord]:
+    """Every remaining token of lexer, including the current one and the final EOF."""
+    records = []
+    while True:
+        records.append(TokenRecord(
+            lexer.get_cur_token(), lexer.identifier, lexer.number_value, lexer.location.line, lexer.location.column
+        ))
+        if lexer.get_cur_token() is Token.EOF:
+            return records
+        lexer.get_next_token()
+
+
+class ReplayLexer(Lexer):
+    """Replays recorded tokens, so the parser can be run without paying for lexing."""
+
+    def __init__(self, records: typing.List[TokenRecord], filename: str):
+        super().__init__(filename)
+        self.records = records
+        self.record_index = 0
+        self.get_next_token()
+
+    def get_next_token(self):
+        record = self.records[min(self.record_index, len(self.records) - 1)]
+        self.record_index += 1
+        self.cur_token = record.token
+        self.identifier = record.identifier
+        self.number_value = record.number_value
+        self.location.line = record.line
+        self.location.column = record.column
+        return self.cur_token
@@ -1,9 +1,12 @@
 import argparse
 import enum
+import sys
+import typing
 
 from python_mlir_toy.ch1 import ast
 from python_mlir_toy.ch1.parser import Parser
-from python_mlir_toy.ch1.lexer import LexerBuffer
+from python_mlir_toy.ch1.lexer import LexerBuffer, ReplayLexer, tokenize
+from python_mlir_toy.common import timing
 
 
 class Action(enum.Enum):
@@ -15,22 +18,54 @@ def build_arg_parser():
     arg_parser.add_argument('input_file', nargs='?', type=argparse.FileType('r'), default='-', help='input toy file')
     arg_parser.add_argument('-emit', dest='emit_action', nargs=1, type=str, choices=[i.value for i in Action],
                             help=f'Select the kind of output desired: {Action.Ast}(output the AST dump)')
+    arg_parser.add_argument('-timing', dest='timing', action='store_true',
+                            help='Report the wall and CPU time of each compiler phase and throughput counters to stderr')
+    arg_parser.add_argument('-timing-format', dest='timing_format', type=str, default='table',
+                            choices=['table', 'json'], help='Format of the -timing and -mem-profile reports')
+    arg_parser.add_argument('-mem-profile', dest='mem_profile', action='store_true',
+                            help='Trace the allocations of each compiler phase and report their peak and retained '
+                                 'bytes, top allocation sites and live compiler objects to stderr, along with -timing')
+    arg_parser.add_argument('-mem-profile-top', dest='mem_profile_top', type=int, default=5,
+                            help='Number of allocation sites reported per phase by -mem-profile')
     return arg_parser
 
 
+def parse_toy(input_file: typing.TextIO, timer=timing.null_timer) -> ast.ModuleAST:
+    lexer = LexerBuffer(input_file, input_file.name)
+    if timer.enabled:
+        # the parser pulls tokens one at a time, so they are recorded first to time lexing and parsing apart
+        with timer.scope('lex') as lex_node:
+            records = tokenize(lexer)
+        timer.add_counter('tokens', lexer.num_tokens, lex_node)
+        lexer = ReplayLexer(records, input_file.name)
+    with timer.scope('parse') as parse_node:
+        module_ast = Parser(lexer).parse_module()
+    if timer.enabled:
+        timer.add_counter('ast nodes', ast.count_nodes(module_ast), parse_node)
+    return module_ast
+
+
 def main(argv=None):
     arg_parser = build_arg_parser()
     args = arg_parser.parse_args(argv)
 
-    lexer = LexerBuffer(args.input_file, args.input_file.name)
-    parser = Parser(lexer)
-    module_ast = parser.parse_module()
-
-    arg_action = Action(args.emit_action[0])
-    if arg_action == Action.Ast:
-        ast.dump(module_ast)
+    if args.mem_profile:
+        from python_mlir_toy.common import mem_profile
+        timer = mem_profile.MemoryProfiler(args.mem_profile_top)
     else:
-        raise 'No action specified (parsing only?), use -emit=<action>'
+        timer = timing.Timer() if args.timing else timing.null_timer
+    try:
+        module_ast = parse_toy(timer.read_input(args.input_file), timer)
+
+        arg_action = Action(args.emit_action[0])
+        if arg_action == Action.Ast:
+            timer.write_output(lambda: ast.dump(module_ast))
+        else:
+            raise 'No action specified (parsing only?), use -emit=<action>'
+    finally:
+        # a failed compile must not leave tracemalloc on for the rest of the process
+        timer.stop()
+    timer.report(sys.stderr, args.timing_format)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import importlib
+import io
+import os
+import sys
+import time
+import typing
+
+from python_mlir_toy.ch2 import toy
+
+# imported once per worker instead of once per file; the driver itself imports them lazily
+worker_module_names = (
+    'python_mlir_toy.ch1.parser', 'python_mlir_toy.ch2.mlir_gen', 'python_mlir_toy.ch2.ops',
+    'python_mlir_toy.ch2.shape_inference', 'python_mlir_toy.ch2.fusion', 'python_mlir_toy.ch2.py_codegen',
+    'python_mlir_toy.ch2.interpreter', 'python_mlir_toy.common.canonicalize', 'python_mlir_toy.common.constant_fold',
+    'python_mlir_toy.common.strip_debuginfo', 'python_mlir_toy.common.inliner', 'python_mlir_toy.common.cse',
+    'python_mlir_toy.common.dce',
+)
+
+output_suffix_dict = {
+    toy.Action.Ast: '.ast', toy.Action.Mlir: '.mlir', toy.Action.Run: '.out', toy.Action.Py: '.py',
+}
+
+
+class FileResult(typing.NamedTuple):
+    input_path: str
+    output_path: str
+    error: typing.Optional[str]
+    diagnostics: str
+    seconds: float
+
+
+def build_arg_parser():
+    # single dash options are still matched by prefix without abbreviations, so no compiler option may be a prefix of
+    # a batch option: -jobs would swallow the compiler's -j
+    arg_parser = argparse.ArgumentParser(
+        'toy batch compiler', epilog='Any other argument, e.g. -emit or -pass-pipeline, is passed on to the compiler.',
+        allow_abbrev=False
+    )
+    arg_parser.add_argument('inputs', nargs='+', help='input files or glob patterns')
+    arg_parser.add_argument('-o', dest='output_dir', type=str, required=True, help='output directory')
+    arg_parser.add_argument('-processes', dest='num_processes', type=int, default=os.cpu_count(),
+                            help='Number of worker processes compiling files')
+    return arg_parser
+
+
+def expand_inputs(patterns: typing.List[str]) -> typing.List[str]:
+    input_paths = []
+    for pattern in patterns:
+        # a pattern matching nothing stays as is, so it is reported as a failed file
+        input_paths.extend(sorted(glob.glob(pattern, recursive=True)) or [pattern])
+    return list(dict.fromkeys(input_paths))
+
+
+def get_output_path(input_path: str, base_dir: str, output_dir: str, action: toy.Action) -> str:
+    relative_path = os.path.relpath(input_path, base_dir)
+    return os.path.join(output_dir, os.path.splitext(relative_path)[0] + output_suffix_dict[action])
+
+
+def _init_worker():
+    for module_name in worker_module_names:
+        importlib.import_module(module_name)
+
+
+def compile_file(input_path: str, output_path: str, compiler_args: typing.List[str]) -> FileResult:
+    start = time.perf_counter()
+    output = io.StringIO()
+    diagnostics = io.StringIO()
+    error = None
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(diagnostics):
+            toy.main([input_path, *compiler_args])
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with open(output_path, 'w') as f:
+            f.write(output.getvalue())
+    except SystemExit as e:
+        # argparse prints the usage and then its error as the last line
+        lines = diagnostics.getvalue().strip().splitlines()
+        error = lines[-1] if lines else f'exit {e.code}'
+        diagnostics = io.StringIO()
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+    return FileResult(input_path, output_path, error, diagnostics.getvalue(), time.perf_counter() - start)
+
+
+def main(argv=None) -> int:
+    arg_parser = build_arg_parser()
+    args, compiler_args = arg_parser.parse_known_args(argv)
+    compiler_args_parsed, _ = toy.build_arg_parser().parse_known_args(compiler_args)
+    action = toy.Action(compiler_args_parsed.emit_action[0]) if compiler_args_parsed.emit_action else None
+    if action is None:
+        arg_parser.error('use -emit=<action> to select the output of every file')
+
+    input_paths = expand_inputs(args.inputs)
+    base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in input_paths])
+    output_paths = {}
+    for path in input_paths:
+        output_path = get_output_path(os.path.abspath(path), base_dir, args.output_dir, action)
+        # e.g. x.toy and x.mlir, the workers would overwrite each other's output
+        if output_path in output_paths:
+            arg_parser.error(f'{output_paths[output_path]} and {path} would both be written to {output_path}')
+        output_paths[output_path] = path
+    num_failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max(1, args.num_processes), initializer=_init_worker) as executor:
+        futures = [
+            executor.submit(compile_file, path, output_path, compiler_args) for output_path, path in output_paths.items()
+        ]
+        # results are reported in completion order, one failing file never stops the others
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            sys.stderr.write(result.diagnostics)
+            if result.error is None:
+                print(f'ok {result.input_path} -> {result.output_path} ({result.seconds:.4f} seconds)', flush=True)
+            else:
+                num_failed += 1
+                print(f'error {result.input_path}: {result.error}', file=sys.stderr, flush=True)
+    print(f'{len(input_paths) - num_failed} compiled, {num_failed} failed', flush=True)
+    return 1 if num_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
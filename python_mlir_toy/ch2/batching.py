@@ -0,0 +1,112 @@
+import typing
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops, interpreter
+from python_mlir_toy.common import mlir_op, td
+
+# a batched value carries one extra leading dimension; unbatched values (constants and everything computed only from
+# them) are shared by the whole batch and broadcast against batched ones
+BatchedKernelBuilder = typing.Callable[[mlir_op.Op, 'BatchedInterpreter', typing.List[bool]], interpreter.Kernel]
+
+batched_kernel_builder_dict: typing.Dict[str, BatchedKernelBuilder] = {}
+
+
+def register_batched_kernel(op_name: str):
+    def decorator(builder: BatchedKernelBuilder) -> BatchedKernelBuilder:
+        assert op_name not in batched_kernel_builder_dict
+        batched_kernel_builder_dict[op_name] = builder
+        return builder
+
+    return decorator
+
+
+@register_batched_kernel('toy.reshape')
+def build_batched_reshape_kernel(
+        op: ops.ReshapeOp, batched_interpreter: 'BatchedInterpreter', batched: typing.List[bool]
+) -> interpreter.Kernel:
+    shape = tuple(op.output.ty.shape)
+    if not batched[0]:
+        return lambda operand: np.reshape(operand, shape)
+    return lambda operand: np.reshape(operand, (operand.shape[0], *shape))
+
+
+@register_batched_kernel('toy.print')
+def build_batched_print_kernel(
+        op: ops.PrintOp, batched_interpreter: 'BatchedInterpreter', batched: typing.List[bool]
+) -> interpreter.Kernel:
+    if not batched[0]:
+        return lambda operand: interpreter.print_tensor(operand, batched_interpreter.file)
+
+    def print_batch(operand: np.ndarray):
+        for item in operand:
+            interpreter.print_tensor(item, batched_interpreter.file)
+
+    return print_batch
+
+
+@register_batched_kernel('toy.generic_call')
+def build_batched_call_kernel(
+        op: ops.ToyGenericCallOp, batched_interpreter: 'BatchedInterpreter', batched: typing.List[bool]
+) -> interpreter.Kernel:
+    return batched_interpreter.compile(op.callee, tuple(batched))
+
+
+class BatchedFunction(interpreter.CompiledFunction):
+    def __init__(
+            self, func: mlir_op.FuncOp, batched_interpreter: 'BatchedInterpreter', batched_arguments: typing.Tuple[bool]
+    ):
+        # the batch dimension is only tracked statically, the register file and the run loop are the unbatched ones
+        self.batched_values: typing.Set[td.Value] = {
+            value for value, batched in zip(func.argument_values, batched_arguments) if batched
+        }
+        self.batched_interpreter = batched_interpreter
+        super().__init__(func, batched_interpreter)
+        self.returns_batched = any(value in self.batched_values for value in func.body.last.get_inputs())
+
+    def build_kernel(self, op: mlir_op.Op) -> interpreter.Kernel:
+        batched = [value in self.batched_values for value in op.get_inputs()]
+        builder = batched_kernel_builder_dict.get(op.op_name)
+        if builder is not None:
+            kernel = builder(op, self.batched_interpreter, batched)
+        else:
+            # elementwise ufuncs broadcast against the batch dimension and transpose only swaps the trailing two dims,
+            # so the unbatched kernels already are batch-aware
+            kernel = super().build_kernel(op)
+        if isinstance(op, mlir_op.GenericCallOp):
+            is_batched = kernel.returns_batched
+        else:
+            is_batched = any(batched)
+        if is_batched:
+            self.batched_values.update(op.get_outputs())
+        return kernel
+
+
+class BatchedInterpreter(interpreter.Interpreter):
+    """Runs a function once over a whole batch of inputs stacked along a new leading dimension."""
+
+    def compile(
+            self, func: mlir_op.FuncOp, batched_arguments: typing.Tuple[bool, ...] = None
+    ) -> BatchedFunction:
+        batched_arguments = (True,) * len(func.argument_values) if batched_arguments is None else batched_arguments
+        key = (func, batched_arguments)
+        compiled = self.compiled_functions.get(key)
+        if compiled is None:
+            compiled = BatchedFunction(func, self, batched_arguments)
+            self.compiled_functions[key] = compiled
+        return compiled
+
+    def call_batched(
+            self, function_name: str, *arguments: np.ndarray, batched_arguments: typing.Sequence[bool] = None
+    ) -> typing.Optional[np.ndarray]:
+        func = interpreter.lookup_function(self.module, function_name)
+        arguments = [np.asarray(argument, dtype=np.float64) for argument in arguments]
+        batched_arguments = (True,) * len(arguments) if batched_arguments is None else tuple(batched_arguments)
+        batch_sizes = {argument.shape[0] for argument, batched in zip(arguments, batched_arguments) if batched}
+        if len(batch_sizes) > 1:
+            raise interpreter.InterpreterError(f'batched arguments disagree on the batch size: {sorted(batch_sizes)}')
+        compiled = self.compile(func, batched_arguments)
+        result = compiled(*arguments)
+        if result is None or compiled.returns_batched or not batch_sizes:
+            return result
+        return np.broadcast_to(result, (batch_sizes.pop(), *np.shape(result)))
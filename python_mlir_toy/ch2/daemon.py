@@ -0,0 +1,102 @@
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import socketserver
+import stat
+import sys
+import threading
+import traceback
+import typing
+
+from python_mlir_toy.ch2 import toy, toy_client, batch
+
+
+class ToyRequestHandler(socketserver.StreamRequestHandler):
+    server: 'ToyServer'
+
+    def handle(self):
+        # one connection may carry several requests, each answered before the next one is read
+        while True:
+            message = toy_client.receive_message(self.connection)
+            if message is None:
+                return
+            toy_client.send_message(self.connection, self.server.compile(message))
+
+
+class ToyServer(socketserver.ThreadingUnixStreamServer):
+    """Runs ch2/toy.py requests in a process that keeps the compiler imported and its caches warm.
+
+    The driver prints to sys.stdout and resolves paths against the working directory, both process wide, so
+    requests are read concurrently but compiled one at a time."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        for module_name in batch.worker_module_names:
+            importlib.import_module(module_name)
+        socket_dir = os.path.dirname(os.path.abspath(socket_path))
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        toy_client.check_socket_dir(socket_dir)
+        # only a socket left behind by a daemon that did not shut down is replaced
+        if os.path.lexists(socket_path) and stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            os.unlink(socket_path)
+        super().__init__(socket_path, ToyRequestHandler)
+        self.socket_path = socket_path
+        self.compile_lock = threading.Lock()
+        self.num_requests = 0
+
+    def server_bind(self):
+        super().server_bind()
+        os.chmod(self.server_address, 0o600)
+
+    def compile(self, message: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = 0
+        with self.compile_lock:
+            self.num_requests += 1
+            cwd = os.getcwd()
+            stdin = sys.stdin
+            try:
+                os.chdir(message['cwd'])
+                sys.stdin = io.StringIO(message.get('stdin') or '')
+                sys.stdin.name = '<stdin>'
+                with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                    toy.main(message['argv'])
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                stderr.write(traceback.format_exc())
+                status = 1
+            finally:
+                sys.stdin = stdin
+                os.chdir(cwd)
+        return {'status': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser('toy compiler daemon')
+    arg_parser.add_argument('-socket', dest='socket_path', type=str, default=toy_client.get_socket_path(),
+                            help='Unix domain socket to listen on, clients use $TOY_DAEMON_SOCKET')
+    return arg_parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    with ToyServer(args.socket_path) as server:
+        print(f'toy daemon listening on {args.socket_path}', file=sys.stderr, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import functools
+import typing
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops
+from python_mlir_toy.common import pass_manager, mlir_op, td
+
+# an expression is either the index of a fused op input or (op kind, lhs, rhs)
+Expression = typing.Union[int, typing.Tuple[str, 'Expression', 'Expression']]
+
+ufunc_dict = {'add': np.add, 'mul': np.multiply}
+op_kind_dict = {ops.AddOp: 'add', ops.MulOp: 'mul'}
+
+# rows are evaluated in blocks of about this many elements, so the scratch buffers stay in cache
+chunk_elements = 1 << 15
+
+
+def format_expression(expression: Expression) -> str:
+    if isinstance(expression, int):
+        return f'${expression}'
+    kind, lhs, rhs = expression
+    return f'{kind}({format_expression(lhs)},{format_expression(rhs)})'
+
+
+def parse_expression(text: str) -> Expression:
+    def parse(pos: int) -> typing.Tuple[Expression, int]:
+        if text[pos] == '$':
+            end = pos + 1
+            while end < len(text) and text[end].isdigit():
+                end += 1
+            return int(text[pos + 1:end]), end
+        open_pos = text.index('(', pos)
+        kind = text[pos:open_pos]
+        assert kind in ufunc_dict, f'unknown elementwise op in fused expression: {kind}'
+        lhs, pos = parse(open_pos + 1)
+        assert text[pos] == ','
+        rhs, pos = parse(pos + 1)
+        assert text[pos] == ')'
+        return (kind, lhs, rhs), pos + 1
+
+    expression, end = parse(0)
+    assert end == len(text), f'trailing characters in fused expression: {text[end:]}'
+    return expression
+
+
+class FusedKernel:
+    """Evaluates a fused expression into a single output buffer with `out=`, block by block.
+
+    Each block writes its first intermediate into `out` before it has read all of its inputs, so an `out` that shares
+    memory with an input is only written once the whole result has been computed in a buffer of its own."""
+
+    def __init__(self, expression: Expression):
+        self.num_inputs = 0
+        self.num_buffers = 1
+        # registers are the input blocks, then the output block, then the scratch blocks
+        self.steps: typing.List[typing.Tuple[np.ufunc, int, int, int]] = []
+        self.compile(expression, 0, 0)
+        self.steps = [
+            (ufunc, self.to_register(lhs), self.to_register(rhs), self.to_register(dst))
+            for ufunc, lhs, rhs, dst in self.steps
+        ]
+
+    def compile(self, expression: Expression, buffer: int, depth: int) -> typing.Tuple[str, int]:
+        if isinstance(expression, int):
+            self.num_inputs = max(self.num_inputs, expression + 1)
+            return 'input', expression
+        kind, lhs, rhs = expression
+        # the lhs reuses the destination buffer, only the rhs of a nested node needs a scratch buffer; the buffers
+        # below depth stay untouched while a subtree is evaluated
+        lhs_source = self.compile(lhs, buffer, depth)
+        scratch = depth + 1
+        rhs_source = self.compile(rhs, scratch, depth + 1)
+        if rhs_source[0] == 'buffer':
+            self.num_buffers = max(self.num_buffers, scratch + 1)
+        self.steps.append((ufunc_dict[kind], lhs_source, rhs_source, ('buffer', buffer)))
+        return 'buffer', buffer
+
+    def to_register(self, source: typing.Tuple[str, int]) -> int:
+        kind, index = source
+        return index if kind == 'input' else self.num_inputs + index
+
+    def __call__(self, *inputs: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        assert len(inputs) == self.num_inputs
+        shape = np.broadcast_shapes(*(np.shape(value) for value in inputs))
+        inputs = [value if np.shape(value) == shape else np.broadcast_to(value, shape) for value in inputs]
+        if out is None:
+            out = np.empty(shape, dtype=np.float64)
+        elif any(np.shares_memory(out, value) for value in inputs):
+            out[...] = self(*inputs)
+            return out
+        if len(shape) == 0:
+            self.run_block(inputs, [out] + [np.empty((), dtype=np.float64) for _ in range(self.num_buffers - 1)])
+            return out
+
+        row_elements = max(1, out.size // shape[0]) if shape[0] else 1
+        rows_per_block = max(1, chunk_elements // row_elements)
+        scratch = [np.empty((min(rows_per_block, shape[0]), *shape[1:])) for _ in range(self.num_buffers - 1)]
+        for begin in range(0, shape[0], rows_per_block):
+            end = min(begin + rows_per_block, shape[0])
+            self.run_block(
+                [value[begin:end] for value in inputs],
+                [out[begin:end]] + [buffer[:end - begin] for buffer in scratch]
+            )
+        return out
+
+    def run_block(self, inputs: typing.List[np.ndarray], buffers: typing.List[np.ndarray]):
+        registers = inputs + buffers
+        for ufunc, lhs, rhs, dst in self.steps:
+            ufunc(registers[lhs], registers[rhs], out=registers[dst])
+
+
+@functools.lru_cache(maxsize=None)
+def get_fused_kernel(expression: str) -> FusedKernel:
+    return FusedKernel(parse_expression(expression))
+
+
+class ElementwiseFusionPass(pass_manager.FunctionPass):
+    argument = 'toy-fuse-elementwise'
+    description = 'Fuse chains of single-use toy.add/toy.mul ops of the same type into toy.fused_elementwise'
+
+    num_fused = pass_manager.Statistic('num-fused', 'Number of fused ops created')
+    num_ops_fused = pass_manager.Statistic('num-ops-fused', 'Number of elementwise ops absorbed into fused ops')
+
+    @staticmethod
+    def is_fusible(op: mlir_op.Op) -> bool:
+        return type(op) in op_kind_dict or isinstance(op, ops.FusedElementwiseOp)
+
+    def can_absorb(self, producer: typing.Optional[mlir_op.Op], root: mlir_op.Op) -> bool:
+        return (
+                producer is not None and self.is_fusible(producer) and producer.parent_block is root.parent_block
+                and producer.output.has_one_use() and producer.output.ty == root.output.ty
+        )
+
+    def run_on_function(self, func: mlir_op.FuncOp):
+        # walk bottom-up, so every root takes in the longest chain feeding it before its producers are visited
+        root = func.body.last
+        while root is not None:
+            if self.is_fusible(root):
+                fused = self.fuse(func, root)
+                if fused is not None:
+                    root = fused
+            root = root.prev_op
+
+    def fuse(self, func: mlir_op.FuncOp, root: mlir_op.Op) -> typing.Optional[ops.FusedElementwiseOp]:
+        inputs: typing.List[td.Value] = []
+        absorbed: typing.List[mlir_op.Op] = []
+        expression = self.build_expression(root, root, inputs, absorbed)
+        if len(absorbed) < 2:
+            return None
+        fused = ops.FusedElementwiseOp(root.loc, format_expression(expression), inputs, [root.output.ty])
+        func.body.insert_before(root, fused)
+        root.replace_all_uses_with(fused.get_outputs())
+        for op in absorbed:
+            op.drop_all_references()
+        for op in absorbed:
+            op.erase()
+        self.num_fused += 1
+        self.num_ops_fused += len(absorbed)
+        return fused
+
+    def build_expression(
+            self, op: mlir_op.Op, root: mlir_op.Op, inputs: typing.List[td.Value], absorbed: typing.List[mlir_op.Op]
+    ) -> Expression:
+        absorbed.append(op)
+        operand_expressions = []
+        for value in op.get_inputs():
+            if self.can_absorb(value.owner, root):
+                operand_expressions.append(self.build_expression(value.owner, root, inputs, absorbed))
+            else:
+                # an input used twice, as in a * a, is passed once
+                index = next((index for index, item in enumerate(inputs) if item is value), None)
+                if index is None:
+                    index = len(inputs)
+                    inputs.append(value)
+                operand_expressions.append(index)
+        if isinstance(op, ops.FusedElementwiseOp):
+            return substitute_inputs(op.get_expression(), operand_expressions)
+        lhs, rhs = operand_expressions
+        return op_kind_dict[type(op)], lhs, rhs
+
+
+def substitute_inputs(expression: Expression, inputs: typing.List[Expression]) -> Expression:
+    if isinstance(expression, int):
+        return inputs[expression]
+    kind, lhs, rhs = expression
+    return kind, substitute_inputs(lhs, inputs), substitute_inputs(rhs, inputs)
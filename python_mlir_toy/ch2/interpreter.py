@@ -0,0 +1,164 @@
+import sys
+import typing
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops, fusion, memoization
+from python_mlir_toy.common import mlir_op, td, purity
+
+Kernel = typing.Callable[..., typing.Optional[np.ndarray]]
+KernelBuilder = typing.Callable[[mlir_op.Op, 'Interpreter'], Kernel]
+
+
+class InterpreterError(Exception):
+    pass
+
+
+kernel_builder_dict: typing.Dict[str, KernelBuilder] = {}
+
+
+def register_kernel(op_name: str):
+    def decorator(builder: KernelBuilder) -> KernelBuilder:
+        assert op_name not in kernel_builder_dict
+        kernel_builder_dict[op_name] = builder
+        return builder
+
+    return decorator
+
+
+def print_tensor(array: np.ndarray, file: typing.TextIO):
+    array = np.asarray(array)
+    rows = array.reshape(1, -1) if array.ndim < 2 else array.reshape(-1, array.shape[-1])
+    np.savetxt(file, rows, fmt='%f', delimiter=' ')
+
+
+@register_kernel('toy.constant')
+def build_constant_kernel(op: ops.ConstantOp, interpreter: 'Interpreter') -> Kernel:
+    array = op.get_constant_value()
+    return lambda: array
+
+
+@register_kernel('toy.add')
+def build_add_kernel(op: ops.AddOp, interpreter: 'Interpreter') -> Kernel:
+    return np.add
+
+
+@register_kernel('toy.mul')
+def build_mul_kernel(op: ops.MulOp, interpreter: 'Interpreter') -> Kernel:
+    return np.multiply
+
+
+@register_kernel('toy.transpose')
+def build_transpose_kernel(op: ops.TransposeOp, interpreter: 'Interpreter') -> Kernel:
+    # a strided view, the operand is never written to
+    return lambda operand: np.swapaxes(operand, -1, -2)
+
+
+@register_kernel('toy.reshape')
+def build_reshape_kernel(op: ops.ReshapeOp, interpreter: 'Interpreter') -> Kernel:
+    shape = tuple(op.output.ty.shape)
+    return lambda operand: np.reshape(operand, shape)
+
+
+@register_kernel('toy.fused_elementwise')
+def build_fused_elementwise_kernel(op: ops.FusedElementwiseOp, interpreter: 'Interpreter') -> Kernel:
+    return fusion.get_fused_kernel(op.expression)
+
+
+@register_kernel('toy.print')
+def build_print_kernel(op: ops.PrintOp, interpreter: 'Interpreter') -> Kernel:
+    return lambda operand: print_tensor(operand, interpreter.file)
+
+
+@register_kernel('toy.generic_call')
+def build_call_kernel(op: ops.ToyGenericCallOp, interpreter: 'Interpreter') -> Kernel:
+    callee = op.callee
+    if interpreter.memo_cache is not None and interpreter.get_purity().is_pure(callee):
+        memo_cache = interpreter.memo_cache
+        return lambda *arguments: memo_cache.call(interpreter.compile(callee), callee, *arguments)
+    return lambda *arguments: interpreter.call(callee, *arguments)
+
+
+def lookup_function(module: mlir_op.ModuleOp, function_name: str) -> mlir_op.FuncOp:
+    for op in module.body:
+        if isinstance(op, mlir_op.FuncOp) and op.function_name.lstrip('@') == function_name.lstrip('@'):
+            return op
+    raise InterpreterError(f'no function named {function_name}')
+
+
+class CompiledFunction:
+    def __init__(self, func: mlir_op.FuncOp, interpreter: 'Interpreter'):
+        # every value of the function gets a slot in a flat register file, arguments come first
+        slot_dict: typing.Dict[td.Value, int] = {value: index for index, value in enumerate(func.argument_values)}
+        self.interpreter = interpreter
+        self.num_arguments = len(func.argument_values)
+        self.ops: typing.List[mlir_op.Op] = []
+        self.instructions: typing.List[typing.Tuple[Kernel, typing.Tuple[int, ...], typing.Optional[int]]] = []
+        self.return_slots: typing.Tuple[int, ...] = ()
+        for op in func.body:
+            operand_slots = tuple(slot_dict[value] for value in op.get_inputs())
+            if isinstance(op, td.IsTerminator):
+                self.return_slots = operand_slots
+                break
+            outputs = op.get_outputs()
+            if len(outputs) > 1:
+                raise InterpreterError(f'{op.op_name} has more than one result {op.loc}')
+            result_slot = None
+            if outputs:
+                result_slot = len(slot_dict)
+                slot_dict[outputs[0]] = result_slot
+            self.ops.append(op)
+            self.instructions.append((self.build_kernel(op), operand_slots, result_slot))
+        self.slot_dict = slot_dict
+        self.num_slots = len(slot_dict)
+
+    def build_kernel(self, op: mlir_op.Op) -> Kernel:
+        builder = kernel_builder_dict.get(op.op_name)
+        if builder is None:
+            raise InterpreterError(f'no kernel for {op.op_name} {op.loc}')
+        return builder(op, self.interpreter)
+
+    def __call__(self, *arguments: np.ndarray) -> typing.Optional[np.ndarray]:
+        assert len(arguments) == self.num_arguments
+        registers: typing.List[typing.Optional[np.ndarray]] = [None] * self.num_slots
+        registers[:self.num_arguments] = arguments
+        for kernel, operand_slots, result_slot in self.instructions:
+            result = kernel(*[registers[slot] for slot in operand_slots])
+            if result_slot is not None:
+                registers[result_slot] = result
+        if not self.return_slots:
+            return None
+        return registers[self.return_slots[0]]
+
+
+class Interpreter:
+    def __init__(
+            self, module: mlir_op.ModuleOp, file: typing.TextIO = None,
+            function_cls: typing.Type[CompiledFunction] = CompiledFunction,
+            memo_cache: memoization.MemoCache = None
+    ):
+        self.module = module
+        self.file = file if file is not None else sys.stdout
+        self.function_cls = function_cls
+        self.memo_cache = memo_cache
+        self.purity: typing.Optional[purity.PurityAnalysis] = None
+        self.compiled_functions: typing.Dict[mlir_op.FuncOp, CompiledFunction] = {}
+
+    def get_purity(self) -> purity.PurityAnalysis:
+        if self.purity is None:
+            self.purity = purity.PurityAnalysis(self.module)
+        return self.purity
+
+    def compile(self, func: mlir_op.FuncOp) -> CompiledFunction:
+        compiled = self.compiled_functions.get(func)
+        if compiled is None:
+            compiled = self.function_cls(func, self)
+            self.compiled_functions[func] = compiled
+        return compiled
+
+    def call(self, func: mlir_op.FuncOp, *arguments: np.ndarray) -> typing.Optional[np.ndarray]:
+        return self.compile(func)(*arguments)
+
+    def run(self, function_name: str = 'main', *arguments: np.ndarray) -> typing.Optional[np.ndarray]:
+        arguments = [np.asarray(argument, dtype=np.float64) for argument in arguments]
+        return self.call(lookup_function(self.module, function_name), *arguments)
@@ -0,0 +1,61 @@
+import collections
+import hashlib
+import sys
+import typing
+
+import numpy as np
+
+
+def get_fingerprint(array: np.ndarray, pinned: typing.List[np.ndarray]) -> typing.Hashable:
+    # a read-only array that owns its data (a constant payload or a memoized result) never changes, so its identity
+    # is enough; it is pinned by the entry so the id cannot be reused by another array
+    if not array.flags.writeable and array.base is None:
+        pinned.append(array)
+        return 'id', id(array)
+    digest = hashlib.blake2b(np.ascontiguousarray(array).tobytes(), digest_size=16).digest()
+    return array.shape, array.dtype.str, digest
+
+
+class MemoCache:
+    """Results of pure calls, keyed by callee and input fingerprints, evicted LRU first beyond max_bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: typing.OrderedDict[typing.Hashable, typing.Tuple[np.ndarray, list]] = collections.OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def call(self, function: typing.Callable[..., np.ndarray], key_prefix: typing.Hashable, *arguments: np.ndarray):
+        pinned = []
+        key = (key_prefix, *(get_fingerprint(argument, pinned) for argument in arguments))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        result = function(*arguments)
+        if result is None:
+            return result
+        # the result is handed out to every later caller, so nobody may write into it; the cache only freezes arrays
+        # it owns, a result aliasing an argument (e.g. an identity callee) or a writable view is copied first
+        if any(np.shares_memory(result, argument) for argument in arguments) or (
+                result.flags.writeable and result.base is not None
+        ):
+            result = result.copy()
+        result.flags.writeable = False
+        if result.nbytes <= self.max_bytes:
+            self.entries[key] = (result, pinned)
+            self.num_bytes += result.nbytes
+            while self.num_bytes > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.num_bytes -= evicted.nbytes
+                self.evictions += 1
+        return result
+
+    def report(self, file: typing.TextIO = sys.stderr):
+        print(f'memo cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions, '
+              f'{len(self.entries)} entries, {self.num_bytes} bytes', file=file)
@@ -0,0 +1,145 @@
+import math
+import sys
+import typing
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops, interpreter
+from python_mlir_toy.common import mlir_op, mlir_type, td, liveness
+
+BufferKey = typing.Tuple[typing.Tuple[int, ...], str]
+
+
+def get_buffer_key(ty: mlir_type.Type) -> typing.Optional[BufferKey]:
+    if not isinstance(ty, mlir_type.RankedTensorType) or any(dim < 0 for dim in ty.shape):
+        return None
+    return tuple(ty.shape), 'float64'
+
+
+def get_buffer_bytes(key: BufferKey) -> int:
+    shape, dtype = key
+    return math.prod(shape) * np.dtype(dtype).itemsize
+
+
+class MemoryPlan:
+    def __init__(self, func: mlir_op.FuncOp):
+        self.func = func
+        self.buffer_keys: typing.List[BufferKey] = []
+        # ops that write their result into a planned buffer, and the ops among them that reuse an operand buffer
+        self.op_buffers: typing.Dict[mlir_op.Op, int] = {}
+        self.in_place_ops: typing.Set[mlir_op.Op] = set()
+        self.unplanned_bytes = 0
+
+    @property
+    def planned_peak_bytes(self) -> int:
+        return sum(get_buffer_bytes(key) for key in self.buffer_keys)
+
+    def report(self, file: typing.TextIO = sys.stderr):
+        print(f'memory plan {self.func.function_name}: {len(self.buffer_keys)} buffers, '
+              f'{len(self.op_buffers)} planned results ({len(self.in_place_ops)} in place), '
+              f'planned peak {self.planned_peak_bytes} bytes, without reuse {self.unplanned_bytes} bytes', file=file)
+
+
+def writes_fresh_buffer(op: mlir_op.Op) -> bool:
+    return isinstance(op, (ops.ElementwiseBinaryOp, ops.FusedElementwiseOp))
+
+
+def is_view(op: mlir_op.Op) -> bool:
+    return isinstance(op, (ops.TransposeOp, ops.ReshapeOp))
+
+
+def plan_memory(func: mlir_op.FuncOp, func_liveness: liveness.Liveness = None) -> MemoryPlan:
+    func_liveness = liveness.Liveness(func) if func_liveness is None else func_liveness
+    plan = MemoryPlan(func)
+    free_buffers: typing.Dict[BufferKey, typing.List[int]] = {}
+    # values backed by a planned buffer, including views of it; a buffer is free once none of them is alive
+    value_buffers: typing.Dict[td.Value, int] = {}
+    num_aliases: typing.Dict[int, int] = {}
+    owned_values: typing.Set[td.Value] = set()
+    pinned_buffers: typing.Set[int] = set()
+
+    def release(value: td.Value):
+        buffer = value_buffers.pop(value, None)
+        if buffer is None:
+            return
+        num_aliases[buffer] -= 1
+        if num_aliases[buffer] == 0 and buffer not in pinned_buffers:
+            free_buffers.setdefault(plan.buffer_keys[buffer], []).append(buffer)
+
+    for op in func.body:
+        dying_values = list(func_liveness.get_dying_values(op))
+        outputs = op.get_outputs()
+        key = get_buffer_key(outputs[0].ty) if len(outputs) == 1 else None
+        if key is not None and writes_fresh_buffer(op):
+            plan.unplanned_bytes += get_buffer_bytes(key)
+            buffer = None
+            # a plain ufunc reads each element before writing it, so a dying operand that solely owns a buffer of
+            # the right shape can take the result; constants, arguments and call results are never owned
+            if isinstance(op, ops.ElementwiseBinaryOp):
+                for value in op.get_inputs():
+                    if (value in owned_values and value in dying_values and num_aliases[value_buffers[value]] == 1
+                            and value_buffers[value] not in pinned_buffers
+                            and plan.buffer_keys[value_buffers[value]] == key):
+                        buffer = value_buffers.pop(value)
+                        owned_values.discard(value)
+                        dying_values.remove(value)
+                        plan.in_place_ops.add(op)
+                        break
+            if buffer is None:
+                if free_buffers.get(key):
+                    buffer = free_buffers[key].pop()
+                else:
+                    buffer = len(plan.buffer_keys)
+                    plan.buffer_keys.append(key)
+                num_aliases[buffer] = 1
+            plan.op_buffers[op] = buffer
+            value_buffers[outputs[0]] = buffer
+            owned_values.add(outputs[0])
+        elif is_view(op) and op.get_inputs()[0] in value_buffers:
+            buffer = value_buffers[op.get_inputs()[0]]
+            value_buffers[outputs[0]] = buffer
+            num_aliases[buffer] += 1
+        elif isinstance(op, mlir_op.GenericCallOp):
+            # the callee may return a view of an argument, so buffers passed to a call are never reused
+            for value in op.get_inputs():
+                if value in value_buffers:
+                    pinned_buffers.add(value_buffers[value])
+
+        for value in dying_values:
+            release(value)
+    return plan
+
+
+class PlannedFunction(interpreter.CompiledFunction):
+    """A compiled function that writes results into planned buffers and drops dead registers."""
+
+    def __init__(self, func: mlir_op.FuncOp, interp: 'interpreter.Interpreter'):
+        super().__init__(func, interp)
+        func_liveness = liveness.Liveness(func)
+        self.plan = plan_memory(func, func_liveness)
+        self.planned_instructions = []
+        for op, (kernel, operand_slots, result_slot) in zip(self.ops, self.instructions):
+            # returned values die at the terminator, so they are never dropped here
+            release_slots = tuple(self.slot_dict[value] for value in func_liveness.get_dying_values(op))
+            self.planned_instructions.append(
+                (kernel, operand_slots, result_slot, self.plan.op_buffers.get(op), release_slots)
+            )
+
+    def __call__(self, *arguments: np.ndarray) -> typing.Optional[np.ndarray]:
+        assert len(arguments) == self.num_arguments
+        # buffers belong to a single call, so a returned buffer is never reused behind the caller's back
+        buffers = [np.empty(shape, dtype=dtype) for shape, dtype in self.plan.buffer_keys]
+        registers: typing.List[typing.Optional[np.ndarray]] = [None] * self.num_slots
+        registers[:self.num_arguments] = arguments
+        for kernel, operand_slots, result_slot, buffer, release_slots in self.planned_instructions:
+            if buffer is None:
+                result = kernel(*[registers[slot] for slot in operand_slots])
+            else:
+                result = kernel(*[registers[slot] for slot in operand_slots], out=buffers[buffer])
+            if result_slot is not None:
+                registers[result_slot] = result
+            for slot in release_slots:
+                registers[slot] = None
+        if not self.return_slots:
+            return None
+        return registers[self.return_slots[0]]
@@ -2,25 +2,29 @@ import typing
 
 from python_mlir_toy.ch1 import ast, lexer
 from python_mlir_toy.ch2 import ops
-from python_mlir_toy.common import location, mlir_type, td, mlir_op, scoped, mlir_literal
+from python_mlir_toy.common import location, mlir_type, td, mlir_op, scoped, mlir_literal, block
 
 
 class MlirGenImpl:
     def __init__(self):
         self.func_dict: typing.Dict[str, ops.ToyFuncOp] = {}
         self.symbol_table = scoped.SymbolTable[td.Value]()
-        self.insert_point_list = []
+        self.builder = block.Builder()
+        # counted for -timing
+        self.num_ops = 0
 
     def insert_op(self, op: mlir_op.Op):
-        self.insert_point_list[-1].append(op)
-        return op
+        self.num_ops += 1
+        return self.builder.insert(op)
 
     @staticmethod
     def location(loc: lexer.Location):
         return location.FileLineColLocation(loc.filename, loc.line, loc.column)
 
     @staticmethod
-    def op_to_value(op: mlir_op.Op) -> td.Value:
+    def op_to_value(op: typing.Union[mlir_op.Op, td.Value]) -> td.Value:
+        if isinstance(op, td.Value):
+            return op
         output_values = op.get_outputs()
         assert isinstance(output_values, list)
         assert len(output_values) == 1
@@ -55,20 +59,17 @@ class MlirGenImpl:
             self.mlir_gen_func(f)
 
         root_module = mlir_op.ModuleOp(loc, list(self.func_dict.values()))
-
-        # todo: verify module
-
+        root_module.verify()
         return root_module
 
-    def mlir_gen_block(self, block: ast.ExprASTList, op_list):
-        self.insert_point_list.append(op_list)
-        for expr in block:
-            self.mlir_gen(expr)
-        if not isinstance(op_list[-1], ops.ReturnOp):
-            ret_op = ops.ReturnOp(op_list[-1].loc)
-            self.insert_op(ret_op)
-        self.insert_point_list.pop(-1)
-        return op_list
+    def mlir_gen_block(self, expr_list: ast.ExprASTList, body: block.Block):
+        with self.builder.at(block.InsertionPoint.at_end(body)):
+            for expr in expr_list:
+                self.mlir_gen(expr)
+            if not isinstance(body.last, ops.ReturnOp):
+                ret_op = ops.ReturnOp(body.last.loc)
+                self.insert_op(ret_op)
+        return body
 
     def mlir_gen_func(self, func: ast.FunctionAST):
         loc = self.location(func.location)
@@ -76,7 +77,7 @@ class MlirGenImpl:
         func_input_types = [mlir_type.F64TensorType() for _ in func.proto.args]
 
         arguments = [td.Value(ty) for ty in func_input_types]
-        op_list: typing.List[mlir_op.Op] = []
+        body = block.Block()
         arg_name_list: typing.List[str] = []
         arg_loc_list: typing.List[location.Location] = []
 
@@ -86,28 +87,29 @@ class MlirGenImpl:
                 self.symbol_table.insert(name_ast.name, argument_value)
                 arg_name_list.append('%' + name_ast.name)
                 arg_loc_list.append(self.location(name_ast.location))
-            self.mlir_gen_block(func.body, op_list)
+            self.mlir_gen_block(func.body, body)
 
         # fixme: assume no branch
-        if isinstance(op_list[-1], ops.ReturnOp):
-            result_op = op_list[-1]
+        if isinstance(body.last, ops.ReturnOp):
+            result_op = body.last
             func_output_types = [i.ty for i in result_op.get_inputs()]
         else:
             func_output_types = []
 
         func_name = '@' + func.proto.name
         func_type = mlir_type.FunctionType(func_input_types, func_output_types)
-        ret = ops.ToyFuncOp(loc, func_type, func_name, arg_name_list, arguments, arg_loc_list, op_list)
+        ret = ops.ToyFuncOp(loc, func_type, func_name, arg_name_list, arguments, arg_loc_list, body)
+        self.num_ops += 1
         self.func_dict[func.proto.name] = ret
         return ret
 
     def mlir_gen_call(self, call: ast.CallExprAST):
         loc = self.location(call.location)
         if call.callee == 'transpose':
-            ret = ops.TransposeOp(loc, self.mlir_gen(call.args[0]))
+            ret = ops.TransposeOp(loc, self.op_to_value(self.mlir_gen(call.args[0])))
         else:
             callee = self.func_dict[call.callee]
-            inputs = [self.mlir_gen(arg) for arg in call.args]
+            inputs = [self.op_to_value(self.mlir_gen(arg)) for arg in call.args]
             ret = ops.ToyGenericCallOp(loc, callee, inputs)
         self.insert_op(ret)
         return ret
@@ -173,7 +175,7 @@ class MlirGenImpl:
 
     def mlir_gen_print(self, p: ast.PrintExprAST):
         loc = self.location(p.location)
-        operand = self.mlir_gen(p.content)
+        operand = self.op_to_value(self.mlir_gen(p.content))
         ret = ops.PrintOp(loc, operand)
         self.insert_op(ret)
         return ret
@@ -1,29 +1,48 @@
+import math
 import typing
-from typing import Optional
+from typing import Optional, List
 
 from python_mlir_toy.common import td, location, mlir_type, mlir_op, mlir_literal, bounded_format
 
+if typing.TYPE_CHECKING:
+    # numpy is only needed once something is folded or evaluated, parsing and printing IR does not pay for it
+    import numpy as np
+
 
 class ToyOp:
-    pass
+    @staticmethod
+    def materialize_constant(array: 'np.ndarray', ty: mlir_type.Type, loc: location.Location) -> 'ConstantOp':
+        literal = mlir_literal.DenseTensorLiteral.from_array(array)
+        # a folded value may refine an unranked result type, but never contradicts a ranked one
+        assert isinstance(ty, mlir_type.TensorType)
+        assert not isinstance(ty, mlir_type.RankedTensorType) or literal.get_type() == ty, \
+            f'folded value of type {literal.get_type()} does not match {ty}'
+        return ConstantOp(loc, literal)
+
+
+class ShapeInferenceOpInterface:
+    def infer_shapes(self):
+        raise NotImplementedError('infer_shapes is not implemented')
 
 
-class ConstantOp(mlir_op.Op, ToyOp):
+class ConstantOp(mlir_op.Op, ToyOp, td.Pure, td.ConstantLike):
     op_name = 'toy.constant'
+    output = mlir_op.Result(0)
 
     def __init__(
             self, loc: location.Location, literal: mlir_literal.Literal
     ):
-        super().__init__(loc)
-        output_type = literal.get_type()
+        super().__init__(loc, result_types=[literal.get_type()])
         self.literal = literal
-        self.output = td.Value(output_type)
 
-    def get_inputs(self) -> typing.List[td.Value]:
-        return []
+    def get_constant_value(self) -> 'np.ndarray':
+        return self.literal.to_array()
 
-    def get_outputs(self) -> typing.List[td.Value]:
-        return [self.output]
+    def get_attribute_key(self):
+        return self.literal.get_key()
+
+    def has_equivalent_attributes(self, other: 'ConstantOp') -> bool:
+        return self.literal.is_equivalent(other.literal)
 
     @classmethod
     def get_format_list(cls):
@@ -38,37 +57,92 @@ class ToyGenericCallOp(mlir_op.GenericCallOp, ToyOp):
     op_name = 'toy.generic_call'
 
 
-class AddOp(mlir_op.BinaryOp, ToyOp):
+class ElementwiseBinaryOp(mlir_op.BinaryOp, ShapeInferenceOpInterface):
+    def infer_shapes(self):
+        if isinstance(self.lhs.ty, mlir_type.RankedTensorType):
+            self.output.ty = self.lhs.ty
+        else:
+            self.output.ty = self.rhs.ty
+
+
+class AddOp(ElementwiseBinaryOp, ToyOp, td.Pure):
     op_name = 'toy.add'
 
+    def fold(self, operand_constants):
+        lhs, rhs = operand_constants
+        if lhs is None or rhs is None:
+            return None
+        import numpy as np
+        return np.add(lhs, rhs)
 
-class MulOp(mlir_op.BinaryOp, ToyOp):
+
+class MulOp(ElementwiseBinaryOp, ToyOp, td.Pure):
     op_name = 'toy.mul'
 
+    def fold(self, operand_constants):
+        lhs, rhs = operand_constants
+        if lhs is None or rhs is None:
+            return None
+        import numpy as np
+        return np.multiply(lhs, rhs)
+
+
+class FusedElementwiseOp(mlir_op.Op, ToyOp, td.Pure, ShapeInferenceOpInterface):
+    op_name = 'toy.fused_elementwise'
+    output = mlir_op.Result(0)
+
+    def __init__(
+            self, loc: location.Location, expression: str, inputs: List[td.Value],
+            output_types: List[mlir_type.Type]
+    ):
+        super().__init__(loc, operands=inputs, result_types=output_types)
+        self.expression = expression
+
+    def get_expression(self):
+        from python_mlir_toy.ch2 import fusion
+        return fusion.parse_expression(self.expression)
+
+    def get_attribute_key(self):
+        return self.expression
+
+    @classmethod
+    def get_format_list(cls):
+        return [bounded_format.QuotedStrFormat('expression'), bounded_format.ConstantStrFormat('(', end=''),
+                bounded_format.InputsFormat(), bounded_format.ConstantStrFormat(')'),
+                bounded_format.OutputsTypeFormat(prefix=':', end=' '), bounded_format.LocationFormat()]
+
+    def infer_shapes(self):
+        for value in self.get_inputs():
+            if isinstance(value.ty, mlir_type.RankedTensorType):
+                self.output.ty = value.ty
+                return
+
+    def fold(self, operand_constants):
+        if any(operand is None for operand in operand_constants):
+            return None
+        from python_mlir_toy.ch2 import fusion
+        return fusion.get_fused_kernel(self.expression)(*operand_constants)
+
 
 class PrintOp(mlir_op.Op, ToyOp):
     op_name = 'toy.print'
+    operand = mlir_op.Operand(0)
 
     def __init__(self, loc: location.Location, operand: td.Value, operand_type: mlir_type.Type = None):
-        super().__init__(loc)
-        self.operand = operand
+        super().__init__(loc, operands=[operand])
         assert operand_type is None or operand.ty <= operand_type
 
-    def get_inputs(self) -> typing.List[td.Value]:
-        return [self.operand]
-
-    def get_outputs(self) -> typing.List[td.Value]:
-        return []
-
     @classmethod
     def get_format_list(cls):
         return [bounded_format.BoundedInputFormat('operand'), bounded_format.BoundedTypeFormat('operand', prefix=':'),
                 bounded_format.LocationFormat()]
 
 
-class ReshapeOp(mlir_op.Op, ToyOp):
+class ReshapeOp(mlir_op.Op, ToyOp, td.Pure, ShapeInferenceOpInterface):
     op_name = 'toy.reshape'
     op_name_suffix: str = ''
+    operand = mlir_op.Operand(0)
+    output = mlir_op.Result(0)
 
     # _op_name_format = formater.NamespacedSymbolFormat(end='')
 
@@ -76,17 +150,9 @@ class ReshapeOp(mlir_op.Op, ToyOp):
             self, loc: location.Location, operand: td.Value, operand_type: mlir_type.Type = None,
             output_type: mlir_type.Type = None
     ):
-        super().__init__(loc)
-        self.operand = operand
+        super().__init__(loc, operands=[operand], result_types=[output_type])
         assert isinstance(self.operand.ty, mlir_type.RankedTensorType)
         assert operand_type is None or self.operand.ty <= operand_type
-        self.output = td.Value(output_type)
-
-    def get_inputs(self) -> typing.List[td.Value]:
-        return [self.operand]
-
-    def get_outputs(self) -> typing.List[td.Value]:
-        return [self.output]
 
     @classmethod
     def get_format_list(cls):
@@ -95,56 +161,71 @@ class ReshapeOp(mlir_op.Op, ToyOp):
                 bounded_format.ConstantStrFormat('to'), bounded_format.BoundedTypeFormat('output'),
                 bounded_format.LocationFormat()]
 
+    def infer_shapes(self):
+        # the result type is spelled out on the op, there is nothing to infer
+        pass
+
+    def fold(self, operand_constants):
+        if not isinstance(self.output.ty, mlir_type.RankedTensorType):
+            return None
+        if self.operand.ty == self.output.ty:
+            return self.operand
+        operand, = operand_constants
+        # a reshape to another number of elements is left for the runtime to reject
+        if operand is None or math.prod(operand.shape) != math.prod(self.output.ty.shape):
+            return None
+        return operand.reshape(self.output.ty.shape)
+
+    @classmethod
+    def get_canonicalization_patterns(cls):
+        from python_mlir_toy.ch2 import toy_combine
+        return [toy_combine.ReshapeReshapeOptPattern(), toy_combine.RedundantReshapeOptPattern(),
+                toy_combine.FoldConstantReshapeOptPattern()]
+
 
-class ReturnOp(mlir_op.Op, ToyOp):
+class ReturnOp(mlir_op.Op, ToyOp, td.IsTerminator):
     op_name = 'toy.return'
+    operand = mlir_op.Operand(0)
 
     def __init__(
             self, loc: location.Location, operand: Optional[td.Value] = None,
             operand_type: Optional[mlir_type.Type] = None
     ):
-        super().__init__(loc)
-        self.operand = operand
+        super().__init__(loc, operands=[operand] if operand is not None else [])
         assert operand_type is None or operand.ty <= operand_type
 
-    def get_inputs(self) -> typing.List[td.Value]:
-        return [self.operand] if self.operand is not None else []
-
-    def get_outputs(self) -> typing.List[td.Value]:
-        return []
-
     @classmethod
     def get_format_list(cls):
         return [bounded_format.BoundedInputFormat('operand'), bounded_format.BoundedTypeFormat('operand', prefix=':'),
                 bounded_format.LocationFormat()]
 
 
-class TransposeOp(mlir_op.Op, ToyOp):
+class TransposeOp(mlir_op.Op, ToyOp, td.Pure, ShapeInferenceOpInterface):
     op_name = 'toy.transpose'
     op_name_suffix: str = ''
+    operand = mlir_op.Operand(0)
+    output = mlir_op.Result(0)
 
     def __init__(
             self, loc: location.Location, operand: td.Value, operand_type: mlir_type.Type = None,
             output_type: mlir_type.Type = None
     ):
-        super().__init__(loc)
         assert operand_type is None or operand.ty <= operand_type
-        if isinstance(operand.ty, mlir_type.RankedTensorType):
-            assert len(operand.ty.shape) >= 2
-            *shape, m2, m1 = operand.ty.shape
-            new_shape = [*shape, m1, m2]
-            result_type = mlir_type.RankedF64TensorType(new_shape)
-        else:
-            result_type = mlir_type.F64TensorType()
-        self.operand = operand
+        result_type = self.get_result_type(operand.ty)
         assert output_type is None or result_type <= output_type
-        self.output = td.Value(result_type)
-
-    def get_inputs(self) -> typing.List[td.Value]:
-        return [self.operand]
+        super().__init__(loc, operands=[operand], result_types=[result_type])
+
+    @staticmethod
+    def get_result_type(operand_type: mlir_type.Type) -> mlir_type.Type:
+        if isinstance(operand_type, mlir_type.RankedTensorType):
+            assert len(operand_type.shape) >= 2
+            *shape, m2, m1 = operand_type.shape
+            return mlir_type.RankedF64TensorType([*shape, m1, m2])
+        else:
+            return mlir_type.F64TensorType()
 
-    def get_outputs(self) -> typing.List[td.Value]:
-        return [self.output]
+    def infer_shapes(self):
+        self.output.ty = self.get_result_type(self.operand.ty)
 
     @classmethod
     def get_format_list(cls):
@@ -152,3 +233,15 @@ class TransposeOp(mlir_op.Op, ToyOp):
                 bounded_format.BoundedTypeFormat('operand', prefix=':', end=''), bounded_format.ConstantStrFormat(')'),
                 bounded_format.ConstantStrFormat('to'), bounded_format.BoundedTypeFormat('output'),
                 bounded_format.LocationFormat()]
+
+    def fold(self, operand_constants):
+        operand, = operand_constants
+        if operand is None:
+            return None
+        import numpy as np
+        return np.ascontiguousarray(np.swapaxes(operand, -1, -2))
+
+    @classmethod
+    def get_canonicalization_patterns(cls):
+        from python_mlir_toy.ch2 import toy_combine
+        return [toy_combine.SimplifyRedundantTranspose()]
@@ -0,0 +1,193 @@
+import re
+import sys
+import typing
+
+import numpy as np
+
+from python_mlir_toy.ch2 import ops, interpreter, fusion
+from python_mlir_toy.common import mlir_op, mlir_type, td
+
+Emitter = typing.Callable[[mlir_op.Op, typing.List[str], 'FunctionCodegen'], str]
+
+
+class CodegenError(Exception):
+    pass
+
+
+emitter_dict: typing.Dict[str, Emitter] = {}
+
+
+def register_emitter(op_name: str):
+    def decorator(emitter: Emitter) -> Emitter:
+        assert op_name not in emitter_dict
+        emitter_dict[op_name] = emitter
+        return emitter
+
+    return decorator
+
+
+def to_identifier(name: str, prefix: str) -> str:
+    # the prefix keeps symbols apart from keywords, builtins and the generated value names
+    return prefix + re.sub(r'\W', '_', name.lstrip('@%'))
+
+
+# what -emit=py prints before the generated code, binding the names the engine puts in the namespace of the functions
+prelude = """import sys
+
+import numpy as _np
+# non-finite constants are printed as inf and nan
+from numpy import inf, nan
+
+from python_mlir_toy.ch2.fusion import get_fused_kernel as _get_fused_kernel
+from python_mlir_toy.ch2.interpreter import print_tensor as _print_tensor
+
+_swapaxes = _np.swapaxes
+_reshape = _np.reshape
+_file = sys.stdout
+"""
+
+
+@register_emitter('toy.constant')
+def emit_constant(op: ops.ConstantOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    array = op.get_constant_value()
+    source = f'_np.array({array.tolist()!r}, dtype=_np.float64).reshape({array.shape!r})'
+    return codegen.add_global('c', array, source)
+
+
+@register_emitter('toy.add')
+def emit_add(op: ops.AddOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    return f'{operands[0]} + {operands[1]}'
+
+
+@register_emitter('toy.mul')
+def emit_mul(op: ops.MulOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    return f'{operands[0]} * {operands[1]}'
+
+
+@register_emitter('toy.transpose')
+def emit_transpose(op: ops.TransposeOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    operand_type = op.operand.ty
+    if isinstance(operand_type, mlir_type.RankedTensorType) and len(operand_type.shape) == 2:
+        return f'{operands[0]}.T'
+    return f'_swapaxes({operands[0]}, -1, -2)'
+
+
+@register_emitter('toy.reshape')
+def emit_reshape(op: ops.ReshapeOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    return f'_reshape({operands[0]}, {tuple(op.output.ty.shape)!r})'
+
+
+@register_emitter('toy.fused_elementwise')
+def emit_fused_elementwise(op: ops.FusedElementwiseOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    kernel = codegen.add_global(
+        'fused', fusion.get_fused_kernel(op.expression), f'_get_fused_kernel({op.expression!r})'
+    )
+    return f'{kernel}({", ".join(operands)})'
+
+
+@register_emitter('toy.print')
+def emit_print(op: ops.PrintOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    return f'_print_tensor({operands[0]}, _file)'
+
+
+@register_emitter('toy.generic_call')
+def emit_call(op: ops.ToyGenericCallOp, operands: typing.List[str], codegen: 'FunctionCodegen') -> str:
+    codegen.callees.append(op.callee)
+    return f'{codegen.engine.get_function_name(op.callee)}({", ".join(operands)})'
+
+
+class FunctionCodegen:
+    def __init__(self, func: mlir_op.FuncOp, engine: 'CodegenEngine'):
+        self.func = func
+        self.engine = engine
+        self.callees: typing.List[mlir_op.FuncOp] = []
+        self.name = engine.get_function_name(func)
+
+    def add_global(self, prefix: str, value, source: str) -> str:
+        """Binds value to a new global name, source is the expression -emit=py prints for it."""
+        name = f'_{self.name}_{prefix}{len(self.engine.global_dict)}'
+        self.engine.global_dict[name] = value
+        self.engine.global_sources[name] = source
+        return name
+
+    def generate(self) -> str:
+        # locals are named after the SSA values: arguments keep their name, results are numbered like %0, %1, ...
+        name_dict: typing.Dict[td.Value, str] = {}
+        for value, argument_name in zip(self.func.argument_values, self.func.argument_names):
+            name_dict[value] = to_identifier(argument_name, 'a_')
+        lines = [f'def {self.name}({", ".join(name_dict[value] for value in self.func.argument_values)}):']
+        for op in self.func.body:
+            operands = [name_dict[value] for value in op.get_inputs()]
+            if isinstance(op, td.IsTerminator):
+                lines.append(f'    return {operands[0]}' if operands else '    return None')
+                break
+            emitter = emitter_dict.get(op.op_name)
+            if emitter is None:
+                raise CodegenError(f'no python emitter for {op.op_name} {op.loc}')
+            expression = emitter(op, operands, self)
+            outputs = op.get_outputs()
+            if outputs:
+                name_dict[outputs[0]] = f'v{len(name_dict) - len(self.func.argument_values)}'
+                lines.append(f'    {name_dict[outputs[0]]} = {expression}')
+            else:
+                lines.append(f'    {expression}')
+        return '\n'.join(lines) + '\n'
+
+
+def get_signature(func: mlir_op.FuncOp) -> typing.Tuple[str, tuple]:
+    # callees are specialized per argument shapes by the shape inference pass, so the argument types are the
+    # shape signature of a function
+    return func.function_name, tuple(ty.get_key() for ty in func.function_type.inputs)
+
+
+class CodegenEngine:
+    def __init__(self, module: mlir_op.ModuleOp, file: typing.TextIO = None):
+        self.module = module
+        self.file = file if file is not None else sys.stdout
+        # every function of the module shares one namespace, so a generic_call is a direct python call
+        self.global_dict: typing.Dict[str, typing.Any] = {
+            '_swapaxes': np.swapaxes, '_reshape': np.reshape, '_print_tensor': interpreter.print_tensor,
+            '_file': self.file,
+        }
+        self.global_sources: typing.Dict[str, str] = {}
+        self.sources: typing.Dict[typing.Tuple[str, tuple], str] = {}
+        # symbol names are not python identifiers, so the index of the signature keeps their python names apart
+        self.function_names: typing.Dict[typing.Tuple[str, tuple], str] = {}
+
+    def get_function_name(self, func: mlir_op.FuncOp) -> str:
+        signature = get_signature(func)
+        name = self.function_names.get(signature)
+        if name is None:
+            name = f'{to_identifier(func.function_name, "f_")}_{len(self.function_names)}'
+            self.function_names[signature] = name
+        return name
+
+    def compile(self, func: mlir_op.FuncOp) -> typing.Callable[..., typing.Optional[np.ndarray]]:
+        worklist = [func]
+        while worklist:
+            current = worklist.pop()
+            signature = get_signature(current)
+            if signature in self.sources:
+                continue
+            codegen = FunctionCodegen(current, self)
+            source = codegen.generate()
+            self.sources[signature] = source
+            exec(compile(source, f'<toy {current.function_name}>', 'exec'), self.global_dict)
+            worklist.extend(codegen.callees)
+        return self.global_dict[self.get_function_name(func)]
+
+    def get_source(self) -> str:
+        """A program that runs main when executed, it needs numpy and python_mlir_toy for the fused kernels and print."""
+        funcs = [op for op in self.module.body if isinstance(op, mlir_op.FuncOp)]
+        for func in funcs:
+            self.compile(func)
+        parts = [prelude, ''.join(f'{name} = {source}\n' for name, source in self.global_sources.items())]
+        parts.extend(self.sources.values())
+        for func in funcs:
+            if func.function_name == '@main':
+                parts.append(f"if __name__ == '__main__':\n    {self.get_function_name(func)}()\n")
+        return '\n\n'.join(parts)
+
+    def run(self, function_name: str = 'main', *arguments: np.ndarray) -> typing.Optional[np.ndarray]:
+        arguments = [np.asarray(argument, dtype=np.float64) for argument in arguments]
+        return self.compile(interpreter.lookup_function(self.module, function_name))(*arguments)
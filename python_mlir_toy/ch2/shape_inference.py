@@ -0,0 +1,147 @@
+import collections
+import sys
+import typing
+
+from python_mlir_toy.ch2 import ops
+from python_mlir_toy.common import pass_manager, mlir_op, mlir_type, td, call_graph
+
+
+def is_ranked(value: td.Value) -> bool:
+    return isinstance(value.ty, mlir_type.RankedTensorType)
+
+
+def mangle_specialization_name(function_name: str, shapes: typing.Tuple[typing.Tuple[int, ...], ...]) -> str:
+    suffix = '_'.join('x'.join(str(dim) for dim in shape) or 'scalar' for shape in shapes)
+    return f'{function_name}_{suffix}'
+
+
+class ShapeInferencePass(pass_manager.ModulePass):
+    argument = 'shape-inference'
+    description = 'Propagate ranked tensor shapes through functions, specializing callees per argument shapes'
+
+    exported = pass_manager.Option(
+        pass_manager.parse_list, [], 'Functions kept after specialization in addition to main', to_str=','.join
+    )
+
+    num_inferred = pass_manager.Statistic('num-inferred', 'Number of ops whose result shapes were inferred')
+    num_specialized = pass_manager.Statistic('num-specialized', 'Number of callee specializations created')
+    num_unranked = pass_manager.Statistic('num-unranked', 'Number of values that remain unranked')
+    num_erased = pass_manager.Statistic('num-erased', 'Number of specialized functions erased without callers left')
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.module: typing.Optional[mlir_op.ModuleOp] = None
+        self.specializations: typing.Dict[typing.Tuple[str, tuple], mlir_op.FuncOp] = {}
+        self.inferred_funcs: typing.Set[mlir_op.FuncOp] = set()
+        self.specialized_funcs: typing.Set[mlir_op.FuncOp] = set()
+        self.symbol_names: typing.Set[str] = set()
+        self.unranked_values: typing.List[typing.Tuple[mlir_op.Op, td.Value]] = []
+
+    def run_on_module(self, module: mlir_op.ModuleOp):
+        self.module = module
+        funcs = [op for op in module.body if isinstance(op, mlir_op.FuncOp)]
+        self.symbol_names = {func.function_name for func in funcs}
+        self.specialized_funcs = set()
+        self.unranked_values = []
+
+        # functions with fully ranked arguments (main in particular) are the roots, everything else gets
+        # specialized from its call sites
+        for func in funcs:
+            if all(is_ranked(value) for value in func.argument_values):
+                self.infer_function(func)
+
+        # once every call is redirected to a specialization, nothing runs the unranked original any more
+        root_names = {'main', *self.exported}
+        self.num_erased += call_graph.erase_uncalled_funcs(
+            module, [func for func in self.specialized_funcs if func.function_name.lstrip('@') not in root_names]
+        )
+
+        for func in module.body:
+            if func in self.inferred_funcs:
+                for op in func.body:
+                    for value in op.get_outputs():
+                        if not is_ranked(value):
+                            self.unranked_values.append((op, value))
+        self.num_unranked += len(self.unranked_values)
+        for op, _ in self.unranked_values:
+            print(f'warning: shape inference left the result of {op.op_name} unranked {op.loc}', file=sys.stderr)
+
+    def infer_function(self, func: mlir_op.FuncOp):
+        if func in self.inferred_funcs:
+            return
+        self.inferred_funcs.add(func)
+
+        pending: typing.Dict[mlir_op.Op, int] = {}
+        ready = collections.deque()
+        for op in func.body:
+            # calls are always revisited, their callee may need a specialization even if the results are ranked
+            if not isinstance(op, mlir_op.GenericCallOp) and all(is_ranked(value) for value in op.get_outputs()):
+                continue
+            num_unranked_operands = sum(1 for value in op.get_inputs() if not is_ranked(value))
+            if num_unranked_operands == 0:
+                ready.append(op)
+            else:
+                pending[op] = num_unranked_operands
+
+        while ready:
+            op = ready.popleft()
+            if isinstance(op, mlir_op.GenericCallOp):
+                self.infer_call(op)
+            elif isinstance(op, ops.ShapeInferenceOpInterface):
+                op.infer_shapes()
+            else:
+                continue
+            self.num_inferred += 1
+
+            for value in op.get_outputs():
+                if not is_ranked(value):
+                    continue
+                for use in value.uses:
+                    if use.op in pending:
+                        pending[use.op] -= 1
+                        if pending[use.op] == 0:
+                            del pending[use.op]
+                            ready.append(use.op)
+
+        if isinstance(func.body.last, td.IsTerminator):
+            output_types = [value.ty for value in func.body.last.get_inputs()]
+            func.function_type = mlir_type.FunctionType(list(func.function_type.inputs), output_types)
+
+    def infer_call(self, call: mlir_op.GenericCallOp):
+        callee = call.callee
+        shapes = tuple(tuple(value.ty.shape) for value in call.get_inputs())
+        key = (callee.function_name, shapes)
+        specialization = self.specializations.get(key)
+        if specialization is None:
+            if all(is_ranked(value) for value in callee.argument_values):
+                specialization = callee
+            else:
+                specialization = self.specialize(callee, [value.ty for value in call.get_inputs()], shapes)
+            self.specializations[key] = specialization
+        self.infer_function(specialization)
+
+        call.callee = specialization
+        for result, ty in zip(call.get_outputs(), specialization.function_type.outputs):
+            result.ty = ty
+
+    def specialize(
+            self, callee: mlir_op.FuncOp, argument_types: typing.List[mlir_type.Type],
+            shapes: typing.Tuple[typing.Tuple[int, ...], ...]
+    ) -> mlir_op.FuncOp:
+        specialization = callee.clone()
+        name = mangle_specialization_name(callee.function_name, shapes)
+        index = 0
+        while name in self.symbol_names:
+            index += 1
+            name = f'{mangle_specialization_name(callee.function_name, shapes)}_{index}'
+        self.symbol_names.add(name)
+        specialization.function_name = name
+        for value, ty in zip(specialization.argument_values, argument_types):
+            value.ty = ty
+        specialization.function_type = mlir_type.FunctionType(
+            list(argument_types), list(specialization.function_type.outputs)
+        )
+        self.module.body.insert_after(callee, specialization)
+        self.specialized_funcs.add(callee)
+        self.num_specialized += 1
+        return specialization
@@ -1,61 +1,266 @@
 import argparse
+import contextlib
 import enum
+import io
+import os
+import sys
+import time
+import typing
 
-from python_mlir_toy.ch1 import ast
-from python_mlir_toy.ch1.lexer import LexerBuffer
-from python_mlir_toy.ch1.parser import Parser
-from python_mlir_toy.ch2.mlir_gen import MlirGenImpl
-from python_mlir_toy.common import scoped_text_parser, mlir_op
+# only the timer is imported eagerly: the frontend and the cache are imported by the actions that need them, and ops and
+# passes by their first lookup, so -h, .mlir inputs and cache hits do not pay for what they do not use
+from python_mlir_toy.common import timing
+
+if typing.TYPE_CHECKING:
+    from python_mlir_toy.common import mlir_op, compile_cache
 
 
 class Action(enum.Enum):
     Ast = 'ast'
     Mlir = 'mlir'
+    Run = 'run'
+    Py = 'py'
+
+
+# modules that register ops and passes when imported, each one is loaded by the first lookup that needs it
+dialect_module_dict = {'toy': 'python_mlir_toy.ch2.ops'}
+pass_module_dict = {
+    'strip-debuginfo': 'python_mlir_toy.common.strip_debuginfo',
+    'canonicalize': 'python_mlir_toy.common.canonicalize',
+    'constant-fold': 'python_mlir_toy.common.constant_fold',
+    'inline': 'python_mlir_toy.common.inliner',
+    'cse': 'python_mlir_toy.common.cse',
+    'dce': 'python_mlir_toy.common.dce',
+    'shape-inference': 'python_mlir_toy.ch2.shape_inference',
+    'toy-fuse-elementwise': 'python_mlir_toy.ch2.fusion',
+}
+
+# actions whose output only depends on the input, the pass pipeline and the tool version
+cacheable_actions = (Action.Ast, Action.Mlir, Action.Py)
+
+
+class ExecEngine(enum.Enum):
+    Interpreter = 'interpreter'
+    Py = 'py'
 
 
-def build_arg_parser():
+def build_arg_parser(input_file_type: typing.Callable[[str], typing.Any] = argparse.FileType('r')):
     arg_parser = argparse.ArgumentParser('toy compiler')
-    arg_parser.add_argument('input_file', nargs='?', type=argparse.FileType('r'), default='-', help='input toy file')
+    arg_parser.add_argument('input_file', nargs='?', type=input_file_type, default='-', help='input toy file')
     arg_parser.add_argument('-emit', dest='emit_action', nargs=1, type=str, choices=[i.value for i in Action],
-                            help=f'Select the kind of output desired: {Action.Ast}(output the AST dump)')
+                            help=f'Select the kind of output desired: {Action.Ast}(output the AST dump), '
+                                 f'{Action.Mlir}(output the MLIR dump), {Action.Run}(execute main), '
+                                 f'{Action.Py}(output the generated python source)')
+    arg_parser.add_argument('-pass-pipeline', dest='pass_pipeline', type=str, default='',
+                            help='Textual pass pipeline to run on the module, e.g. "module(func(strip-debuginfo))"')
+    arg_parser.add_argument('-timing', dest='timing', action='store_true',
+                            help='Report the wall and CPU time of each compiler phase and pass, and throughput '
+                                 'counters, to stderr')
+    arg_parser.add_argument('-timing-format', dest='timing_format', type=str, default='table',
+                            choices=['table', 'json'], help='Format of the -timing and -mem-profile reports')
+    arg_parser.add_argument('-mem-profile', dest='mem_profile', action='store_true',
+                            help='Trace the allocations of each compiler phase and report their peak and retained '
+                                 'bytes, top allocation sites and live compiler objects to stderr, along with -timing')
+    arg_parser.add_argument('-mem-profile-top', dest='mem_profile_top', type=int, default=5,
+                            help='Number of allocation sites reported per phase by -mem-profile')
+    arg_parser.add_argument('-j', dest='num_workers', type=int, default=1,
+                            help='Number of worker processes used to run function passes')
+    arg_parser.add_argument('-pass-statistics', dest='pass_statistics', action='store_true',
+                            help='Report the statistics counters of each pass to stderr')
+    arg_parser.add_argument('-exec-engine', dest='exec_engine', type=str, default=ExecEngine.Interpreter.value,
+                            choices=[i.value for i in ExecEngine], help='Engine used by -emit=run to execute main')
+    arg_parser.add_argument('-memory-plan', dest='memory_plan', action='store_true',
+                            help='Run the interpreter with liveness based buffer reuse and report the plans to stderr')
+    arg_parser.add_argument('-memo-cache-bytes', dest='memo_cache_bytes', type=int, default=0,
+                            help='Memoize calls to pure functions in the interpreter, keeping at most this many bytes '
+                                 'of results; the hit/miss counters are reported to stderr')
+    arg_parser.add_argument('-cache-dir', dest='cache_dir', type=str, default=None,
+                            help='Directory of a compile output cache shared by concurrent invocations')
+    arg_parser.add_argument('-cache-max-bytes', dest='cache_max_bytes', type=int, default=256 << 20,
+                            help='Byte budget of the compile output cache, least recently used entries are evicted')
+    arg_parser.add_argument('-cache-stats', dest='cache_stats', action='store_true',
+                            help='Report the hit rate and the saved compile time of the cache to stderr')
+    arg_parser.add_argument('-incremental', dest='incremental', action='store_true',
+                            help='Also cache the output of function pass pipelines per function in -cache-dir, so '
+                                 'only the functions that changed are recompiled')
     return arg_parser
 
 
-def dump_ast(args):
+def dump_ast(args, timer=timing.null_timer):
+    from python_mlir_toy.ch1 import ast
+    from python_mlir_toy.ch1.toy import parse_toy
+
     assert args.input_file.name.endswith('.toy')
-    lexer = LexerBuffer(args.input_file, args.input_file.name)
-    parser = Parser(lexer)
-    module_ast = parser.parse_module()
-    ast.dump(module_ast)
+    module_ast = parse_toy(args.input_file, timer)
+    timer.write_output(lambda: ast.dump(module_ast))
+
+
+def create_timer(args) -> typing.Union[timing.Timer, timing.NullTimer]:
+    if args.mem_profile:
+        from python_mlir_toy.common import mem_profile
+        return mem_profile.MemoryProfiler(args.mem_profile_top)
+    return timing.Timer() if args.timing else timing.null_timer
+
+
+def get_function_cache(args) -> typing.Optional['compile_cache.CompileCache']:
+    if not args.incremental:
+        return None
+    from python_mlir_toy.common import compile_cache
+    return compile_cache.CompileCache(os.path.join(args.cache_dir, 'functions'), args.cache_max_bytes, 'function cache')
 
 
-def dump_mlir(args):
+def register_lazy_modules():
+    from python_mlir_toy.common import mlir_op, pass_manager
+
+    for dialect, module_name in dialect_module_dict.items():
+        mlir_op.Op.register_dialect_module(dialect, module_name)
+    for argument, module_name in pass_module_dict.items():
+        pass_manager.Pass.register_pass_module(argument, module_name)
+
+
+def run_pass_pipeline(args, mlir_module: 'mlir_op.ModuleOp', timer=timing.null_timer):
+    from python_mlir_toy.common import pass_manager
+
+    # statistics are only counted by functions that are actually compiled
+    function_cache = get_function_cache(args) if not args.pass_statistics else None
+    pm = pass_manager.parse_pass_pipeline(
+        args.pass_pipeline, timer=timer, num_workers=args.num_workers, function_cache=function_cache
+    )
+    with timer.scope('passes'):
+        pm.run(mlir_module)
+    if args.pass_statistics:
+        pm.print_statistics(sys.stderr)
+
+
+def load_mlir(args, timer=timing.null_timer) -> 'mlir_op.ModuleOp':
+    from python_mlir_toy.common import scoped_text_parser, mlir_op
+
+    register_lazy_modules()
     if args.input_file.name.endswith('.mlir'):
-        parser = scoped_text_parser.ScopedTextParser(args.input_file, args.input_file.name)
-        mlir_module = mlir_op.parse_module(parser)
-        mlir_module.dump()
+        with timer.scope('parse'):
+            parser = scoped_text_parser.ScopedTextParser(args.input_file, args.input_file.name)
+            mlir_module = mlir_op.parse_module(parser)
     else:
-        lexer = LexerBuffer(args.input_file, args.input_file.name)
-        parser = Parser(lexer)
-        module_ast = parser.parse_module()
-        mlir_gen = MlirGenImpl()
-        mlir_module = mlir_gen.mlir_gen(module_ast)
-        mlir_module.dump()
+        # the toy frontend is only loaded for toy sources
+        from python_mlir_toy.ch1.toy import parse_toy
+        from python_mlir_toy.ch2.mlir_gen import MlirGenImpl
 
+        module_ast = parse_toy(args.input_file, timer)
+        with timer.scope('mlir-gen') as mlir_gen_node:
+            mlir_gen = MlirGenImpl()
+            mlir_module = mlir_gen.mlir_gen(module_ast)
+        timer.add_counter('ops created', mlir_gen.num_ops, mlir_gen_node)
+    run_pass_pipeline(args, mlir_module, timer)
+    return mlir_module
 
-def main(argv=None):
-    arg_parser = build_arg_parser()
-    args = arg_parser.parse_args(argv)
 
-    arg_action = Action(args.emit_action[0])
+def dump_mlir(args, timer=timing.null_timer):
+    mlir_module = load_mlir(args, timer)
+    timer.write_output(mlir_module.dump)
+
+
+def run_mlir(args, timer=timing.null_timer):
+    from python_mlir_toy.ch2 import interpreter, py_codegen, memory_planner, memoization
+
+    mlir_module = load_mlir(args, timer)
+    if ExecEngine(args.exec_engine) == ExecEngine.Py:
+        with timer.scope('run'):
+            py_codegen.CodegenEngine(mlir_module).run('main')
+        return
+
+    function_cls = memory_planner.PlannedFunction if args.memory_plan else interpreter.CompiledFunction
+    memo_cache = memoization.MemoCache(args.memo_cache_bytes) if args.memo_cache_bytes > 0 else None
+    with timer.scope('run'):
+        runner = interpreter.Interpreter(mlir_module, function_cls=function_cls, memo_cache=memo_cache)
+        runner.run('main')
+    if args.memory_plan:
+        for compiled in runner.compiled_functions.values():
+            compiled.plan.report(sys.stderr)
+    if memo_cache is not None:
+        memo_cache.report(sys.stderr)
+
+
+def dump_py(args, timer=timing.null_timer):
+    from python_mlir_toy.ch2 import py_codegen
+
+    mlir_module = load_mlir(args, timer)
+    timer.write_output(lambda: print(py_codegen.CodegenEngine(mlir_module).get_source()))
+
+
+def run_action(args, arg_action: Action, timer=timing.null_timer):
+    args.input_file = timer.read_input(args.input_file)
     if arg_action == Action.Ast:
-        dump_ast(args)
+        dump_ast(args, timer)
     elif arg_action == Action.Mlir:
-        dump_mlir(args)
+        dump_mlir(args, timer)
+    elif arg_action == Action.Run:
+        run_mlir(args, timer)
+    elif arg_action == Action.Py:
+        dump_py(args, timer)
     else:
         raise 'No action specified (parsing only?), use -emit=<action>'
 
 
+def run_cached_action(args, arg_action: Action, cache: 'compile_cache.CompileCache'):
+    from python_mlir_toy.common import compile_cache
+
+    input_text = args.input_file.read()
+    key = compile_cache.get_cache_key(input_text.encode(), args.input_file.name, arg_action.value, args.pass_pipeline)
+    output = cache.get(key)
+    if output is not None:
+        cache.flush()
+        sys.stdout.write(output.decode())
+        return
+
+    start = time.perf_counter()
+    # the frontend reads the input again from memory, and everything the action prints becomes the cached output
+    input_name = args.input_file.name
+    args.input_file = io.StringIO(input_text)
+    args.input_file.name = input_name
+    captured = io.StringIO()
+    with contextlib.redirect_stdout(captured):
+        run_action(args, arg_action)
+    output = captured.getvalue()
+    cache.put(key, output.encode(), time.perf_counter() - start)
+    cache.flush()
+    sys.stdout.write(output)
+
+
+def main(argv=None):
+    arg_parser = build_arg_parser()
+    args = arg_parser.parse_args(argv)
+
+    arg_action = Action(args.emit_action[0])
+    if args.incremental and not args.cache_dir:
+        arg_parser.error('-incremental requires -cache-dir')
+    cache = None
+    if args.cache_dir:
+        from python_mlir_toy.common import compile_cache
+        cache = compile_cache.CompileCache(args.cache_dir, args.cache_max_bytes)
+    timer = create_timer(args)
+    # the actions replace args.input_file with what they read it into
+    input_file = args.input_file
+    try:
+        # timing, profiles and statistics describe an actual compile, so they bypass the cache
+        if cache is not None and arg_action in cacheable_actions and not (
+                args.timing or args.mem_profile or args.pass_statistics
+        ):
+            run_cached_action(args, arg_action, cache)
+        else:
+            run_action(args, arg_action, timer)
+    finally:
+        # a failed compile must neither leave tracemalloc on nor leak the input file for the rest of the process, e.g.
+        # in the daemon
+        timer.stop()
+        if input_file is not sys.stdin:
+            input_file.close()
+    timer.report(sys.stderr, args.timing_format)
+    if cache is not None and args.cache_stats:
+        cache.report(sys.stderr)
+        if args.incremental:
+            get_function_cache(args).report(sys.stderr)
+
+
 if __name__ == '__main__':
     main(['tests/transpose.toy', '-emit=mlir'])
     main(['tests/transpose.mlir', '-emit=mlir'])
@@ -0,0 +1,89 @@
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import typing
+
+# the driver module only imports its argument parser eagerly, the compiler itself lives in the daemon
+from python_mlir_toy.ch2 import toy
+
+# the daemon reads files and changes directories for whoever connects, so its socket lives in a directory only its
+# user can access, even when the default falls back to the shared /tmp
+default_socket_path = os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'), f'toy-daemon-{os.getuid()}', 'daemon.sock')
+header = struct.Struct('>I')
+
+
+def send_message(sock: socket.socket, message: typing.Dict[str, typing.Any]):
+    payload = json.dumps(message).encode()
+    sock.sendall(header.pack(len(payload)) + payload)
+
+
+def receive_exactly(sock: socket.socket, num_bytes: int) -> bytes:
+    chunks = []
+    while num_bytes > 0:
+        chunk = sock.recv(min(num_bytes, 1 << 20))
+        if not chunk:
+            raise ConnectionError('connection closed in the middle of a message')
+        chunks.append(chunk)
+        num_bytes -= len(chunk)
+    return b''.join(chunks)
+
+
+def receive_message(sock: socket.socket) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    first = sock.recv(header.size)
+    if not first:
+        return None
+    if len(first) < header.size:
+        first += receive_exactly(sock, header.size - len(first))
+    (num_bytes,) = header.unpack(first)
+    return json.loads(receive_exactly(sock, num_bytes))
+
+
+def get_socket_path() -> str:
+    return os.environ.get('TOY_DAEMON_SOCKET', default_socket_path)
+
+
+def check_socket_dir(socket_dir: str):
+    # anyone who can write to the directory can replace the socket with their own
+    info = os.lstat(socket_dir)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f'{socket_dir} is not a directory only accessible to the current user')
+
+
+def check_socket(socket_path: str):
+    check_socket_dir(os.path.dirname(os.path.abspath(socket_path)))
+    info = os.lstat(socket_path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f'{socket_path} is not a socket owned by the current user')
+
+
+def request(argv: typing.List[str], socket_path: str = None, stdin: str = None) -> typing.Dict[str, typing.Any]:
+    socket_path = socket_path or get_socket_path()
+    # a daemon of another user would see our files and could answer with anything
+    check_socket(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        send_message(sock, {'argv': argv, 'cwd': os.getcwd(), 'stdin': stdin})
+        response = receive_message(sock)
+    if response is None:
+        raise ConnectionError('the daemon closed the connection without a response')
+    return response
+
+
+def main(argv=None) -> int:
+    """Takes the arguments of ch2/toy.py and has the daemon listening on $TOY_DAEMON_SOCKET run them."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # parsed here as well, so usage errors and -h are handled locally and stdin can be forwarded; the input is only
+    # opened by the daemon
+    args = toy.build_arg_parser(input_file_type=str).parse_args(argv)
+    stdin = sys.stdin.read() if args.input_file == '-' else None
+    response = request(argv, stdin=stdin)
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import math
+
+from python_mlir_toy.ch2 import ops
+from python_mlir_toy.common import rewrite, mlir_type
+
+
+class SimplifyRedundantTranspose(rewrite.RewritePattern):
+    # transpose(transpose(x)) -> x
+    root_name = 'toy.transpose'
+
+    def match_and_rewrite(self, op: ops.TransposeOp, rewriter: rewrite.PatternRewriter) -> bool:
+        input_op = op.operand.owner
+        if not isinstance(input_op, ops.TransposeOp):
+            return False
+        rewriter.replace_op(op, [input_op.operand])
+        return True
+
+
+class ReshapeReshapeOptPattern(rewrite.RewritePattern):
+    # reshape(reshape(x)) -> reshape(x)
+    root_name = 'toy.reshape'
+
+    def match_and_rewrite(self, op: ops.ReshapeOp, rewriter: rewrite.PatternRewriter) -> bool:
+        input_op = op.operand.owner
+        if not isinstance(input_op, ops.ReshapeOp):
+            return False
+        rewriter.replace_op_with_new_op(op, ops.ReshapeOp(op.loc, input_op.operand, output_type=op.output.ty))
+        return True
+
+
+class RedundantReshapeOptPattern(rewrite.RewritePattern):
+    # reshape(x) -> x, when x already has the result type
+    root_name = 'toy.reshape'
+
+    def match_and_rewrite(self, op: ops.ReshapeOp, rewriter: rewrite.PatternRewriter) -> bool:
+        if not (isinstance(op.output.ty, mlir_type.RankedTensorType) and op.operand.ty == op.output.ty):
+            return False
+        rewriter.replace_op(op, [op.operand])
+        return True
+
+
+class FoldConstantReshapeOptPattern(rewrite.RewritePattern):
+    # reshape(constant) -> constant of the reshaped literal
+    root_name = 'toy.reshape'
+
+    def match_and_rewrite(self, op: ops.ReshapeOp, rewriter: rewrite.PatternRewriter) -> bool:
+        input_op = op.operand.owner
+        if not isinstance(input_op, ops.ConstantOp) or not isinstance(op.output.ty, mlir_type.RankedTensorType):
+            return False
+        # a reshape to another number of elements is valid IR that only fails when it runs
+        if math.prod(input_op.literal.shape) != math.prod(op.output.ty.shape):
+            return False
+        literal = input_op.literal.reshape(op.output.ty.shape)
+        rewriter.replace_op_with_new_op(op, ops.ConstantOp(op.loc, literal))
+        return True
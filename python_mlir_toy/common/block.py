@@ -0,0 +1,172 @@
+import typing
+
+if typing.TYPE_CHECKING:
+    from python_mlir_toy.common import mlir_op
+
+
+class Block:
+    order_stride = 8
+    invalid_order = -1
+
+    def __init__(self, ops: typing.Iterable['mlir_op.Op'] = (), parent_op: 'mlir_op.Op' = None):
+        self.parent_op = parent_op
+        self.first: typing.Optional['mlir_op.Op'] = None
+        self.last: typing.Optional['mlir_op.Op'] = None
+        self.size = 0
+        self.order_valid = True
+        for op in ops:
+            self.append(op)
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size != 0
+
+    def __iter__(self) -> typing.Iterator['mlir_op.Op']:
+        op = self.first
+        while op is not None:
+            # fetch the successor first so the current op can be erased while iterating
+            next_op = op.next_op
+            yield op
+            op = next_op
+
+    def __reversed__(self) -> typing.Iterator['mlir_op.Op']:
+        op = self.last
+        while op is not None:
+            prev_op = op.prev_op
+            yield op
+            op = prev_op
+
+    def append(self, op: 'mlir_op.Op') -> 'mlir_op.Op':
+        return self.insert_before(None, op)
+
+    def prepend(self, op: 'mlir_op.Op') -> 'mlir_op.Op':
+        return self.insert_before(self.first, op)
+
+    def insert_after(self, anchor: 'mlir_op.Op', op: 'mlir_op.Op') -> 'mlir_op.Op':
+        assert anchor.parent_block is self
+        return self.insert_before(anchor.next_op, op)
+
+    def insert_before(self, anchor: typing.Optional['mlir_op.Op'], op: 'mlir_op.Op') -> 'mlir_op.Op':
+        """Link op in front of anchor, or at the end of the block if anchor is None."""
+        assert op.parent_block is None, 'op is already inserted in a block'
+        assert anchor is None or anchor.parent_block is self
+        prev_op = self.last if anchor is None else anchor.prev_op
+        op.parent_block = self
+        op.prev_op = prev_op
+        op.next_op = anchor
+        if prev_op is None:
+            self.first = op
+        else:
+            prev_op.next_op = op
+        if anchor is None:
+            self.last = op
+        else:
+            anchor.prev_op = op
+        self.size += 1
+        self._assign_order(op)
+        return op
+
+    def remove(self, op: 'mlir_op.Op') -> 'mlir_op.Op':
+        """Unlink op from the block without erasing it; the order of the remaining ops stays valid."""
+        assert op.parent_block is self
+        if op.prev_op is None:
+            self.first = op.next_op
+        else:
+            op.prev_op.next_op = op.next_op
+        if op.next_op is None:
+            self.last = op.prev_op
+        else:
+            op.next_op.prev_op = op.prev_op
+        op.parent_block = None
+        op.prev_op = None
+        op.next_op = None
+        op.order_index = Block.invalid_order
+        self.size -= 1
+        return op
+
+    def _assign_order(self, op: 'mlir_op.Op'):
+        if not self.order_valid:
+            return
+        prev_index = op.prev_op.order_index if op.prev_op is not None else 0
+        if op.next_op is None:
+            op.order_index = prev_index + Block.order_stride
+        elif op.next_op.order_index - prev_index > 1:
+            op.order_index = (prev_index + op.next_op.order_index) // 2
+        else:
+            # no gap left between the neighbours, renumber lazily on the next query
+            self.order_valid = False
+
+    def recompute_op_order(self):
+        index = 0
+        for op in self:
+            index += Block.order_stride
+            op.order_index = index
+        self.order_valid = True
+
+    def is_before_in_block(self, lhs: 'mlir_op.Op', rhs: 'mlir_op.Op') -> bool:
+        assert lhs.parent_block is self and rhs.parent_block is self
+        if not self.order_valid:
+            self.recompute_op_order()
+        return lhs.order_index < rhs.order_index
+
+
+class InsertionPoint:
+    def __init__(self, block: Block, before: typing.Optional['mlir_op.Op'] = None):
+        assert before is None or before.parent_block is block
+        self.block = block
+        self.before = before
+
+    @staticmethod
+    def at_end(block: Block) -> 'InsertionPoint':
+        return InsertionPoint(block)
+
+    @staticmethod
+    def at_start(block: Block) -> 'InsertionPoint':
+        return InsertionPoint(block, block.first)
+
+    @staticmethod
+    def before_op(op: 'mlir_op.Op') -> 'InsertionPoint':
+        return InsertionPoint(op.parent_block, op)
+
+    @staticmethod
+    def after_op(op: 'mlir_op.Op') -> 'InsertionPoint':
+        return InsertionPoint(op.parent_block, op.next_op)
+
+
+class Builder:
+    def __init__(self, insertion_point: InsertionPoint = None):
+        self.insertion_point = insertion_point
+        self.saved_insertion_points: typing.List[typing.Optional[InsertionPoint]] = []
+
+    def set_insertion_point(self, insertion_point: InsertionPoint):
+        self.insertion_point = insertion_point
+
+    def set_insertion_point_to_end(self, block: Block):
+        self.insertion_point = InsertionPoint.at_end(block)
+
+    def set_insertion_point_before(self, op: 'mlir_op.Op'):
+        self.insertion_point = InsertionPoint.before_op(op)
+
+    def set_insertion_point_after(self, op: 'mlir_op.Op'):
+        self.insertion_point = InsertionPoint.after_op(op)
+
+    def get_insertion_block(self) -> typing.Optional[Block]:
+        return self.insertion_point.block if self.insertion_point is not None else None
+
+    def insert(self, op: 'mlir_op.Op') -> 'mlir_op.Op':
+        assert self.insertion_point is not None, 'builder has no insertion point'
+        return self.insertion_point.block.insert_before(self.insertion_point.before, op)
+
+    def at(self, insertion_point: InsertionPoint) -> 'Builder':
+        """Use as `with builder.at(point):` to insert at point and restore the previous point on exit."""
+        self.saved_insertion_points.append(self.insertion_point)
+        self.insertion_point = insertion_point
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.insertion_point = self.saved_insertion_points.pop()
@@ -1,7 +1,7 @@
 import typing
 
 from python_mlir_toy.common import serializable, scoped_text_parser, scoped_text_printer, tools, td, mlir_type, \
-    location, mlir_literal
+    location, mlir_literal, block
 
 
 def parse_namespaced_symbol(src: serializable.TextParser) -> str:
@@ -59,6 +59,25 @@ class BoundedStrFormat(Format):
         attr_dict[self.attr_name] = value
 
 
+class QuotedStrFormat(BoundedStrFormat):
+    """A string attribute printed as a quoted string literal, for payloads that are not a single token."""
+
+    def print(self, op, dst: serializable.TextPrinter) -> None:
+        value = getattr(op, self.attr_name)
+        assert isinstance(value, str)
+        if self.prefix is not None:
+            dst.print(self.prefix, end=self.end)
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+        dst.print(f'"{escaped}"')
+
+    def parse(self, attr_dict, src: serializable.TextParser) -> None:
+        if self.prefix is not None:
+            src.drop_token(check_token=self.prefix.strip())
+        value = src.last_token()
+        src.drop_token(check_kind=serializable.TokenKind.String)
+        attr_dict[self.attr_name] = value
+
+
 class BoundedNumberFormat(Format):
     def __init__(self, attr_name: str):
         self.attr_name = attr_name
@@ -156,6 +175,9 @@ class InputsFormat(Format):
         return input_val
 
     def parse(self, attr_dict, src: scoped_text_parser.ScopedTextParser) -> None:
+        if src.last_token() != '%':
+            attr_dict['inputs'] = []
+            return
         inputs = [self.parse_input(src)]
         while src.last_token() == ',':
             src.drop_token()
@@ -277,7 +299,7 @@ class FunctionDeclarationFormat(Format):
             mlir_type.print_type_list(dst, op.function_type.outputs, sep=',')
             dst.print()
 
-        assert isinstance(op.body, typing.List)
+        assert isinstance(op.body, block.Block)
         dst.print('{', end='')
         dst.print_newline()
         with dst:
@@ -333,7 +355,7 @@ class FunctionDeclarationFormat(Format):
         for arg_name, arg_val in zip(arg_names, arg_vals):
             src.define_var(arg_name, arg_val)
 
-        body = []
+        body = block.Block()
         while src.last_token() != '}':
             output_names = []
             if src.last_token() == '%':
@@ -398,7 +420,7 @@ class ModuleDeclarationFormat(Format):
     def parse(self, attr_dict: typing.Dict, src: scoped_text_parser.ScopedTextParser) -> None:
         src.drop_token('module')
         src.drop_token('{')
-        body = []
+        body = block.Block()
         while src.last_token() != '}':
             op_name = parse_namespaced_symbol(src)
             op_cls = self.op_builder(op_name)
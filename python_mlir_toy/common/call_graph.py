@@ -0,0 +1,106 @@
+import typing
+
+from python_mlir_toy.common import mlir_op
+
+
+class CallGraph:
+    def __init__(self, module: mlir_op.ModuleOp):
+        self.funcs: typing.List[mlir_op.FuncOp] = [op for op in module.body if isinstance(op, mlir_op.FuncOp)]
+        self.callees: typing.Dict[mlir_op.FuncOp, typing.List[mlir_op.FuncOp]] = {}
+        for func in self.funcs:
+            callees = {}
+            for op in func.body:
+                if isinstance(op, mlir_op.GenericCallOp):
+                    callees[id(op.callee)] = op.callee
+            self.callees[func] = list(callees.values())
+
+    def get_callees(self, func: mlir_op.FuncOp) -> typing.List[mlir_op.FuncOp]:
+        return self.callees.get(func, [])
+
+    def reachable_from(self, roots: typing.Iterable[mlir_op.FuncOp]) -> typing.Set[mlir_op.FuncOp]:
+        visited = set()
+        worklist = list(roots)
+        while worklist:
+            func = worklist.pop()
+            if func in visited:
+                continue
+            visited.add(func)
+            worklist.extend(self.get_callees(func))
+        return visited
+
+    def get_sccs(self) -> typing.List[typing.List[mlir_op.FuncOp]]:
+        """Tarjan's algorithm, SCCs are returned callees first (bottom-up)."""
+        index_of: typing.Dict[mlir_op.FuncOp, int] = {}
+        low_link: typing.Dict[mlir_op.FuncOp, int] = {}
+        on_stack: typing.Set[mlir_op.FuncOp] = set()
+        stack: typing.List[mlir_op.FuncOp] = []
+        sccs = []
+
+        for root in self.funcs:
+            if root in index_of:
+                continue
+            # explicit (func, callee iterator) frames, so deep call chains do not hit the recursion limit
+            frames = [(root, iter(self.get_callees(root)))]
+            index_of[root] = low_link[root] = len(index_of)
+            stack.append(root)
+            on_stack.add(root)
+            while frames:
+                func, callees = frames[-1]
+                callee = next(callees, None)
+                if callee is not None:
+                    if callee not in index_of:
+                        index_of[callee] = low_link[callee] = len(index_of)
+                        stack.append(callee)
+                        on_stack.add(callee)
+                        frames.append((callee, iter(self.get_callees(callee))))
+                    elif callee in on_stack:
+                        low_link[func] = min(low_link[func], index_of[callee])
+                    continue
+
+                frames.pop()
+                if frames:
+                    caller = frames[-1][0]
+                    low_link[caller] = min(low_link[caller], low_link[func])
+                if low_link[func] == index_of[func]:
+                    scc = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        scc.append(member)
+                        if member is func:
+                            break
+                    sccs.append(scc)
+        return sccs
+
+    def is_recursive(self, scc: typing.List[mlir_op.FuncOp]) -> bool:
+        return len(scc) > 1 or scc[0] in self.get_callees(scc[0])
+
+
+def erase_unreachable_funcs(module: mlir_op.ModuleOp, root_names: typing.Iterable[str]) -> int:
+    """Erases the functions that are not reachable from the named roots and returns how many were erased."""
+    root_names = set(root_names)
+    graph = CallGraph(module)
+    reachable = graph.reachable_from(func for func in graph.funcs if func.function_name.lstrip('@') in root_names)
+    num_erased = 0
+    for func in graph.funcs:
+        if func not in reachable:
+            func.erase()
+            num_erased += 1
+    return num_erased
+
+
+def erase_uncalled_funcs(module: mlir_op.ModuleOp, funcs: typing.Iterable[mlir_op.FuncOp]) -> int:
+    """Erases the given functions that are not called from outside of them, even through each other, and returns how
+    many were erased."""
+    candidates = set(funcs)
+    graph = CallGraph(module)
+    # the other functions are kept whether they are called or not, so they are the roots
+    called = graph.reachable_from(
+        callee for func in graph.funcs if func not in candidates for callee in graph.get_callees(func)
+    )
+    num_erased = 0
+    for func in graph.funcs:
+        if func in candidates and func not in called:
+            func.erase()
+            num_erased += 1
+    return num_erased
@@ -0,0 +1,33 @@
+from python_mlir_toy.common import pass_manager, mlir_op, rewrite
+
+
+def collect_canonicalization_patterns() -> rewrite.PatternSet:
+    patterns = rewrite.PatternSet()
+    for op_cls in mlir_op.Op.op_type_dict.values():
+        for pattern in op_cls.get_canonicalization_patterns():
+            patterns.add(pattern)
+    return patterns
+
+
+class CanonicalizerPass(pass_manager.FunctionPass):
+    argument = 'canonicalize'
+    description = 'Apply the canonicalization patterns of every registered op until a fixpoint is reached'
+
+    max_iterations = pass_manager.Option(int, 10, 'Maximum number of rounds over the function body')
+
+    num_rewrites = pass_manager.Statistic('num-rewrites', 'Number of patterns applied')
+    num_folded = pass_manager.Statistic('num-folded', 'Number of ops folded')
+    num_erased = pass_manager.Statistic('num-erased', 'Number of ops erased')
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.patterns = None
+
+    def run_on_function(self, func: mlir_op.FuncOp):
+        if self.patterns is None:
+            self.patterns = collect_canonicalization_patterns()
+        driver = rewrite.GreedyPatternRewriteDriver(self.patterns, self.max_iterations)
+        driver.simplify(func.body)
+        self.num_rewrites += driver.num_rewrites
+        self.num_folded += driver.num_folded
+        self.num_erased += driver.num_erased
@@ -0,0 +1,164 @@
+import fcntl
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import typing
+
+import python_mlir_toy
+
+# this module is imported before the cache lookup, so it must only depend on the standard library: serving a hit
+# may not pay for importing the frontend
+
+# the event counters and the saved seconds of the hits, a single fixed-size record however long the cache is used
+stats_events = ('hit', 'miss', 'store', 'evict')
+stats_record = struct.Struct('<4qd')
+
+
+def get_cache_key(input_bytes: bytes, input_name: str, action: str, pass_pipeline: str) -> str:
+    # the input name is part of the output through the locations
+    digest = hashlib.sha256()
+    for part in (python_mlir_toy.__version__, action, pass_pipeline, input_name):
+        encoded = part.encode()
+        digest.update(len(encoded).to_bytes(8, 'little'))
+        digest.update(encoded)
+    digest.update(input_bytes)
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """Compile outputs on disk, addressed by cache key and evicted least recently used first beyond max_bytes.
+
+    Entries are written to a temporary file and renamed into place, so processes sharing the directory only ever see
+    complete entries; a hit refreshes the entry's mtime, which is the LRU order.
+
+    The directory is scanned once by the first put, which then keeps a running total and only scans again to evict,
+    and the statistics are counted in memory until flush(), so a compile does not pay per lookup for either."""
+
+    def __init__(self, cache_dir: str, max_bytes: int, name: str = 'compile cache'):
+        self.cache_dir = cache_dir
+        self.entries_dir = os.path.join(cache_dir, 'entries')
+        self.stats_path = os.path.join(cache_dir, 'stats')
+        self.max_bytes = max_bytes
+        self.name = name
+        # bytes in the entries directory, stores of other processes are only seen by the next scan
+        self.num_bytes: typing.Optional[int] = None
+        self.pending_stats = self.read_stats(None)
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+    def get_entry_path(self, key: str) -> str:
+        return os.path.join(self.entries_dir, key)
+
+    def get(self, key: str) -> typing.Optional[bytes]:
+        path = self.get_entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = f.readline()
+                output = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # missing, or evicted by another process in between
+            self.count('miss', 0.0)
+            return None
+        # the header records what compiling the entry cost, which is what this hit saved
+        self.count('hit', float(header))
+        return output
+
+    def put(self, key: str, output: bytes, compile_time: float):
+        self.count('store', compile_time)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            header = f'{compile_time!r}\n'.encode()
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(output)
+            os.replace(temp_path, self.get_entry_path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        if self.num_bytes is None:
+            self.num_bytes = sum(size for _, size, _ in self.list_entries())
+        else:
+            # a replaced entry is counted twice, which at worst makes the next eviction scan early
+            self.num_bytes += len(header) + len(output)
+        if self.num_bytes > self.max_bytes:
+            self.evict()
+
+    def list_entries(self) -> typing.List[typing.Tuple[float, int, str]]:
+        entries = []
+        for entry in os.scandir(self.entries_dir):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = self.list_entries()
+        num_bytes = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if num_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self.count('evict', 0.0)
+            except FileNotFoundError:
+                pass
+            num_bytes -= size
+        self.num_bytes = num_bytes
+
+    @staticmethod
+    def read_stats(fd: typing.Optional[int]) -> typing.Dict[str, float]:
+        data = os.pread(fd, stats_record.size, 0) if fd is not None else b''
+        # no file yet, or one created by a process that has not written its record yet
+        values = stats_record.unpack(data) if len(data) == stats_record.size else (0,) * len(stats_events) + (0.0,)
+        return {**dict(zip(stats_events, values)), 'saved_seconds': values[-1]}
+
+    def count(self, event: str, seconds: float):
+        self.pending_stats[event] += 1
+        if event == 'hit':
+            self.pending_stats['saved_seconds'] += seconds
+
+    def flush(self):
+        """Adds the statistics counted since the last flush to the shared record."""
+        if not any(self.pending_stats.values()):
+            return
+        # read, update and write back the record under an exclusive lock, so concurrent processes never lose a count
+        fd = os.open(self.stats_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            stats = self.read_stats(fd)
+            for name, value in self.pending_stats.items():
+                stats[name] += value
+            os.pwrite(fd, stats_record.pack(*(stats[name] for name in stats_events), stats['saved_seconds']), 0)
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+        self.pending_stats = self.read_stats(None)
+
+    def get_stats(self) -> typing.Dict[str, float]:
+        try:
+            fd = os.open(self.stats_path, os.O_RDONLY)
+        except FileNotFoundError:
+            stats = self.read_stats(None)
+        else:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                stats = self.read_stats(fd)
+            finally:
+                os.close(fd)
+        # including what this process has not flushed yet
+        return {name: value + self.pending_stats[name] for name, value in stats.items()}
+
+    def report(self, file: typing.TextIO = sys.stderr):
+        stats = self.get_stats()
+        entries = self.list_entries()
+        lookups = stats['hit'] + stats['miss']
+        hit_rate = stats['hit'] / lookups if lookups else 0.0
+        print(f'{self.name}: {stats["hit"]} hits, {stats["miss"]} misses, hit rate {hit_rate:.1%}, '
+              f'saved {stats["saved_seconds"]:.4f} seconds, {stats["evict"]} evictions, '
+              f'{len(entries)} entries, {sum(size for _, size, _ in entries)} bytes', file=file)
+
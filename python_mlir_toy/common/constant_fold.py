@@ -0,0 +1,22 @@
+from python_mlir_toy.common import pass_manager, mlir_op, rewrite, td
+
+
+class ConstantFoldPass(pass_manager.FunctionPass):
+    argument = 'constant-fold'
+    description = 'Fold ops whose operands are all constants, in a single sweep over the function body'
+
+    num_folded = pass_manager.Statistic('num-folded', 'Number of ops folded')
+    num_erased = pass_manager.Statistic('num-erased', 'Number of constants left unused and erased')
+
+    def run_on_function(self, func: mlir_op.FuncOp):
+        rewriter = rewrite.PatternRewriter()
+        # operands are defined before their users, so folded results feed the rest of a chain in the same sweep
+        for op in func.body:
+            rewriter.set_insertion_point_before(op)
+            if rewrite.fold_op(op, rewriter):
+                self.num_folded += 1
+
+        for op in reversed(func.body):
+            if isinstance(op, td.ConstantLike) and rewrite.is_trivially_dead(op):
+                op.erase()
+                self.num_erased += 1
@@ -0,0 +1,34 @@
+import typing
+
+from python_mlir_toy.common import pass_manager, mlir_op, td
+
+
+def get_op_key(op: mlir_op.Op) -> typing.Hashable:
+    return (
+        op.op_name,
+        tuple(id(value) for value in op.get_inputs()),
+        tuple(value.ty.get_key() for value in op.get_outputs()),
+        op.get_attribute_key(),
+    )
+
+
+class CSEPass(pass_manager.FunctionPass):
+    argument = 'cse'
+    description = 'Eliminate side-effect free ops that recompute the result of an earlier identical op'
+
+    num_cse = pass_manager.Statistic("num-cse'd", 'Number of ops eliminated')
+
+    def run_on_function(self, func: mlir_op.FuncOp):
+        # the body is a single block, so an op dominates every op after it
+        known_ops: typing.Dict[typing.Hashable, typing.List[mlir_op.Op]] = {}
+        for op in func.body:
+            if not isinstance(op, td.Pure) or not op.get_outputs():
+                continue
+            candidates = known_ops.setdefault(get_op_key(op), [])
+            existing = next((candidate for candidate in candidates if candidate.has_equivalent_attributes(op)), None)
+            if existing is None:
+                candidates.append(op)
+                continue
+            op.replace_all_uses_with(existing.get_outputs())
+            op.erase()
+            self.num_cse += 1
@@ -0,0 +1,43 @@
+import typing
+
+from python_mlir_toy.common import pass_manager, mlir_op, call_graph, rewrite, purity
+
+
+class DeadCodeEliminationPass(pass_manager.ModulePass):
+    argument = 'dce'
+    description = 'Remove unused side-effect free ops and functions unreachable from main or the exported symbols'
+
+    exported = pass_manager.Option(
+        pass_manager.parse_list, [], 'Functions kept as roots in addition to main', to_str=','.join
+    )
+
+    num_erased_ops = pass_manager.Statistic('num-erased-ops', 'Number of dead ops erased')
+    num_erased_funcs = pass_manager.Statistic('num-erased-funcs', 'Number of unreachable functions erased')
+
+    def run_on_module(self, module: mlir_op.ModuleOp):
+        root_names = {'main', *self.exported}
+        self.num_erased_funcs += call_graph.erase_unreachable_funcs(module, root_names)
+        analysis = purity.PurityAnalysis(module)
+        for func in module.body:
+            if isinstance(func, mlir_op.FuncOp):
+                self.erase_dead_ops(func, analysis)
+        # the erased calls can leave their callees unreachable
+        self.num_erased_funcs += call_graph.erase_unreachable_funcs(module, root_names)
+
+    @staticmethod
+    def is_dead(op: mlir_op.Op, analysis: purity.PurityAnalysis) -> bool:
+        if isinstance(op, mlir_op.GenericCallOp):
+            return op.use_empty() and analysis.is_pure(op.callee)
+        return rewrite.is_trivially_dead(op)
+
+    def erase_dead_ops(self, func: mlir_op.FuncOp, analysis: purity.PurityAnalysis):
+        # erasing an op can only make the producers of its operands dead, so those are the ones revisited
+        worklist: typing.List[mlir_op.Op] = list(func.body)
+        while worklist:
+            op = worklist.pop()
+            if op.parent_block is None or not self.is_dead(op, analysis):
+                continue
+            producers = [value.owner for value in op.get_inputs() if value.owner is not None]
+            op.erase()
+            self.num_erased_ops += 1
+            worklist.extend(producers)
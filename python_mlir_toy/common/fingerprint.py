@@ -0,0 +1,74 @@
+import hashlib
+import typing
+
+from python_mlir_toy.common import mlir_op, call_graph, location
+
+
+def get_local_fingerprint(func: mlir_op.FuncOp) -> str:
+    """Structural hash of func itself: values are numbered by SSA position and locations are left out."""
+    digest = hashlib.blake2b(digest_size=16)
+    # argument names are kept, they show up in the printed function
+    digest.update(repr((func.op_name, func.function_name, func.argument_names, func.function_type.get_key())).encode())
+    positions = {value: index for index, value in enumerate(func.argument_values)}
+    for op in func.body:
+        callee_name = op.callee.function_name if isinstance(op, mlir_op.GenericCallOp) else None
+        digest.update(repr((
+            op.op_name, [positions[value] for value in op.get_inputs()], [value.ty.get_key() for value in op.results],
+            op.get_attribute_key(), callee_name
+        )).encode())
+        for value in op.results:
+            positions[value] = len(positions)
+    return digest.hexdigest()
+
+
+def get_function_fingerprints(module: mlir_op.ModuleOp) -> typing.Dict[mlir_op.FuncOp, str]:
+    """Fingerprints that also cover everything a function may call, so editing a callee changes its callers too."""
+    graph = call_graph.CallGraph(module)
+    fingerprints: typing.Dict[mlir_op.FuncOp, str] = {}
+    # callees come first; the members of a recursive SCC share one digest over all of them
+    for scc in graph.get_sccs():
+        local_fingerprints = {func: get_local_fingerprint(func) for func in scc}
+        scc_digest = hashlib.blake2b(digest_size=16)
+        for func in sorted(scc, key=lambda item: item.function_name):
+            scc_digest.update(local_fingerprints[func].encode())
+        external_fingerprints = sorted({
+            fingerprints[callee] for func in scc for callee in graph.get_callees(func) if callee not in scc
+        })
+        for external_fingerprint in external_fingerprints:
+            scc_digest.update(external_fingerprint.encode())
+        for func in scc:
+            digest = hashlib.blake2b(scc_digest.digest(), digest_size=16)
+            digest.update(local_fingerprints[func].encode())
+            fingerprints[func] = digest.hexdigest()
+    return fingerprints
+
+
+def get_function_locations(func: mlir_op.FuncOp) -> typing.List[location.Location]:
+    return [func.loc, *func.argument_locs, *(op.loc for op in func.body)]
+
+
+def get_anchor_line(func: mlir_op.FuncOp) -> int:
+    return func.loc.line if isinstance(func.loc, location.FileLineColLocation) else 0
+
+
+def get_location_key(func: mlir_op.FuncOp) -> typing.Hashable:
+    # relative to the function, so a function that only moved within its file keeps its key
+    anchor_line = get_anchor_line(func)
+    return tuple(
+        (loc.filename, loc.line - anchor_line, loc.column) if isinstance(loc, location.FileLineColLocation) else None
+        for loc in get_function_locations(func)
+    )
+
+
+def shift_locations(func: mlir_op.FuncOp, line_delta: int):
+    def shift(loc: location.Location) -> location.Location:
+        if not isinstance(loc, location.FileLineColLocation):
+            return loc
+        return location.FileLineColLocation(loc.filename, loc.line + line_delta, loc.column)
+
+    if line_delta == 0:
+        return
+    func.loc = shift(func.loc)
+    func.argument_locs = [shift(loc) for loc in func.argument_locs]
+    for op in func.body:
+        op.loc = shift(op.loc)
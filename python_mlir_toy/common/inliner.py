@@ -0,0 +1,59 @@
+import typing
+
+from python_mlir_toy.common import pass_manager, mlir_op, block, call_graph, td
+
+
+def get_inline_cost(func: mlir_op.FuncOp) -> int:
+    # the terminator is replaced by the call results, so it is free
+    return len(func.body) - 1
+
+
+def is_inlinable(func: mlir_op.FuncOp) -> bool:
+    return len(func.body) > 0 and isinstance(func.body.last, td.IsTerminator)
+
+
+def inline_call(call: mlir_op.GenericCallOp, callee: mlir_op.FuncOp, builder: block.Builder):
+    value_map: typing.Dict[td.Value, td.Value] = dict(zip(callee.argument_values, call.get_inputs()))
+    terminator = callee.body.last
+    with builder.at(block.InsertionPoint.before_op(call)):
+        for op in callee.body:
+            if op is terminator:
+                break
+            builder.insert(op.clone(value_map))
+    call.replace_all_uses_with([value_map.get(value, value) for value in terminator.get_inputs()])
+    call.erase()
+
+
+class InlinerPass(pass_manager.ModulePass):
+    argument = 'inline'
+    description = 'Inline calls bottom-up over the call graph and remove functions that are no longer referenced'
+
+    threshold = pass_manager.Option(int, 100, 'Maximum number of callee ops to inline at a single call site')
+    keep = pass_manager.Option(
+        pass_manager.parse_list, ['main'], 'Functions kept even when they are not called', to_str=','.join
+    )
+
+    num_inlined = pass_manager.Statistic('num-inlined', 'Number of call sites inlined')
+    num_removed = pass_manager.Statistic('num-removed', 'Number of unreferenced functions removed')
+
+    def run_on_module(self, module: mlir_op.ModuleOp):
+        graph = call_graph.CallGraph(module)
+        builder = block.Builder()
+        inlined_callees = set()
+        # callees are visited before their callers, so they are already flattened when they get inlined
+        for scc in graph.get_sccs():
+            for func in scc:
+                for op in func.body:
+                    if not isinstance(op, mlir_op.GenericCallOp):
+                        continue
+                    callee = op.callee
+                    if callee in scc or not is_inlinable(callee) or get_inline_cost(callee) > self.threshold:
+                        continue
+                    inline_call(op, callee, builder)
+                    inlined_callees.add(callee)
+                    self.num_inlined += 1
+
+        # only the callees whose call sites were inlined are removed, functions that were never called are left to dce
+        self.num_removed += call_graph.erase_uncalled_funcs(
+            module, [func for func in inlined_callees if func.function_name.lstrip('@') not in self.keep]
+        )
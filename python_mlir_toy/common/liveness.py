@@ -0,0 +1,41 @@
+import typing
+
+from python_mlir_toy.common import mlir_op, td
+
+
+class Liveness:
+    """Last use of every value defined in a single-block function body."""
+
+    def __init__(self, func: mlir_op.FuncOp):
+        self.op_index: typing.Dict[mlir_op.Op, int] = {op: index for index, op in enumerate(func.body)}
+        self.last_use: typing.Dict[td.Value, typing.Optional[mlir_op.Op]] = {}
+        self.dying_values: typing.Dict[mlir_op.Op, typing.List[td.Value]] = {}
+
+        for value in func.argument_values:
+            self.add_value(value, None)
+        for op in func.body:
+            for value in op.get_outputs():
+                self.add_value(value, op)
+
+    def add_value(self, value: td.Value, definition: typing.Optional[mlir_op.Op]):
+        last_use = definition
+        last_index = self.op_index[definition] if definition is not None else -1
+        for use in value.uses:
+            index = self.op_index.get(use.op)
+            if index is not None and index > last_index:
+                last_use, last_index = use.op, index
+        self.last_use[value] = last_use
+        # an unused argument has no op to die at, it is dead on entry
+        if last_use is not None:
+            self.dying_values.setdefault(last_use, []).append(value)
+
+    def get_last_use(self, value: td.Value) -> typing.Optional[mlir_op.Op]:
+        """The last op reading value, or its defining op when it is never read."""
+        return self.last_use[value]
+
+    def is_last_use(self, value: td.Value, op: mlir_op.Op) -> bool:
+        return self.last_use.get(value) is op
+
+    def get_dying_values(self, op: mlir_op.Op) -> typing.List[td.Value]:
+        """Values that are dead once op has executed."""
+        return self.dying_values.get(op, [])
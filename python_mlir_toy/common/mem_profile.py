@@ -0,0 +1,180 @@
+import contextlib
+import gc
+import sys
+import tracemalloc
+import typing
+
+from python_mlir_toy.common import timing
+
+# instances counted after each phase, by the module and class they are defined in; a module that is not loaded has
+# no instances, so nothing is imported just to count them
+tracked_types = {
+    'ExprAST': ('python_mlir_toy.ch1.ast', 'ExprAST'),
+    'Location': ('python_mlir_toy.ch1.lexer', 'Location'),
+    'location.Location': ('python_mlir_toy.common.location', 'Location'),
+    'td.Value': ('python_mlir_toy.common.td', 'Value'),
+    'Type': ('python_mlir_toy.common.mlir_type', 'Type'),
+    'Op': ('python_mlir_toy.common.mlir_op', 'Op'),
+}
+
+
+# allocations of the profiler itself are not reported
+profiler_files = {tracemalloc.__file__, timing.__file__, __file__}
+
+
+class AllocationSite(typing.NamedTuple):
+    site: str
+    size: int
+    count: int
+
+
+class MemoryNode(timing.TimingNode):
+    def __init__(self, name: str):
+        super().__init__(name)
+        # highest traced memory during the phase and traced memory left at its end, relative to its start
+        self.peak_bytes = 0
+        self.retained_bytes = 0
+        # only filled for top level phases, snapshots of every pass on every function would take forever
+        self.top_sites: typing.List[AllocationSite] = []
+        self.object_counts: typing.Dict[str, int] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            **super().to_dict(), 'peak_bytes': self.peak_bytes, 'retained_bytes': self.retained_bytes,
+            'top_sites': [site._asdict() for site in self.top_sites], 'object_counts': self.object_counts,
+        }
+
+
+class MemoryFrame:
+    def __init__(self, start_bytes: int):
+        self.start_bytes = start_bytes
+        # tracemalloc has a single peak, which each nested phase resets, so every frame keeps the peak of its
+        # finished children
+        self.peak_bytes = start_bytes
+
+
+def count_objects() -> typing.Dict[str, int]:
+    types = {}
+    for name, (module_name, cls_name) in tracked_types.items():
+        module = sys.modules.get(module_name)
+        if module is not None:
+            types[name] = getattr(module, cls_name)
+    counts = dict.fromkeys(types, 0)
+    # the heap has few distinct types, so the subclass checks are done once per type instead of once per object
+    type_names: typing.Dict[type, typing.List[str]] = {}
+    for obj in gc.get_objects():
+        obj_type = type(obj)
+        names = type_names.get(obj_type)
+        if names is None:
+            names = [name for name, cls in types.items() if issubclass(obj_type, cls)]
+            type_names[obj_type] = names
+        for name in names:
+            counts[name] += 1
+    return counts
+
+
+class MemoryProfiler(timing.Timer):
+    """A timer whose phases also record tracemalloc peak and retained bytes, the allocation sites of what top level
+    phases retain, and the number of live compiler objects after them."""
+
+    node_cls = MemoryNode
+
+    def __init__(self, num_top_sites: int = 5, num_frames: int = 1):
+        self.num_top_sites = num_top_sites
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start(num_frames)
+        self.stopped = False
+        super().__init__()
+        self.memory_frames = [MemoryFrame(tracemalloc.get_traced_memory()[0])]
+
+    def enter_frame(self):
+        current, peak = tracemalloc.get_traced_memory()
+        parent = self.memory_frames[-1]
+        parent.peak_bytes = max(parent.peak_bytes, peak)
+        tracemalloc.reset_peak()
+        self.memory_frames.append(MemoryFrame(current))
+
+    def exit_frame(self, node: MemoryNode):
+        current, peak = tracemalloc.get_traced_memory()
+        frame = self.memory_frames.pop()
+        peak = max(frame.peak_bytes, peak)
+        node.peak_bytes = max(node.peak_bytes, peak - frame.start_bytes)
+        node.retained_bytes += current - frame.start_bytes
+        if self.memory_frames:
+            parent = self.memory_frames[-1]
+            parent.peak_bytes = max(parent.peak_bytes, peak)
+
+    @contextlib.contextmanager
+    def scope(self, name: str):
+        node = self.stack[-1].child(name)
+        top_level = len(self.stack) == 1
+        # snapshots cost time in the number of traced blocks, they are skipped when no sites are reported
+        snapshot = tracemalloc.take_snapshot() if top_level and self.num_top_sites > 0 else None
+        self.enter_frame()
+        try:
+            with super().scope(name):
+                yield node
+        finally:
+            self.exit_frame(node)
+            if snapshot is not None:
+                # filtering the statistics is much faster than filtering the traces of the snapshots
+                stats = [
+                    stat for stat in tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+                    if stat.size_diff > 0 and stat.traceback[0].filename not in profiler_files
+                ]
+                node.top_sites = [
+                    AllocationSite(str(stat.traceback), stat.size_diff, stat.count_diff)
+                    for stat in stats[:self.num_top_sites]
+                ]
+            if top_level:
+                node.object_counts = count_objects()
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        super().stop()
+        self.exit_frame(self.root)
+        self.root.object_counts = count_objects()
+        if self.started_tracing:
+            tracemalloc.stop()
+
+    def report(self, file: typing.TextIO = sys.stderr, report_format: str = 'table'):
+        super().report(file, report_format)
+        if report_format == 'json':
+            return
+
+        separator = '===' + '-' * 73 + '==='
+        print(separator, file=file)
+        print('... Memory report ...'.center(len(separator)).rstrip(), file=file)
+        print(separator, file=file)
+        print('  ----Peak Bytes----  ----Retained Bytes----  ----Name----', file=file)
+
+        def print_line(node: MemoryNode, level: int):
+            print(f'  {node.peak_bytes:18d}  {node.retained_bytes:22d}  {"  " * level}{node.name}', file=file)
+
+        def print_tree(node: MemoryNode, level: int):
+            print_line(node, level)
+            for child in node.children.values():
+                print_tree(child, level + 1)
+
+        for child in self.root.children.values():
+            print_tree(child, 0)
+        print_line(self.root, 0)
+
+        for node in self.root.children.values():
+            if not node.top_sites:
+                continue
+            print(file=file)
+            print(f'  Top retained allocation sites of {node.name}:', file=file)
+            for site in node.top_sites:
+                print(f'  {site.size:18d} bytes in {site.count:8d} blocks  {site.site}', file=file)
+
+        type_names = list(self.root.object_counts)
+        print(file=file)
+        print('  Live objects after each phase:', file=file)
+        print('  ' + ''.join(f'{name:>18}' for name in type_names) + '  ----Name----', file=file)
+        for node in [*self.root.children.values(), self.root]:
+            counts = ''.join(f'{node.object_counts.get(name, 0):18d}' for name in type_names)
+            print(f'  {counts}  {node.name}', file=file)
@@ -1,7 +1,12 @@
+import hashlib
 import typing
 
 from python_mlir_toy.common import serializable, tools, mlir_type
 
+if typing.TYPE_CHECKING:
+    # parsed and printed literals stay python lists, numpy is imported once a payload is needed as an array
+    import numpy as np
+
 
 class Literal(serializable.TextSerializable):
     name = None
@@ -15,6 +20,12 @@ class Literal(serializable.TextSerializable):
         assert self.name is None
         return mlir_type.NoneType()
 
+    def get_key(self) -> typing.Hashable:
+        return (type(self),)
+
+    def is_equivalent(self, other: 'Literal') -> bool:
+        return self.get_key() == other.get_key()
+
     def print(self, dst: serializable.TextPrinter):
         if self.name is not None:
             dst.print(self.name, end='')
@@ -34,6 +45,9 @@ class FloatLiteral(Literal):
     def get_type(self):
         return mlir_type.Float64Type()
 
+    def get_key(self) -> typing.Hashable:
+        return type(self), self.value
+
     def print(self, dst: serializable.TextPrinter):
         dst.print(self.value, end='')
 
@@ -47,13 +61,68 @@ class FloatLiteral(Literal):
 class TensorLiteral(Literal):
     name = 'tensor'
 
-    def __init__(self, shape: typing.List[int], values: typing.List[float]):
+    def __init__(self, shape: typing.List[int], values: typing.List[float] = None, array: 'np.ndarray' = None):
+        assert values is not None or array is not None
         self.shape = shape
-        self.values = values
+        self._values = values
+        self._array = array
+        self._digest = None
+        if array is not None:
+            self._array = self.get_frozen_array(array)
+
+    @staticmethod
+    def get_frozen_array(array: 'np.ndarray') -> 'np.ndarray':
+        # the buffer is shared by every user of the literal, so it is kept read-only; freezing the caller's array in
+        # place would break the caller, so anything that can still be written to is copied first
+        import numpy as np
+        owner = array
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        if array.dtype != np.float64 or array.flags.writeable or owner.flags.writeable or owner.base is not None:
+            array = np.array(array, dtype=np.float64)
+            array.flags.writeable = False
+        return array
+
+    @classmethod
+    def from_array(cls, array: 'np.ndarray') -> 'TensorLiteral':
+        import numpy as np
+        array = np.asarray(array)
+        return cls(list(array.shape), array=array)
+
+    @property
+    def values(self) -> typing.List[float]:
+        if self._values is None:
+            self._values = self._array.tolist()
+        return self._values
+
+    def to_array(self) -> 'np.ndarray':
+        # the buffer is shared by every user of the literal, so it is kept read-only
+        if self._array is None:
+            import numpy as np
+            array = np.asarray(self._values, dtype=np.float64).reshape(self.shape)
+            array.flags.writeable = False
+            self._array = array
+        return self._array
 
     def get_type(self):
         return mlir_type.RankedF64TensorType(self.shape)
 
+    def get_digest(self) -> bytes:
+        # literals are immutable, so the digest of a large payload is computed once
+        if self._digest is None:
+            self._digest = hashlib.blake2b(self.to_array().tobytes(), digest_size=16).digest()
+        return self._digest
+
+    def get_key(self) -> typing.Hashable:
+        return type(self), tuple(self.shape), self.get_digest()
+
+    def is_equivalent(self, other: 'Literal') -> bool:
+        import numpy as np
+        return self.get_key() == other.get_key() and np.array_equal(self.to_array(), other.to_array())
+
+    def reshape(self, shape: typing.List[int]) -> 'TensorLiteral':
+        return type(self)(list(shape), array=self.to_array().reshape(shape))
+
     def print(self, dst: serializable.TextPrinter):
         dst.print(f'{self.name}<[', end='')
         for value in tools.with_sep(self.values, lambda: dst.print(',')):
@@ -73,10 +142,18 @@ class TensorLiteral(Literal):
 
             if src.last_token() == '[':
                 result.append(TensorLiteral.parse_tensor(src))
+                continue
+
+            sign = 1.0
+            if src.last_token() == '-':
+                src.drop_token()
+                sign = -1.0
+            if src.last_token() in ('inf', 'nan'):
+                result.append(sign * float(src.last_token()))
             else:
                 assert src.last_token_kind() == serializable.TokenKind.Number
-                result.append(float(src.last_token()))
-                src.drop_token()
+                result.append(sign * float(src.last_token()))
+            src.drop_token()
 
         src.drop_token(']')
         return result
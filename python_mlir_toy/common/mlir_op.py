@@ -1,22 +1,63 @@
+import copy
+import importlib
+import io
 import sys
 import typing
 
 from python_mlir_toy.common import serializable, td, location, scoped_text_printer, scoped_text_parser, bounded_format, \
-    mlir_type
+    mlir_type, block
+
+
+class VerifyError(Exception):
+    pass
+
+
+class Operand:
+    def __init__(self, index: int):
+        self.index = index
+
+    def __get__(self, op, owner=None):
+        if op is None:
+            return self
+        return op.operands[self.index] if self.index < len(op.operands) else None
+
+    def __set__(self, op, value: td.Value):
+        op.set_operand(self.index, value)
+
+
+class Result:
+    def __init__(self, index: int):
+        self.index = index
+
+    def __get__(self, op, owner=None):
+        if op is None:
+            return self
+        return op.results[self.index]
 
 
 class Op(serializable.TextSerializable):
     op_name: str = None
     op_name_suffix: str = ' '
     op_type_dict: typing.Dict[str, typing.Type['Op']] = {}
+    # dialect namespace -> module defining its ops, imported by the first lookup of one of them
+    dialect_module_dict: typing.Dict[str, str] = {}
 
     @staticmethod
     def register_op_cls(name: str, cls: typing.Type['Op']):
         assert name not in Op.op_type_dict
         Op.op_type_dict[name] = cls
 
+    @staticmethod
+    def register_dialect_module(dialect: str, module_name: str):
+        assert Op.dialect_module_dict.get(dialect, module_name) == module_name
+        Op.dialect_module_dict[dialect] = module_name
+
     @staticmethod
     def get_op_cls(op_name: str) -> typing.Type['Op']:
+        if op_name not in Op.op_type_dict and '.' in op_name:
+            module_name = Op.dialect_module_dict.get(op_name.split('.', 1)[0])
+            if module_name is not None:
+                importlib.import_module(module_name)
         assert op_name in Op.op_type_dict
         return Op.op_type_dict[op_name]
 
@@ -24,19 +65,109 @@ class Op(serializable.TextSerializable):
         if cls.op_name is not None:
             Op.register_op_cls(cls.op_name, cls)
 
-    def __init__(self, loc: location.Location):
+    def __init__(
+            self, loc: location.Location, operands: typing.List[td.Value] = None,
+            result_types: typing.List[mlir_type.Type] = None
+    ):
         self.loc = loc
+        self.parent_block: typing.Optional[block.Block] = None
+        self.prev_op: typing.Optional[Op] = None
+        self.next_op: typing.Optional[Op] = None
+        self.order_index = block.Block.invalid_order
+        self.operands: typing.List[td.Value] = []
+        self.results = [td.Value(ty, self) for ty in result_types] if result_types is not None else []
+        if operands is not None:
+            self.set_operands(operands)
 
     def get_inputs(self) -> typing.List[td.Value]:
-        raise NotImplementedError('get_inputs is not implemented')
+        return self.operands
 
     def get_outputs(self) -> typing.List[td.Value]:
-        raise NotImplementedError('get_outputs is not implemented')
+        return self.results
+
+    def set_operand(self, index: int, value: td.Value):
+        assert isinstance(value, td.Value)
+        self.operands[index].remove_use(self, index)
+        self.operands[index] = value
+        value.add_use(self, index)
+
+    def set_operands(self, values: typing.List[td.Value]):
+        self.drop_all_references()
+        for index, value in enumerate(values):
+            assert isinstance(value, td.Value)
+            self.operands.append(value)
+            value.add_use(self, index)
+
+    def drop_all_references(self):
+        for index, value in enumerate(self.operands):
+            value.remove_use(self, index)
+        self.operands = []
+
+    def use_empty(self) -> bool:
+        return all(result.use_empty() for result in self.results)
+
+    def replace_all_uses_with(self, values: typing.List[td.Value]):
+        assert len(values) == len(self.results)
+        for result, value in zip(self.results, values):
+            result.replace_all_uses_with(value)
+
+    def verify(self):
+        for index, value in enumerate(self.operands):
+            if td.Use(self, index) not in value.uses:
+                raise VerifyError(f'{self.op_name}: operand #{index} is missing from its use list {self.loc}')
+        for result in self.results:
+            if result.owner is not self:
+                raise VerifyError(f'{self.op_name}: result is owned by another op {self.loc}')
+
+    def clone(self, value_map: typing.Dict[td.Value, td.Value] = None) -> 'Op':
+        # operands are remapped through value_map, and the new results are recorded in it
+        value_map = {} if value_map is None else value_map
+        new_op = copy.copy(self)
+        new_op.parent_block = None
+        new_op.prev_op = None
+        new_op.next_op = None
+        new_op.order_index = block.Block.invalid_order
+        new_op.operands = []
+        new_op.results = [td.Value(result.ty, new_op) for result in self.results]
+        value_map.update(zip(self.results, new_op.results))
+        new_op.set_operands([value_map.get(value, value) for value in self.operands])
+        return new_op
+
+    def get_parent_op(self) -> typing.Optional['Op']:
+        return self.parent_block.parent_op if self.parent_block is not None else None
+
+    def is_before_in_block(self, other: 'Op') -> bool:
+        assert self.parent_block is not None
+        return self.parent_block.is_before_in_block(self, other)
+
+    def remove_from_parent(self):
+        if self.parent_block is not None:
+            self.parent_block.remove(self)
+
+    def erase(self):
+        assert self.use_empty(), 'erasing an op whose results are still in use'
+        self.remove_from_parent()
+        self.drop_all_references()
 
     @classmethod
     def get_format_list(cls) -> typing.List[bounded_format.Format]:
         raise NotImplementedError('get_format_list is not implemented')
 
+    @classmethod
+    def get_canonicalization_patterns(cls) -> list:
+        return []
+
+    def get_attribute_key(self) -> typing.Hashable:
+        # everything besides operands and result types that distinguishes two ops of the same name
+        return ()
+
+    def has_equivalent_attributes(self, other: 'Op') -> bool:
+        return self.get_attribute_key() == other.get_attribute_key()
+
+    def fold(self, operand_constants: typing.List[typing.Any]) -> typing.Any:
+        # returns an existing value or a constant payload for the single result, None when nothing folds
+        return None
+
     def print(self, dst: scoped_text_printer.ScopedTextPrinter):
         format_list = self.get_format_list()
         for format_item in format_list:
@@ -55,15 +186,15 @@ class GeneralOp(Op):
     def __init__(
             self, loc: location.Location, inputs: typing.List[td.Value], output_types: typing.List[mlir_type.Type]
     ):
-        super().__init__(loc=loc)
-        self.inputs = inputs
-        self.outputs = [td.Value(ty) for ty in output_types]
+        super().__init__(loc=loc, operands=inputs, result_types=output_types)
 
-    def get_inputs(self) -> typing.List[td.Value]:
-        return self.inputs
+    @property
+    def inputs(self) -> typing.List[td.Value]:
+        return self.operands
 
-    def get_outputs(self) -> typing.List[td.Value]:
-        return self.outputs
+    @property
+    def outputs(self) -> typing.List[td.Value]:
+        return self.results
 
     @classmethod
     def get_format_list(cls):
@@ -72,22 +203,19 @@ class GeneralOp(Op):
 
 
 class BinaryOp(Op):
+    lhs = Operand(0)
+    rhs = Operand(1)
+    output = Result(0)
+
     def __init__(
             self, loc: location.Location, lhs: td.Value, rhs: td.Value, output_types: typing.List[mlir_type.Type] = None
     ):
-        super().__init__(loc=loc)
-        self.lhs = lhs
-        self.rhs = rhs
         assert lhs.ty == rhs.ty
-        self.output = td.Value(output_types[0] if output_types is not None else lhs.ty)
+        super().__init__(loc=loc, operands=[lhs, rhs], result_types=[
+            output_types[0] if output_types is not None else lhs.ty
+        ])
         assert lhs.ty <= self.output.ty
 
-    def get_inputs(self) -> typing.List[td.Value]:
-        return [self.lhs, self.rhs]
-
-    def get_outputs(self) -> typing.List[td.Value]:
-        return [self.output]
-
     @classmethod
     def get_format_list(cls):
         return [bounded_format.BoundedInputFormat('lhs', end=''), bounded_format.ConstantStrFormat(','),
@@ -101,7 +229,7 @@ class FuncOp(Op):
     def __init__(
             self, loc: location.Location, function_type: mlir_type.FunctionType, function_name: str,
             argument_names: typing.List[str], argument_values: typing.List[td.Value],
-            argument_locs: typing.List[location.Location], body: typing.List[Op]
+            argument_locs: typing.List[location.Location], body: typing.Union[block.Block, typing.List[Op]]
     ):
         super().__init__(loc=loc)
         assert len(function_type.inputs) == len(argument_names)
@@ -111,7 +239,43 @@ class FuncOp(Op):
         self.argument_names = argument_names
         self.argument_locs = argument_locs
         self.argument_values = argument_values
-        self.body = body
+        self.body = body if isinstance(body, block.Block) else block.Block(body)
+        self.body.parent_op = self
+
+    @classmethod
+    def create_declaration(cls, function_name: str, function_type: mlir_type.FunctionType):
+        argument_values = [td.Value(ty) for ty in function_type.inputs]
+        return cls(
+            location.UnknownLocation(), function_type, function_name,
+            [f'%arg{index}' for index in range(len(argument_values))], argument_values,
+            [location.UnknownLocation() for _ in argument_values], []
+        )
+
+    def clone(self, value_map: typing.Dict[td.Value, td.Value] = None) -> 'FuncOp':
+        value_map = {} if value_map is None else value_map
+        argument_values = [td.Value(value.ty) for value in self.argument_values]
+        value_map.update(zip(self.argument_values, argument_values))
+        body = block.Block(op.clone(value_map) for op in self.body)
+        function_type = mlir_type.FunctionType(list(self.function_type.inputs), list(self.function_type.outputs))
+        return type(self)(
+            self.loc, function_type, self.function_name, list(self.argument_names), argument_values,
+            list(self.argument_locs), body
+        )
+
+    def get_callees(self) -> typing.Dict[str, 'FuncOp']:
+        return {op.callee.function_name: op.callee for op in self.body if isinstance(op, GenericCallOp)}
+
+    def verify(self):
+        super().verify()
+        defined_values = set(self.argument_values)
+        for op in self.body:
+            for value in op.get_inputs():
+                if value not in defined_values:
+                    raise VerifyError(f'{op.op_name}: operand does not dominate its use {op.loc}')
+            op.verify()
+            defined_values.update(op.get_outputs())
+        if not isinstance(self.body.last, td.IsTerminator):
+            raise VerifyError(f'{self.function_name}: body must end with a terminator {self.loc}')
 
     @classmethod
     def get_format_list(cls):
@@ -125,18 +289,18 @@ class GenericCallOp(Op):
             self, loc: location.Location, callee: FuncOp, inputs: typing.List[td.Value],
             callee_type: mlir_type.FunctionType = None
     ):
-        super().__init__(loc=loc)
+        super().__init__(loc=loc, operands=inputs, result_types=callee.function_type.outputs)
         self.callee = callee
-        self.inputs = inputs
-        self.outputs = [td.Value(ty) for ty in callee.function_type.outputs]
         assert len(inputs) == len(callee.function_type.inputs)
         assert callee_type is None or callee_type <= callee.function_type
 
-    def get_inputs(self) -> typing.List[td.Value]:
-        return self.inputs
+    @property
+    def inputs(self) -> typing.List[td.Value]:
+        return self.operands
 
-    def get_outputs(self) -> typing.List[td.Value]:
-        return self.outputs
+    @property
+    def outputs(self) -> typing.List[td.Value]:
+        return self.results
 
     @classmethod
     def get_format_list(cls):
@@ -148,9 +312,15 @@ class GenericCallOp(Op):
 class ModuleOp(Op):
     op_name = 'module'
 
-    def __init__(self, loc: location.Location, body: typing.List[Op]):
+    def __init__(self, loc: location.Location, body: typing.Union[block.Block, typing.List[Op]]):
         super().__init__(loc=loc)
-        self.body = body
+        self.body = body if isinstance(body, block.Block) else block.Block(body)
+        self.body.parent_op = self
+
+    def verify(self):
+        super().verify()
+        for op in self.body:
+            op.verify()
 
     @classmethod
     def get_format_list(cls):
@@ -164,3 +334,22 @@ class ModuleOp(Op):
 
 def parse_module(src: scoped_text_parser.ScopedTextParser):
     return ModuleOp.parse(src)
+
+
+def print_function(func: FuncOp) -> str:
+    file = io.StringIO()
+    printer = scoped_text_printer.ScopedTextPrinter(file=file)
+    for callee_name, callee in func.get_callees().items():
+        printer.insert_value_name(callee, callee_name)
+    printer.print(func.op_name)
+    func.print(printer)
+    return file.getvalue()
+
+
+def parse_function(text: str, callees: typing.Dict[str, FuncOp], filename: str = 'unknown') -> FuncOp:
+    src = scoped_text_parser.ScopedTextParser(io.StringIO(text), filename)
+    for callee_name, callee in callees.items():
+        src.define_var(callee_name, callee)
+    op_cls = Op.get_op_cls(bounded_format.parse_namespaced_symbol(src))
+    assert issubclass(op_cls, FuncOp)
+    return op_cls.parse(src)
@@ -18,6 +18,10 @@ class Type(serializable.TextSerializable):
     def __eq__(self, other):
         return other <= self <= other
 
+    def get_key(self) -> typing.Hashable:
+        # types compare with <=, so they are not hashable themselves; equal types have equal keys
+        return (type(self),)
+
     def print(self, dst: TextPrinter):
         if self.name is not None:
             dst.print(self.name, end='')
@@ -43,6 +47,9 @@ class OpaqueType(Type):
         self.dialect = dialect
         self.type_name = type_name
 
+    def get_key(self) -> typing.Hashable:
+        return type(self), self.dialect, self.type_name
+
     def print(self, dst: TextPrinter):
         print_dialect_symbol(dst, '!', self.dialect, self.type_name)
 
@@ -59,6 +66,9 @@ class IntType(Type):
     def __le__(self, other):
         return super().__le__(other) and self.bits == other.bits and self.signed == other.signed
 
+    def get_key(self) -> typing.Hashable:
+        return type(self), self.bits, self.signed
+
     def print(self, dst: TextPrinter):
         dst.print(f'{"s" if self.signed else "u"}{self.bits}i', end='')
 
@@ -87,6 +97,9 @@ class TensorType(Type):
     def __le__(self, other):
         return super().__le__(other) and self.element_type == other.element_type
 
+    def get_key(self) -> typing.Hashable:
+        return type(self), self.element_type.get_key()
+
     def print(self, dst: TextPrinter):
         dst.print(f'tensor<*x', end='')
         self.element_type.print(dst)
@@ -108,6 +121,9 @@ class RankedTensorType(TensorType):
         else:
             return False
 
+    def get_key(self) -> typing.Hashable:
+        return type(self), self.element_type.get_key(), tuple(self.shape)
+
     def print(self, dst: TextPrinter):
         dst.print('tensor<', end='')
         for dim in tools.with_sep(self.shape, lambda: dst.print('x', end='')):
@@ -160,6 +176,9 @@ class FunctionType(Type):
             input_ty <= other_input_ty for input_ty, other_input_ty in zip(self.inputs, other.inputs)
         )
 
+    def get_key(self) -> typing.Hashable:
+        return type(self), tuple(ty.get_key() for ty in self.inputs), tuple(ty.get_key() for ty in self.outputs)
+
     def print(self, dst: TextPrinter):
         dst.print('(', end='')
         for input_ty in tools.with_sep(self.inputs, lambda: dst.print(',')):
@@ -192,7 +211,7 @@ def print_type_list(
 def parse_type_list(src: TextParser, sep: str = ','):
     if src.last_token() == '(':
         src.drop_token()
-        type_list = [parse_type(src)]
+        type_list = []
         while src.last_token() != ')':
             if src.last_token() == sep:
                 src.drop_token()
@@ -0,0 +1,435 @@
+import functools
+import importlib
+import io
+import sys
+import time
+import typing
+
+from python_mlir_toy.common import mlir_op, mlir_type, timing, scoped_text_parser, fingerprint
+
+if typing.TYPE_CHECKING:
+    from python_mlir_toy.common import compile_cache
+
+
+class Statistic:
+    def __init__(self, name: str, description: str = ''):
+        self.name = name
+        self.description = description
+
+    def __get__(self, pass_obj, owner=None):
+        if pass_obj is None:
+            return self
+        return pass_obj.statistic_values.get(self.name, 0)
+
+    def __set__(self, pass_obj, value: int):
+        pass_obj.statistic_values[self.name] = value
+
+
+def parse_bool(text: str) -> bool:
+    if text.lower() in ('1', 'true', 'on'):
+        return True
+    elif text.lower() in ('0', 'false', 'off'):
+        return False
+    raise ValueError(f'invalid boolean option value: {text}')
+
+
+def parse_list(text: str) -> typing.List[str]:
+    return [item for item in text.split(',') if item]
+
+
+class Option:
+    def __init__(
+            self, ty: typing.Callable[[str], typing.Any], default, description: str = '',
+            to_str: typing.Callable[[typing.Any], str] = str
+    ):
+        self.ty = ty
+        self.default = default
+        self.description = description
+        self.to_str = to_str
+        self.attr_name = None
+
+    def __set_name__(self, owner, name: str):
+        self.attr_name = name
+
+    def __get__(self, pass_obj, owner=None):
+        if pass_obj is None:
+            return self
+        return pass_obj.option_values.get(self.attr_name, self.default)
+
+    def __set__(self, pass_obj, value):
+        pass_obj.option_values[self.attr_name] = self.ty(value) if isinstance(value, str) else value
+
+
+class Pass:
+    argument: str = None
+    description: str = ''
+    pass_type_dict: typing.Dict[str, typing.Type['Pass']] = {}
+    # pass argument -> module defining the pass, imported by the first lookup of the argument
+    pass_module_dict: typing.Dict[str, str] = {}
+
+    @staticmethod
+    def register_pass_cls(argument: str, cls: typing.Type['Pass']):
+        assert argument not in Pass.pass_type_dict
+        Pass.pass_type_dict[argument] = cls
+
+    @staticmethod
+    def register_pass_module(argument: str, module_name: str):
+        assert Pass.pass_module_dict.get(argument, module_name) == module_name
+        Pass.pass_module_dict[argument] = module_name
+
+    @staticmethod
+    def get_pass_cls(argument: str) -> typing.Type['Pass']:
+        if argument not in Pass.pass_type_dict and argument in Pass.pass_module_dict:
+            importlib.import_module(Pass.pass_module_dict[argument])
+        if argument not in Pass.pass_type_dict:
+            raise ValueError(f'unknown pass: {argument}')
+        return Pass.pass_type_dict[argument]
+
+    def __init_subclass__(cls):
+        if cls.argument is not None:
+            Pass.register_pass_cls(cls.argument, cls)
+
+    def __init__(self, **options):
+        self.statistic_values: typing.Dict[str, int] = {}
+        self.option_values: typing.Dict[str, typing.Any] = {}
+        for key, value in options.items():
+            option = self.get_option_dict().get(key.replace('-', '_'))
+            if option is None:
+                raise ValueError(f'unknown option for pass {self.argument}: {key}')
+            setattr(self, option.attr_name, value)
+
+    @classmethod
+    def get_option_dict(cls) -> typing.Dict[str, Option]:
+        ret = {}
+        for klass in reversed(cls.__mro__):
+            ret.update({name: value for name, value in vars(klass).items() if isinstance(value, Option)})
+        return ret
+
+    @classmethod
+    def get_statistic_list(cls) -> typing.List[Statistic]:
+        ret = {}
+        for klass in reversed(cls.__mro__):
+            ret.update({value.name: value for value in vars(klass).values() if isinstance(value, Statistic)})
+        return list(ret.values())
+
+    def get_name(self) -> str:
+        return type(self).__name__
+
+    def to_spec(self) -> str:
+        option_dict = self.get_option_dict()
+        options = ' '.join(
+            f'{key.replace("_", "-")}={option_dict[key].to_str(value)}' for key, value in self.option_values.items()
+        )
+        return f'{self.argument}{{{options}}}' if options else self.argument
+
+    def merge_statistics(self, statistic_values: typing.Dict[str, int]):
+        for name, value in statistic_values.items():
+            self.statistic_values[name] = self.statistic_values.get(name, 0) + value
+
+
+class ModulePass(Pass):
+    def run_on_module(self, module: mlir_op.ModuleOp):
+        raise NotImplementedError('run_on_module is not implemented')
+
+
+class FunctionPass(Pass):
+    def run_on_function(self, func: mlir_op.FuncOp):
+        raise NotImplementedError('run_on_function is not implemented')
+
+
+class FunctionPassManager:
+    anchor_names = ('func', 'toy.func')
+
+    def __init__(self):
+        self.passes: typing.List[FunctionPass] = []
+
+    def add_pass(self, pass_obj: FunctionPass):
+        assert isinstance(pass_obj, FunctionPass)
+        self.passes.append(pass_obj)
+        return pass_obj
+
+    def to_spec(self) -> str:
+        return f'func({",".join(pass_obj.to_spec() for pass_obj in self.passes)})'
+
+    def get_pass_list(self) -> typing.List[Pass]:
+        return list(self.passes)
+
+    def run_on_function(self, func: mlir_op.FuncOp, timer=timing.null_timer):
+        for pass_obj in self.passes:
+            with timer.scope(pass_obj.get_name()):
+                pass_obj.run_on_function(func)
+
+    def run(
+            self, module: mlir_op.ModuleOp, timer=timing.null_timer, num_workers: int = 1,
+            function_cache: 'compile_cache.CompileCache' = None
+    ):
+        funcs = [op for op in module.body if isinstance(op, mlir_op.FuncOp)]
+        with timer.scope("'func' Pipeline") as timing_node:
+            if function_cache is not None:
+                self.run_cached(module, funcs, function_cache, timer)
+            elif num_workers <= 1 or len(funcs) < 2:
+                for func in funcs:
+                    self.run_on_function(func, timer)
+            else:
+                self.run_parallel(module, funcs, num_workers, timing_node)
+
+    def run_parallel(
+            self, module: mlir_op.ModuleOp, funcs: typing.List[mlir_op.FuncOp], num_workers: int,
+            timing_node: typing.Optional[timing.TimingNode]
+    ):
+        # functions travel as printed IR plus the signatures of their callees, and come back the same way
+        jobs = [
+            (mlir_op.print_function(func), [
+                (callee_name, callee.op_name, str(callee.function_type))
+                for callee_name, callee in func.get_callees().items()
+            ]) for func in funcs
+        ]
+        chunk_size = max(1, -(-len(jobs) // (num_workers * 4)))
+        chunks = [jobs[begin:begin + chunk_size] for begin in range(0, len(jobs), chunk_size)]
+        module_names = sorted(
+            {type(op).__module__ for func in funcs for op in (func, *func.body)} |
+            {type(pass_obj).__module__ for pass_obj in self.passes}
+        )
+        # process pools are only imported by the pipelines that use them, they are a large part of the startup time
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(
+                num_workers, initializer=_init_function_pipeline_worker, initargs=(module_names,)
+        ) as executor:
+            chunk_results = list(executor.map(functools.partial(_run_function_pipeline_chunk, self.to_spec()), chunks))
+
+        texts = []
+        for chunk_texts, statistic_values_list, timing_root in chunk_results:
+            texts.extend(chunk_texts)
+            for pass_obj, statistic_values in zip(self.passes, statistic_values_list):
+                pass_obj.merge_statistics(statistic_values)
+            if timing_node is not None:
+                for child in timing_root.children.values():
+                    timing_node.child(child.name).merge(child)
+
+        old_funcs = {func.function_name: func for func in funcs}
+        new_funcs = {}
+        for old_func, text in zip(funcs, texts):
+            new_func = mlir_op.parse_function(text, old_funcs)
+            module.body.insert_before(old_func, new_func)
+            old_func.remove_from_parent()
+            new_funcs[new_func.function_name] = new_func
+        for new_func in new_funcs.values():
+            for op in new_func.body:
+                if isinstance(op, mlir_op.GenericCallOp) and op.callee.function_name in new_funcs:
+                    op.callee = new_funcs[op.callee.function_name]
+
+    def run_cached(
+            self, module: mlir_op.ModuleOp, funcs: typing.List[mlir_op.FuncOp],
+            function_cache: 'compile_cache.CompileCache', timer=timing.null_timer
+    ):
+        from python_mlir_toy.common import compile_cache
+
+        # a function pipeline only sees its callees as declarations, so a function whose fingerprint (which covers its
+        # callees) and relative locations are unchanged comes out the same as last time, up to a line shift
+        fingerprints = fingerprint.get_function_fingerprints(module)
+        spec = self.to_spec()
+        new_funcs = {}
+        for func in funcs:
+            key_bytes = repr((fingerprints[func], fingerprint.get_location_key(func))).encode()
+            key = compile_cache.get_cache_key(key_bytes, func.function_name, 'func', spec)
+            cached = function_cache.get(key)
+            if cached is None:
+                start = time.perf_counter()
+                self.run_on_function(func, timer)
+                function_cache.put(key, mlir_op.print_function(func).encode(), time.perf_counter() - start)
+                continue
+
+            new_func = mlir_op.parse_function(cached.decode(), func.get_callees())
+            fingerprint.shift_locations(
+                new_func, fingerprint.get_anchor_line(func) - fingerprint.get_anchor_line(new_func)
+            )
+            module.body.insert_before(func, new_func)
+            func.remove_from_parent()
+            new_funcs[func] = new_func
+        function_cache.flush()
+        for op in module.body:
+            if isinstance(op, mlir_op.FuncOp):
+                for call in op.body:
+                    if isinstance(call, mlir_op.GenericCallOp) and call.callee in new_funcs:
+                        call.callee = new_funcs[call.callee]
+
+
+def _init_function_pipeline_worker(module_names: typing.List[str]):
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+
+def _run_function_pipeline_chunk(pipeline_spec: str, jobs: typing.List[typing.Tuple[str, list]]):
+    fpm = parse_pass_pipeline(pipeline_spec, verify_each=False).passes[0]
+    assert isinstance(fpm, FunctionPassManager)
+    timer = timing.Timer()
+    texts = []
+    for func_text, declarations in jobs:
+        callees = {}
+        for callee_name, op_name, type_text in declarations:
+            function_type = mlir_type.parse_function_type(scoped_text_parser.ScopedTextParser(io.StringIO(type_text)))
+            callees[callee_name] = mlir_op.Op.get_op_cls(op_name).create_declaration(callee_name, function_type)
+        func = mlir_op.parse_function(func_text, callees)
+        fpm.run_on_function(func, timer)
+        texts.append(mlir_op.print_function(func))
+    return texts, [pass_obj.statistic_values for pass_obj in fpm.passes], timer.root
+
+
+class PassManager:
+    anchor_names = ('module', 'builtin.module')
+
+    def __init__(
+            self, verify_each: bool = True, timer=timing.null_timer, num_workers: int = 1,
+            function_cache: 'compile_cache.CompileCache' = None
+    ):
+        self.passes: typing.List[typing.Union[ModulePass, FunctionPassManager]] = []
+        self.verify_each = verify_each
+        self.timer = timer
+        self.num_workers = num_workers
+        # per-function outputs of the function pipelines, keyed by the fingerprints of their input functions
+        self.function_cache = function_cache
+
+    def nest_func(self) -> FunctionPassManager:
+        nested = FunctionPassManager()
+        self.passes.append(nested)
+        return nested
+
+    def add_pass(self, pass_obj: Pass):
+        if isinstance(pass_obj, FunctionPass):
+            # consecutive function passes share one nested pipeline, like MLIR's implicit nesting
+            if len(self.passes) == 0 or not isinstance(self.passes[-1], FunctionPassManager):
+                self.nest_func()
+            return self.passes[-1].add_pass(pass_obj)
+        assert isinstance(pass_obj, ModulePass)
+        self.passes.append(pass_obj)
+        return pass_obj
+
+    def to_spec(self) -> str:
+        return f'module({",".join(pass_obj.to_spec() for pass_obj in self.passes)})'
+
+    def get_pass_list(self) -> typing.List[Pass]:
+        ret = []
+        for item in self.passes:
+            if isinstance(item, FunctionPassManager):
+                ret.extend(item.get_pass_list())
+            else:
+                ret.append(item)
+        return ret
+
+    def run(self, module: mlir_op.ModuleOp):
+        for item in self.passes:
+            if isinstance(item, FunctionPassManager):
+                item.run(module, self.timer, self.num_workers, self.function_cache)
+            else:
+                with self.timer.scope(item.get_name()):
+                    item.run_on_module(module)
+            if self.verify_each:
+                with self.timer.scope('(A) Verifier'):
+                    module.verify()
+
+    def print_statistics(self, file: typing.TextIO = sys.stderr):
+        separator = '===' + '-' * 73 + '==='
+        print(separator, file=file)
+        print('... Pass statistics report ...'.center(len(separator)).rstrip(), file=file)
+        print(separator, file=file)
+        for pass_obj in self.get_pass_list():
+            print(pass_obj.get_name(), file=file)
+            for statistic in pass_obj.get_statistic_list():
+                value = pass_obj.statistic_values.get(statistic.name, 0)
+                print(f'  ({statistic.name}) {value:>6} - {statistic.description}', file=file)
+
+
+class PipelineParser:
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def error(self, message: str):
+        raise ValueError(f'invalid pass pipeline "{self.text}" at {self.pos}: {message}')
+
+    def cur_char(self) -> typing.Optional[str]:
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+        return self.text[self.pos] if self.pos < len(self.text) else None
+
+    def drop_char(self, check_char: str):
+        if self.cur_char() != check_char:
+            self.error(f'expected "{check_char}"')
+        self.pos += 1
+
+    def parse_name(self) -> str:
+        self.cur_char()
+        start = self.pos
+        while self.pos < len(self.text) and (self.text[self.pos].isalnum() or self.text[self.pos] in '-_.'):
+            self.pos += 1
+        if start == self.pos:
+            self.error('expected a pass name')
+        return self.text[start:self.pos]
+
+    def parse_options(self) -> typing.Dict[str, str]:
+        options = {}
+        self.drop_char('{')
+        while self.cur_char() != '}':
+            if self.cur_char() is None:
+                self.error('unterminated option list')
+            key = self.parse_name()
+            self.drop_char('=')
+            self.cur_char()
+            start = self.pos
+            while self.pos < len(self.text) and not self.text[self.pos].isspace() and self.text[self.pos] != '}':
+                self.pos += 1
+            options[key] = self.text[start:self.pos]
+        self.drop_char('}')
+        return options
+
+    def parse_elements(self) -> typing.List[typing.Tuple[str, typing.Dict[str, str], typing.Optional[list]]]:
+        elements = []
+        while True:
+            name = self.parse_name()
+            options = self.parse_options() if self.cur_char() == '{' else {}
+            nested = None
+            if self.cur_char() == '(':
+                self.drop_char('(')
+                nested = self.parse_elements() if self.cur_char() != ')' else []
+                self.drop_char(')')
+            elements.append((name, options, nested))
+            if self.cur_char() != ',':
+                return elements
+            self.drop_char(',')
+
+    def parse(self, pm: PassManager) -> PassManager:
+        if self.cur_char() is None:
+            return pm
+        elements = self.parse_elements()
+        if self.cur_char() is not None:
+            self.error('unexpected trailing characters')
+        if len(elements) == 1 and elements[0][0] in PassManager.anchor_names and elements[0][2] is not None:
+            elements = elements[0][2]
+
+        for name, options, nested in elements:
+            if name in FunctionPassManager.anchor_names:
+                if nested is None:
+                    self.error(f'expected a nested pipeline after "{name}"')
+                nested_pm = pm.nest_func()
+                for nested_name, nested_options, nested_nested in nested:
+                    if nested_nested is not None:
+                        self.error(f'unexpected nested pipeline under "{nested_name}"')
+                    pass_obj = Pass.get_pass_cls(nested_name)(**nested_options)
+                    if not isinstance(pass_obj, FunctionPass):
+                        self.error(f'"{nested_name}" is not a function pass')
+                    nested_pm.add_pass(pass_obj)
+            else:
+                if nested is not None:
+                    self.error(f'unexpected nested pipeline under "{name}"')
+                pm.add_pass(Pass.get_pass_cls(name)(**options))
+        return pm
+
+
+def parse_pass_pipeline(
+        text: str, verify_each: bool = True, timer=timing.null_timer, num_workers: int = 1,
+        function_cache: 'compile_cache.CompileCache' = None
+) -> PassManager:
+    return PipelineParser(text).parse(
+        PassManager(verify_each=verify_each, timer=timer, num_workers=num_workers, function_cache=function_cache)
+    )
@@ -0,0 +1,27 @@
+import typing
+
+from python_mlir_toy.common import mlir_op, call_graph, td
+
+
+class PurityAnalysis:
+    """A function is pure when neither it nor any function it may call contains an op with side effects."""
+
+    def __init__(self, module: mlir_op.ModuleOp):
+        graph = call_graph.CallGraph(module)
+        self.pure_funcs: typing.Set[mlir_op.FuncOp] = set()
+        # callees come first, so every call leaving an SCC refers to a function that is already decided
+        for scc in graph.get_sccs():
+            if all(self.has_pure_body(func, scc) for func in scc):
+                self.pure_funcs.update(scc)
+
+    def has_pure_body(self, func: mlir_op.FuncOp, scc: typing.List[mlir_op.FuncOp]) -> bool:
+        for op in func.body:
+            if isinstance(op, mlir_op.GenericCallOp):
+                if op.callee not in scc and op.callee not in self.pure_funcs:
+                    return False
+            elif not isinstance(op, (td.Pure, td.IsTerminator)):
+                return False
+        return True
+
+    def is_pure(self, func: mlir_op.FuncOp) -> bool:
+        return func in self.pure_funcs
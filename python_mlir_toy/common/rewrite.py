@@ -0,0 +1,196 @@
+import typing
+
+from python_mlir_toy.common import block, mlir_op, td
+
+
+class RewritePattern:
+    # op name of the root op this pattern matches, None matches every op
+    root_name: typing.Optional[str] = None
+    benefit: int = 1
+
+    def match_and_rewrite(self, op: mlir_op.Op, rewriter: 'PatternRewriter') -> bool:
+        raise NotImplementedError('match_and_rewrite is not implemented')
+
+
+class PatternSet:
+    def __init__(self, patterns: typing.Iterable[RewritePattern] = ()):
+        self.patterns_by_name: typing.Dict[str, typing.List[RewritePattern]] = {}
+        self.generic_patterns: typing.List[RewritePattern] = []
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __len__(self):
+        return sum(len(patterns) for patterns in self.patterns_by_name.values()) + len(self.generic_patterns)
+
+    def add(self, pattern: RewritePattern):
+        if pattern.root_name is None:
+            patterns = self.generic_patterns
+        else:
+            patterns = self.patterns_by_name.setdefault(pattern.root_name, [])
+        patterns.append(pattern)
+        patterns.sort(key=lambda item: -item.benefit)
+
+    def get_patterns(self, op_name: str) -> typing.List[RewritePattern]:
+        patterns = self.patterns_by_name.get(op_name)
+        if patterns is None:
+            return self.generic_patterns
+        if not self.generic_patterns:
+            return patterns
+        return sorted(patterns + self.generic_patterns, key=lambda item: -item.benefit)
+
+
+class RewriteListener:
+    def notify_op_inserted(self, op: mlir_op.Op):
+        pass
+
+    def notify_op_modified(self, op: mlir_op.Op):
+        pass
+
+    def notify_op_replaced(self, op: mlir_op.Op, new_values: typing.List[td.Value]):
+        pass
+
+    def notify_op_erased(self, op: mlir_op.Op):
+        pass
+
+
+class PatternRewriter(block.Builder):
+    def __init__(self, listener: RewriteListener = None):
+        super().__init__()
+        self.listener = listener if listener is not None else RewriteListener()
+
+    def insert(self, op: mlir_op.Op) -> mlir_op.Op:
+        super().insert(op)
+        self.listener.notify_op_inserted(op)
+        return op
+
+    def set_operand(self, op: mlir_op.Op, index: int, value: td.Value):
+        op.set_operand(index, value)
+        self.listener.notify_op_modified(op)
+
+    def replace_op(self, op: mlir_op.Op, new_values: typing.List[td.Value]):
+        self.listener.notify_op_replaced(op, new_values)
+        op.replace_all_uses_with(new_values)
+        self.erase_op(op)
+
+    def replace_op_with_new_op(self, op: mlir_op.Op, new_op: mlir_op.Op) -> mlir_op.Op:
+        with self.at(block.InsertionPoint.before_op(op)):
+            self.insert(new_op)
+        self.replace_op(op, new_op.get_outputs())
+        return new_op
+
+    def erase_op(self, op: mlir_op.Op):
+        self.listener.notify_op_erased(op)
+        op.erase()
+
+
+def is_trivially_dead(op: mlir_op.Op) -> bool:
+    return isinstance(op, td.Pure) and op.use_empty()
+
+
+def get_constant_value(value: td.Value):
+    owner = value.owner
+    if isinstance(owner, td.ConstantLike):
+        return owner.get_constant_value()
+    return None
+
+
+def fold_op(op: mlir_op.Op, rewriter: PatternRewriter) -> bool:
+    if isinstance(op, td.ConstantLike) or len(op.get_outputs()) != 1:
+        return False
+    folded = op.fold([get_constant_value(value) for value in op.get_inputs()])
+    if folded is None:
+        return False
+    if isinstance(folded, td.Value):
+        rewriter.replace_op(op, [folded])
+    else:
+        output = op.get_outputs()[0]
+        rewriter.replace_op_with_new_op(op, op.materialize_constant(folded, output.ty, op.loc))
+    return True
+
+
+class GreedyPatternRewriteDriver(RewriteListener):
+    def __init__(self, patterns: PatternSet, max_iterations: int = 10, fold: bool = True):
+        self.patterns = patterns
+        self.max_iterations = max_iterations
+        self.fold = fold
+        self.rewriter = PatternRewriter(self)
+        self.worklist: typing.List[mlir_op.Op] = []
+        self.worklist_set: typing.Set[mlir_op.Op] = set()
+        self.num_rewrites = 0
+        self.num_folded = 0
+        self.num_erased = 0
+
+    def add_to_worklist(self, op: typing.Optional[mlir_op.Op]):
+        if op is not None and op not in self.worklist_set:
+            self.worklist.append(op)
+            self.worklist_set.add(op)
+
+    def pop_worklist(self) -> mlir_op.Op:
+        op = self.worklist.pop()
+        self.worklist_set.discard(op)
+        return op
+
+    def add_users_to_worklist(self, op: mlir_op.Op):
+        for result in op.get_outputs():
+            for user in result.users():
+                self.add_to_worklist(user)
+
+    def add_producers_to_worklist(self, op: mlir_op.Op):
+        for value in op.get_inputs():
+            self.add_to_worklist(value.owner)
+
+    def notify_op_inserted(self, op: mlir_op.Op):
+        self.add_to_worklist(op)
+
+    def notify_op_modified(self, op: mlir_op.Op):
+        self.add_to_worklist(op)
+
+    def notify_op_replaced(self, op: mlir_op.Op, new_values: typing.List[td.Value]):
+        self.add_users_to_worklist(op)
+
+    def notify_op_erased(self, op: mlir_op.Op):
+        self.add_producers_to_worklist(op)
+        self.num_erased += 1
+
+    def process_worklist(self) -> bool:
+        changed = False
+        while self.worklist:
+            op = self.pop_worklist()
+            if op.parent_block is None:
+                # erased after it was enqueued
+                continue
+
+            if is_trivially_dead(op):
+                self.rewriter.erase_op(op)
+                changed = True
+                continue
+
+            self.rewriter.set_insertion_point_before(op)
+            if self.fold and fold_op(op, self.rewriter):
+                self.num_folded += 1
+                changed = True
+                continue
+
+            for pattern in self.patterns.get_patterns(op.op_name):
+                self.rewriter.set_insertion_point_before(op)
+                if pattern.match_and_rewrite(op, self.rewriter):
+                    self.num_rewrites += 1
+                    changed = True
+                    break
+        return changed
+
+    def simplify(self, body: block.Block) -> bool:
+        """Rewrite body to a fixpoint, returns False if max_iterations was hit before converging."""
+        for _ in range(self.max_iterations):
+            # popping from the back of the reversed block visits ops top-down
+            for op in reversed(body):
+                self.add_to_worklist(op)
+            if not self.process_worklist():
+                return True
+        return False
+
+
+def apply_patterns_greedily(
+        body: block.Block, patterns: PatternSet, max_iterations: int = 10, fold: bool = True
+) -> bool:
+    return GreedyPatternRewriteDriver(patterns, max_iterations, fold).simplify(body)
@@ -60,11 +60,21 @@ class KVScoped(Scoped, typing.Generic[K, V]):
 class SymbolTable(KVScoped[str, V], typing.Generic[V]):
     def __init__(self):
         super().__init__()
+        # per scope and prefix, every symbol below the index is in use, so the search resumes there instead of at 0
+        self.next_index_stack: typing.List[typing.Dict[str, int]] = [{}]
 
     def next_unused_symbol(self, prefix: str = '%'):
-        index = 0
-        while True:
-            name = f'{prefix}{index}'
-            if self.lookup(name) is None:
-                return name
+        index = self.next_index_stack[-1].get(prefix, 0)
+        while self.lookup(f'{prefix}{index}') is not None:
             index += 1
+        # the symbol is not inserted yet, so it is where the next search starts
+        self.next_index_stack[-1][prefix] = index
+        return f'{prefix}{index}'
+
+    def __enter__(self):
+        super().__enter__()
+        self.next_index_stack.append(dict(self.next_index_stack[-1]))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.next_index_stack.pop()
+        super().__exit__(exc_type, exc_val, exc_tb)
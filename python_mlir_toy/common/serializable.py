@@ -43,8 +43,8 @@ class TextParser:
         self._cur_char = self._line_buffer[self.cur_pose]
         self._last_token = None
         self._last_token_kind: TokenKind = TokenKind.Unknown
-        self.drop_token()
         self._number_pattern = re.compile(r'[-+]?(([0-9]*\.?[0-9]*([eE][-+]?[0-9]+)?)|0[xo][0-9a-fA-F]+)')
+        self.drop_token()
 
     def get_location(self):
         return self.filename, self.cur_line + 1, self.cur_pose + 1
@@ -104,31 +104,31 @@ class TextParser:
         if self.cur_char() is None:
             self._last_token, self._last_token_kind = None, TokenKind.EOF
         elif self.cur_char().isidentifier():
-            identifier = ''
-            while self.cur_char() is not None and (identifier + self.cur_char()).isidentifier():
-                identifier += self.cur_char()
+            # checking each char on its own keeps long identifiers linear, '_' makes it a continuation char check
+            identifier_chars = [self.cur_char()]
+            self.drop_char()
+            while self.cur_char() is not None and ('_' + self.cur_char()).isidentifier():
+                identifier_chars.append(self.cur_char())
                 self.drop_char()
-            self._last_token, self._last_token_kind = identifier, TokenKind.Identifier
+            self._last_token, self._last_token_kind = ''.join(identifier_chars), TokenKind.Identifier
         elif self.cur_char().isdigit():
-            number_str = ''
-            while self.cur_char() is not None and self._number_pattern.fullmatch(
-                    number_str + self.cur_char()) is not None:
-                number_str += self.cur_char()
+            number_str = self._number_pattern.match(self._line_buffer, self.cur_pose).group()
+            for _ in number_str:
                 self.drop_char()
-            if '.' in number_str:
+            if '.' in number_str or 'e' in number_str or 'E' in number_str:
                 self._last_token, self._last_token_kind = float(number_str), TokenKind.Number
             else:
                 self._last_token, self._last_token_kind = int(number_str), TokenKind.Number
         elif self.cur_char() == '"':
             self.drop_char()
-            string = ''
+            string_chars = []
             while self.cur_char() is not None and self.cur_char() != '"':
                 if self.cur_char() == '\\':
                     self.drop_char()
-                string += self.cur_char()
+                string_chars.append(self.cur_char())
                 self.drop_char()
             self.drop_char('"')
-            self._last_token, self._last_token_kind = string, TokenKind.String
+            self._last_token, self._last_token_kind = ''.join(string_chars), TokenKind.String
         else:
             last_char = self.cur_char()
             self.drop_char()
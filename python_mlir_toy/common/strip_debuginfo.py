@@ -0,0 +1,17 @@
+from python_mlir_toy.common import pass_manager, mlir_op, location
+
+
+class StripDebugInfoPass(pass_manager.FunctionPass):
+    argument = 'strip-debuginfo'
+    description = 'Replace all locations with loc(unknown)'
+
+    num_stripped = pass_manager.Statistic('num-stripped', 'Number of locations replaced')
+
+    def run_on_function(self, func: mlir_op.FuncOp):
+        unknown = location.UnknownLocation()
+        func.loc = unknown
+        func.argument_locs = [unknown for _ in func.argument_locs]
+        self.num_stripped += 1 + len(func.argument_locs)
+        for op in func.body:
+            op.loc = unknown
+            self.num_stripped += 1
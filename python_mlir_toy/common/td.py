@@ -5,13 +5,48 @@ from python_mlir_toy.common import mlir_type
 T = typing.TypeVar('T')
 
 
+class Use(typing.NamedTuple):
+    op: typing.Any
+    index: int
+
+
 class Value:
-    def __init__(self, ty: mlir_type.Type):
+    def __init__(self, ty: mlir_type.Type, owner=None):
         self.ty = ty
+        self.owner = owner
+        self.uses: typing.List[Use] = []
 
     def __hash__(self):
         return id(self)
 
+    def add_use(self, op, index: int):
+        self.uses.append(Use(op, index))
+
+    def remove_use(self, op, index: int):
+        for use_index, use in enumerate(self.uses):
+            if use.op is op and use.index == index:
+                self.uses[use_index] = self.uses[-1]
+                self.uses.pop()
+                return
+        raise ValueError('use not found')
+
+    def use_empty(self) -> bool:
+        return len(self.uses) == 0
+
+    def has_one_use(self) -> bool:
+        return len(self.uses) == 1
+
+    def users(self) -> typing.List[typing.Any]:
+        return list({id(use.op): use.op for use in self.uses}.values())
+
+    def replace_all_uses_with(self, new_value: 'Value'):
+        if new_value is self:
+            return
+        uses, self.uses = self.uses, []
+        for op, index in uses:
+            op.operands[index] = new_value
+            new_value.uses.append(Use(op, index))
+
 
 class ConstantValue(Value, typing.Generic[T]):
     def __init__(self, ty: mlir_type.Type, value: T):
@@ -19,6 +54,19 @@ class ConstantValue(Value, typing.Generic[T]):
         self.value = value
 
 
+class IsTerminator:
+    pass
+
+
+class Pure:
+    pass
+
+
+class ConstantLike:
+    def get_constant_value(self):
+        raise NotImplementedError('get_constant_value is not implemented')
+
+
 class IsolatedFromAbove:
     def __init__(self):
         pass
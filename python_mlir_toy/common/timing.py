@@ -0,0 +1,178 @@
+import contextlib
+import io
+import sys
+import time
+import typing
+
+
+class TimingNode:
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.count = 0
+        self.children: typing.Dict[str, 'TimingNode'] = {}
+
+    def child(self, name: str) -> 'TimingNode':
+        node = self.children.get(name)
+        if node is None:
+            node = type(self)(name)
+            self.children[name] = node
+        return node
+
+    def merge(self, other: 'TimingNode'):
+        self.wall_time += other.wall_time
+        self.cpu_time += other.cpu_time
+        self.count += other.count
+        for name, other_child in other.children.items():
+            self.child(name).merge(other_child)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name, 'wall_time': self.wall_time, 'cpu_time': self.cpu_time, 'count': self.count,
+            'children': [child.to_dict() for child in self.children.values()],
+        }
+
+
+class Counter(typing.NamedTuple):
+    value: float
+    # the phase the counter is a throughput of, if any
+    node: typing.Optional[TimingNode]
+
+    def get_rate(self) -> typing.Optional[float]:
+        if self.node is None or self.node.wall_time <= 0:
+            return None
+        return self.value / self.node.wall_time
+
+
+class Timer:
+    enabled = True
+    node_cls: typing.Type[TimingNode] = TimingNode
+
+    def __init__(self):
+        self.root = self.node_cls('Total')
+        self.stack: typing.List[TimingNode] = [self.root]
+        self.counters: typing.Dict[str, Counter] = {}
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+
+    @contextlib.contextmanager
+    def scope(self, name: str):
+        node = self.stack[-1].child(name)
+        self.stack.append(node)
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield node
+        finally:
+            node.wall_time += time.perf_counter() - start
+            node.cpu_time += time.process_time() - start_cpu
+            node.count += 1
+            self.stack.pop()
+
+    def add_counter(self, name: str, value: float, node: TimingNode = None):
+        """Adds value to a counter, reported as a throughput of node when it is given."""
+        counter = self.counters.get(name)
+        self.counters[name] = Counter(value + (counter.value if counter is not None else 0), node)
+
+    def read_input(self, file: typing.TextIO) -> typing.TextIO:
+        """Reads file up front, so reading is a phase of its own instead of a part of lexing or parsing."""
+        with self.scope('read') as node:
+            text = file.read()
+        self.add_counter('bytes in', len(text.encode()), node)
+        buffer = io.StringIO(text)
+        buffer.name = file.name
+        return buffer
+
+    def write_output(self, print_output: typing.Callable[[], None]):
+        """Runs print_output into memory, then writes what it printed, so printing and writing are timed apart."""
+        captured = io.StringIO()
+        with self.scope('print') as node, contextlib.redirect_stdout(captured):
+            print_output()
+        text = captured.getvalue()
+        self.add_counter('bytes out', len(text.encode()), node)
+        with self.scope('write'):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def stop(self):
+        self.root.wall_time = time.perf_counter() - self.start_time
+        self.root.cpu_time = time.process_time() - self.start_cpu_time
+        self.root.count = 1
+
+    def to_dict(self) -> dict:
+        if self.root.count == 0:
+            self.stop()
+        return {
+            'timing': self.root.to_dict(),
+            'counters': {
+                name: {'value': counter.value, 'per_second': counter.get_rate()}
+                for name, counter in self.counters.items()
+            },
+        }
+
+    def report(self, file: typing.TextIO = sys.stderr, report_format: str = 'table'):
+        if report_format == 'json':
+            import json
+            json.dump(self.to_dict(), file, indent=2)
+            print(file=file)
+            return
+        if self.root.count == 0:
+            self.stop()
+        total = self.root.wall_time
+        separator = '===' + '-' * 73 + '==='
+        print(separator, file=file)
+        print('... Execution time report ...'.center(len(separator)).rstrip(), file=file)
+        print(separator, file=file)
+        print(f'  Total Execution Time: {total:.4f} seconds', file=file)
+        print(file=file)
+        print('  ----Wall Time----  ----CPU Time-----  ----Name----', file=file)
+
+        def print_line(node: TimingNode, level: int):
+            percent = 100.0 * node.wall_time / total if total > 0 else 0.0
+            cpu_percent = 100.0 * node.cpu_time / self.root.cpu_time if self.root.cpu_time > 0 else 0.0
+            print(f'  {node.wall_time:8.4f} ({percent:5.1f}%)  {node.cpu_time:8.4f} ({cpu_percent:5.1f}%)  '
+                  f'{"  " * level}{node.name}', file=file)
+
+        def print_tree(node: TimingNode, level: int):
+            print_line(node, level)
+            for child in node.children.values():
+                print_tree(child, level + 1)
+
+        for child in self.root.children.values():
+            print_tree(child, 0)
+        print_line(self.root, 0)
+        if not self.counters:
+            return
+        print(file=file)
+        print('  ----Value----  ----Per Second----  ----Counter----', file=file)
+        for name, counter in self.counters.items():
+            rate = counter.get_rate()
+            rate_text = f'{rate:18.1f}' if rate is not None else ' ' * 18
+            print(f'  {counter.value:13g}  {rate_text}  {name}', file=file)
+
+
+class NullTimer:
+    enabled = False
+    _null_scope = contextlib.nullcontext()
+
+    def scope(self, name: str):
+        return self._null_scope
+
+    def add_counter(self, name: str, value: float, node: TimingNode = None):
+        pass
+
+    def read_input(self, file: typing.TextIO) -> typing.TextIO:
+        return file
+
+    def write_output(self, print_output: typing.Callable[[], None]):
+        print_output()
+
+    def stop(self):
+        pass
+
+    def report(self, file: typing.TextIO = sys.stderr, report_format: str = 'table'):
+        pass
+
+
+null_timer = NullTimer()
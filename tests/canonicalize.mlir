@@ -0,0 +1,17 @@
+module {
+  toy.func @transposes(%a: tensor<*xf64> loc("tests/canonicalize.mlir":2:24)) -> tensor<*xf64> {
+    %0 = toy.transpose(%a : tensor<*xf64>) to tensor<*xf64> loc("tests/canonicalize.mlir":3:10)
+    %1 = toy.transpose(%0 : tensor<*xf64>) to tensor<*xf64> loc("tests/canonicalize.mlir":4:10)
+    toy.return %1 : tensor<*xf64> loc("tests/canonicalize.mlir":5:5)
+  } loc("tests/canonicalize.mlir":2:3)
+  toy.func @main() {
+    %0 = toy.constant dense<[1.0, 2.0, 3.0, 4.0, 5.0, 6.0]> : tensor<6xf64> loc("tests/canonicalize.mlir":8:10)
+    %1 = toy.generic_call @transposes(%0) : (tensor<6xf64>) -> tensor<*xf64> loc("tests/canonicalize.mlir":9:10)
+    %2 = toy.reshape(%0 : tensor<6xf64>) to tensor<6xf64> loc("tests/canonicalize.mlir":10:10)
+    %3 = toy.reshape(%2 : tensor<6xf64>) to tensor<3x2xf64> loc("tests/canonicalize.mlir":11:10)
+    %4 = toy.reshape(%3 : tensor<3x2xf64>) to tensor<2x3xf64> loc("tests/canonicalize.mlir":12:10)
+    toy.print %4 : tensor<2x3xf64> loc("tests/canonicalize.mlir":13:5)
+    toy.print %1 : tensor<*xf64> loc("tests/canonicalize.mlir":14:5)
+    toy.return loc("tests/canonicalize.mlir":15:5)
+  } loc("tests/canonicalize.mlir":7:3)
+} loc("tests/canonicalize.mlir":1:1)
@@ -1,6 +1,11 @@
+import io
+import json
+
 import pytest
 
-from python_mlir_toy.ch1 import toy
+from python_mlir_toy.ch1 import toy, ast, generator
+from python_mlir_toy.ch1.lexer import LexerBuffer, ReplayLexer, Token, tokenize
+from python_mlir_toy.ch1.parser import Parser
 
 
 def test_help_info():
@@ -12,6 +17,37 @@ def test_convert_toy_to_ast():
     toy.main(['tests/transpose.toy', '-emit=ast'])
 
 
+def test_generated_program(capsys):
+    shape = generator.ProgramShape(num_functions=6, statements_per_function=5, expression_depth=2, call_fan_out=3)
+    source = generator.generate_program(shape, seed=7)
+    assert generator.generate_program(shape, seed=7) == source
+    assert generator.generate_program(shape, seed=8) != source
+    assert 50_000 <= len(generator.generate_program_of_size(100_000, shape)) <= 200_000
+
+    module_ast = Parser(LexerBuffer(io.StringIO(source), 'gen.toy')).parse_module()
+    assert [function.proto.name for function in module_ast.functions] == [f'f{i}' for i in range(6)] + ['main']
+    ast.dump(module_ast)
+    expected = capsys.readouterr().out
+
+    records = tokenize(LexerBuffer(io.StringIO(source), 'gen.toy'))
+    assert records[-1].token is Token.EOF
+    ast.dump(Parser(ReplayLexer(records, 'gen.toy')).parse_module())
+    assert capsys.readouterr().out == expected
+
+
+def test_phase_timing(capsys):
+    toy.main(['tests/transpose.toy', '-emit=ast'])
+    expected = capsys.readouterr().out
+    toy.main(['tests/transpose.toy', '-emit=ast', '-timing', '-timing-format=json'])
+    captured = capsys.readouterr()
+    assert captured.out == expected
+    report = json.loads(captured.err)
+    assert [phase['name'] for phase in report['timing']['children']] == ['read', 'lex', 'parse', 'print', 'write']
+    # 81 tokens without the final EOF
+    assert report['counters']['tokens']['value'] == 81
+    assert report['counters']['bytes out']['value'] == len(expected.encode())
+
+
 if __name__ == '__main__':
     test_help_info()
     test_convert_toy_to_ast()
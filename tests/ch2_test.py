@@ -1,6 +1,20 @@
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import tracemalloc
+import warnings
+
+import numpy as np
 import pytest
 
-from python_mlir_toy.ch2 import toy
+from python_mlir_toy.ch1 import generator
+from python_mlir_toy.ch2 import toy, interpreter, fusion, batching, batch, daemon, toy_client, memoization, \
+    py_codegen
+from python_mlir_toy.common import purity, fingerprint, compile_cache, rewrite, canonicalize
 
 
 def test_help_info():
@@ -8,6 +22,24 @@ def test_help_info():
         toy.main(['-h'])
 
 
+def test_lazy_imports():
+    # -h loads no frontend or dialect, .mlir inputs load the toy dialect but neither the toy frontend nor numpy
+    script = ('import sys\nfrom python_mlir_toy.ch2 import toy\ntry:\n    toy.main(sys.argv[1:])\nexcept SystemExit:\n'
+              '    pass\nprint(" ".join(sorted(sys.modules)), file=sys.stderr)')
+
+    def get_loaded_modules(argv):
+        result = subprocess.run([sys.executable, '-c', script, *argv], capture_output=True, text=True, check=True)
+        return set(result.stderr.splitlines()[-1].split())
+
+    help_modules = get_loaded_modules(['-h'])
+    assert not any(name.startswith('python_mlir_toy.ch1') for name in help_modules)
+    assert 'python_mlir_toy.common.mlir_op' not in help_modules
+    mlir_modules = get_loaded_modules(['tests/transpose.mlir', '-emit=mlir'])
+    assert 'python_mlir_toy.ch2.ops' in mlir_modules
+    assert not any(name.startswith('python_mlir_toy.ch1') for name in mlir_modules)
+    assert 'numpy' not in mlir_modules
+
+
 def test_convert_toy_to_ast():
     toy.main(['tests/transpose.toy', '-emit=ast'])
 
@@ -25,9 +57,521 @@ def test_convert_mlir_to_mlir():
     toy.main(['tests/transpose.mlir', '-emit=mlir'])
 
 
+def test_mlir_round_trip(capsys, tmp_path):
+    # printing what was parsed gives text that parses back to the same IR
+    for input_file in ['tests/transpose.mlir', 'tests/canonicalize.mlir', 'tests/cse.mlir']:
+        toy.main([input_file, '-emit=mlir'])
+        printed = capsys.readouterr().out
+        reparsed_file = tmp_path / 'reparsed.mlir'
+        reparsed_file.write_text(printed)
+        toy.main([str(reparsed_file), '-emit=mlir'])
+        assert capsys.readouterr().out == printed
+
+
+def test_pass_pipeline_timing(capsys):
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=module(func(strip-debuginfo))', '-timing',
+              '-pass-statistics'])
+    captured = capsys.readouterr()
+    assert 'loc("tests/transpose.toy":2:12)' not in captured.out
+    assert 'StripDebugInfoPass' in captured.err
+    assert 'Execution time report' in captured.err
+    assert '(num-stripped)' in captured.err
+
+
+def test_phase_timing(capsys):
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=func(cse)', '-timing', '-timing-format=json'])
+    captured = capsys.readouterr()
+    report = json.loads(captured.err)
+    phases = {phase['name']: phase for phase in report['timing']['children']}
+    assert list(phases) == ['read', 'lex', 'parse', 'mlir-gen', 'passes', 'print', 'write']
+    assert phases['passes']['children'][0]['children'][0]['name'] == 'CSEPass'
+    assert all(phase['cpu_time'] >= 0 for phase in phases.values())
+    assert report['counters']['ops created']['value'] > 0
+    assert report['counters']['bytes out']['value'] == len(captured.out.encode())
+
+
+def test_mem_profile(capsys):
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-mem-profile', '-timing-format=json'])
+    report = json.loads(capsys.readouterr().err)
+    phases = {phase['name']: phase for phase in report['timing']['children']}
+    assert list(phases) == ['read', 'lex', 'parse', 'mlir-gen', 'passes', 'print', 'write']
+    assert phases['parse']['retained_bytes'] > 0
+    assert phases['parse']['peak_bytes'] >= phases['parse']['retained_bytes']
+    assert phases['parse']['object_counts']['ExprAST'] > 0
+    assert phases['mlir-gen']['object_counts']['Op'] > 0
+    assert phases['mlir-gen']['top_sites']
+
+
+def test_mem_profile_stops_tracing_on_error(tmp_path):
+    input_file = tmp_path / 'broken.toy'
+    input_file.write_text('def main() {\n  var a = ;\n}\n')
+    with pytest.raises(Exception):
+        toy.main([str(input_file), '-emit=mlir', '-mem-profile'])
+    assert not tracemalloc.is_tracing()
+
+
+def test_memory_budget(mem_profiler):
+    source = generator.generate_program(generator.ProgramShape(literal_size=8), seed=1)
+    args = toy.build_arg_parser().parse_args([])
+    args.input_file = io.StringIO(source)
+    args.input_file.name = 'gen.toy'
+    toy.load_mlir(args, mem_profiler)
+    mem_profiler.stop()
+
+    phases = mem_profiler.root.children
+    # the frontend keeps a few dozen bytes per source byte: token records, AST nodes and their locations
+    for phase in ['lex', 'parse', 'mlir-gen']:
+        assert phases[phase].peak_bytes < 64 * len(source)
+    assert phases['parse'].object_counts['ExprAST'] > 0
+    assert phases['mlir-gen'].object_counts['Op'] > 0
+
+
+def test_parallel_function_passes(capsys):
+    for input_file in ['tests/transpose.toy', 'tests/calls.toy']:
+        toy.main([input_file, '-emit=mlir', '-pass-pipeline=func(strip-debuginfo)'])
+        sequential = capsys.readouterr().out
+        toy.main([input_file, '-emit=mlir', '-pass-pipeline=func(strip-debuginfo)', '-j', '2'])
+        parallel = capsys.readouterr().out
+        assert sequential == parallel
+
+
+def test_canonicalize(capsys):
+    toy.main(['tests/canonicalize.mlir', '-emit=mlir', '-pass-pipeline=func(canonicalize)'])
+    output = capsys.readouterr().out
+    assert 'toy.transpose' not in output
+    assert 'toy.reshape' not in output
+    assert 'toy.return %a' in output
+    assert 'dense<[[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]> : tensor<2x3xf64>' in output
+
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=func(canonicalize)'])
+    output = capsys.readouterr().out
+    assert 'toy.reshape' not in output
+    assert output.count('toy.constant') == 2
+
+
+def test_mismatched_constant_reshape(capsys, tmp_path):
+    input_file = tmp_path / 'reshape.toy'
+    input_file.write_text('def main() {\n  var a<3, 3> = [1, 2, 3, 4];\n  print(a);\n}\n')
+    module = toy.load_mlir(toy.build_arg_parser().parse_args([str(input_file)]))
+    driver = rewrite.GreedyPatternRewriteDriver(canonicalize.collect_canonicalization_patterns(), fold=False)
+    for func in module.body:
+        driver.simplify(func.body)
+    module.dump()
+    assert 'toy.reshape' in capsys.readouterr().out
+
+    for pipeline in ('module(func(canonicalize))', 'constant-fold'):
+        toy.main([str(input_file), '-emit=mlir', f'-pass-pipeline={pipeline}'])
+        output = capsys.readouterr().out
+        assert 'toy.reshape' in output
+        assert 'tensor<4xf64>' in output
+
+
+def test_shape_inference(capsys):
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=module(func(canonicalize),shape-inference)',
+              '-pass-statistics'])
+    captured = capsys.readouterr()
+    main_func = captured.out[captured.out.index('toy.func @main'):]
+    assert 'tensor<*xf64>' not in main_func
+    assert 'toy.generic_call @multiply_transpose_2x2_2x2(%0, %1)' in main_func
+    assert 'toy.func @multiply_transpose_2x2_2x2(%a: tensor<2x2xf64>' in captured.out
+    assert '(num-unranked)      0' in captured.err
+    # the unranked original has no callers left
+    assert 'toy.func @multiply_transpose(' not in captured.out
+    assert '(num-erased)      1' in captured.err
+
+    toy.main(['tests/calls.toy', '-emit=mlir', '-pass-pipeline=shape-inference'])
+    output = capsys.readouterr().out
+    assert 'toy.generic_call @noret_2(%0) : (tensor<2xf64>) -> ()' in output
+    assert [line.split('(')[0] for line in output.splitlines() if 'toy.func' in line] == [
+        '  toy.func @helper', '  toy.func @noret_2', '  toy.func @main'
+    ]
+
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=shape-inference{exported=multiply_transpose}'])
+    output = capsys.readouterr().out
+    assert 'toy.func @multiply_transpose(' in output
+    assert 'toy.func @multiply_transpose_2x2_2x2(' in output
+
+
+def test_inline(capsys, tmp_path):
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=inline,func(canonicalize)', '-pass-statistics'])
+    captured = capsys.readouterr()
+    assert 'toy.generic_call' not in captured.out
+    assert '@multiply_transpose' not in captured.out
+    assert 'dense<[[1.0, 9.0], [4.0, 16.0]]> : tensor<2x2xf64>' in captured.out
+    assert '(num-inlined)      1' in captured.err
+
+    toy.main(['tests/calls.toy', '-emit=mlir', '-pass-pipeline=inline{threshold=0}'])
+    output = capsys.readouterr().out
+    assert 'toy.generic_call @helper()' in output
+    assert 'toy.generic_call @noret(%0)' in output
+    assert output.count('toy.print') == 2
+
+    # functions that were never called are left to dce, only square lost its last call site
+    toy.main(['tests/dce.toy', '-emit=mlir', '-pass-pipeline=inline', '-pass-statistics'])
+    captured = capsys.readouterr()
+    assert 'toy.func @unused' in captured.out
+    assert 'toy.func @exported' in captured.out
+    assert '@square' not in captured.out
+    assert '(num-removed)      1' in captured.err
+
+    input_file = tmp_path / 'library.toy'
+    input_file.write_text('def foo(a, b) {\n  return a * b;\n}\n')
+    toy.main([str(input_file), '-emit=mlir', '-pass-pipeline=inline'])
+    assert 'toy.func @foo' in capsys.readouterr().out
+
+
+def test_cse(capsys):
+    toy.main(['tests/cse.mlir', '-emit=mlir', '-pass-pipeline=func(cse)', '-pass-statistics'])
+    captured = capsys.readouterr()
+    assert captured.out.count('toy.constant') == 2
+    assert captured.out.count('toy.transpose') == 1
+    assert captured.out.count('toy.add') == 1
+    assert 'toy.mul %3, %3' in captured.out
+    assert captured.out.count('toy.print') == 2
+    assert "(num-cse'd)      3" in captured.err
+
+
+def test_dce(capsys):
+    toy.main(['tests/dce.toy', '-emit=mlir', '-pass-pipeline=dce', '-pass-statistics'])
+    captured = capsys.readouterr()
+    assert '@unused' not in captured.out
+    assert '@exported' not in captured.out
+    # the unused call to the pure square is erased, and square with it
+    assert '@square' not in captured.out
+    assert 'toy.transpose' not in captured.out
+    assert 'toy.add' not in captured.out
+    assert 'toy.print' in captured.out
+    assert '(num-erased-ops)      4' in captured.err
+    assert '(num-erased-funcs)      3' in captured.err
+
+    toy.main(['tests/dce.toy', '-emit=mlir', '-pass-pipeline=dce{exported=exported}'])
+    output = capsys.readouterr().out
+    assert 'toy.func @exported' in output
+    assert 'toy.generic_call @square' in output
+    assert '@unused' not in output
+
+    toy.main(['tests/calls.toy', '-emit=run', '-pass-pipeline=dce'])
+    assert capsys.readouterr().out == '1.000000 2.000000\n1.000000 2.000000\n'
+
+
+def test_run(capsys):
+    toy.main(['tests/transpose.toy', '-emit=run'])
+    assert capsys.readouterr().out == '1.000000 9.000000\n4.000000 16.000000\n'
+
+    toy.main(['tests/calls.toy', '-emit=run', '-pass-pipeline=inline'])
+    assert capsys.readouterr().out == '1.000000 2.000000\n1.000000 2.000000\n'
+
+
+def test_interpreter_call():
+    module = toy.load_mlir(toy.build_arg_parser().parse_args(['tests/transpose.toy']))
+    runner = interpreter.Interpreter(module)
+    a = np.arange(6.0).reshape(2, 3)
+    result = runner.run('multiply_transpose', a, a + 1)
+    np.testing.assert_array_equal(result, a.T * (a + 1).T)
+
+
+def test_py_codegen(capsys, tmp_path):
+    toy.main(['tests/transpose.toy', '-emit=py', '-pass-pipeline=shape-inference'])
+    source = capsys.readouterr().out
+    assert 'def f_multiply_transpose_2x2_2x2_0(a_a, a_b):\n    v0 = a_a.T\n' in source
+    assert 'v3 = f_multiply_transpose_2x2_2x2_0(v0, v2)' in source
+
+    for input_file, pipeline in [('tests/transpose.toy', ''), ('tests/calls.toy', ''),
+                                 ('tests/fusion.toy', 'func(toy-fuse-elementwise)')]:
+        toy.main([input_file, '-emit=run'])
+        expected = capsys.readouterr().out
+        toy.main([input_file, '-emit=run', '-exec-engine=py', f'-pass-pipeline={pipeline}'])
+        assert capsys.readouterr().out == expected
+        # the printed program defines its constants and kernels and runs main itself
+        toy.main([input_file, '-emit=py', f'-pass-pipeline={pipeline}'])
+        program = tmp_path / 'program.py'
+        program.write_text(capsys.readouterr().out)
+        result = subprocess.run([sys.executable, str(program)], capture_output=True, text=True, check=True,
+                                env={**os.environ, 'PYTHONPATH': os.getcwd()})
+        assert result.stdout == expected
+
+    # symbols that map to the same identifier still get python functions of their own
+    module = toy.load_mlir(toy.build_arg_parser().parse_args(['tests/calls.toy']))
+    helper, noret, _ = [op for op in module.body]
+    helper.function_name, noret.function_name = '@a.b', '@a_b'
+    engine = py_codegen.CodegenEngine(module)
+    assert engine.compile(helper) is not engine.compile(noret)
+
+
+def test_fusion(capsys, tmp_path):
+    toy.main(['tests/fusion.toy', '-emit=run'])
+    expected = capsys.readouterr().out
+    toy.main(['tests/fusion.toy', '-emit=mlir', '-pass-pipeline=func(toy-fuse-elementwise)', '-pass-statistics'])
+    captured = capsys.readouterr()
+    assert 'toy.fused_elementwise "add(add(mul($0,$1),mul($2,$1)),$0)" (%0, %1, %2)' in captured.out
+    assert 'toy.add' not in captured.out
+    assert '(num-ops-fused)      4' in captured.err
+
+    fused_file = tmp_path / 'fused.mlir'
+    fused_file.write_text(captured.out)
+    toy.main([str(fused_file), '-emit=run'])
+    assert capsys.readouterr().out == expected
+    toy.main(['tests/fusion.toy', '-emit=run', '-pass-pipeline=func(toy-fuse-elementwise)', '-exec-engine=py'])
+    assert capsys.readouterr().out == expected
+
+
+def test_fused_kernel_blocks():
+    kernel = fusion.get_fused_kernel('add(mul($0,add($1,$2)),mul($2,$0))')
+    rng = np.random.default_rng(0)
+    a = rng.random((300, 500))
+    b = rng.random((500, 300)).T
+    c = rng.random(500)
+    np.testing.assert_allclose(kernel(a, b, c), a * (b + c) + c * a)
+    assert kernel.num_buffers == 2
+
+    # the output aliases an input that is read after the first intermediate is written
+    expected = a * (b + c) + c * a
+    assert kernel(a, b, c, out=a) is a
+    np.testing.assert_allclose(a, expected)
+
+
+def test_memory_plan(capsys):
+    for input_file, pipeline in [('tests/fusion.toy', ''), ('tests/transpose.toy', 'shape-inference'),
+                                 ('tests/fusion.toy', 'func(toy-fuse-elementwise)')]:
+        toy.main([input_file, '-emit=run', f'-pass-pipeline={pipeline}'])
+        expected = capsys.readouterr().out
+        toy.main([input_file, '-emit=run', f'-pass-pipeline={pipeline}', '-memory-plan'])
+        captured = capsys.readouterr()
+        assert captured.out == expected
+        assert 'memory plan @main' in captured.err
+
+    toy.main(['tests/fusion.toy', '-emit=run', '-memory-plan'])
+    assert '2 buffers, 5 planned results (2 in place)' in capsys.readouterr().err
+
+
+def test_batched_execution():
+    module = toy.load_mlir(toy.build_arg_parser().parse_args(['tests/batch.toy']))
+    rng = np.random.default_rng(0)
+    a = rng.random((5, 2, 2))
+    b = rng.random((5, 2, 2))
+
+    looped_file = io.StringIO()
+    runner = interpreter.Interpreter(module, looped_file)
+    looped = np.stack([runner.run('combine', a[index], b[index]) for index in range(5)])
+    batched_file = io.StringIO()
+    batched_runner = batching.BatchedInterpreter(module, batched_file)
+    np.testing.assert_array_equal(batched_runner.call_batched('combine', a, b), looped)
+    assert batched_file.getvalue() == looped_file.getvalue()
+
+    shared = batched_runner.call_batched('combine', a, b[0], batched_arguments=[True, False])
+    np.testing.assert_array_equal(shared, np.swapaxes(a, -1, -2) * b[0] + b[0])
+
+    offsets = batched_runner.call_batched('offsets', batched_arguments=[])
+    assert offsets.shape == (2, 2)
+    combined = batched_runner.call_batched('combine', a, offsets, batched_arguments=[True, False])
+    np.testing.assert_array_equal(combined[3], runner.run('combine', a[3], offsets))
+
+
+def test_memoization(capsys):
+    module = toy.load_mlir(toy.build_arg_parser().parse_args(['tests/memo.toy']))
+    analysis = purity.PurityAnalysis(module)
+    assert {func.function_name for func in module.body if analysis.is_pure(func)} == {'@square', '@twice'}
+
+    toy.main(['tests/memo.toy', '-emit=run'])
+    expected = capsys.readouterr().out
+    toy.main(['tests/memo.toy', '-emit=run', '-memo-cache-bytes=1024'])
+    captured = capsys.readouterr()
+    assert captured.out == expected
+    assert 'memo cache: 2 hits, 2 misses, 0 evictions' in captured.err
+    toy.main(['tests/memo.toy', '-emit=run', '-memo-cache-bytes=40'])
+    captured = capsys.readouterr()
+    assert captured.out == expected
+    assert '1 evictions, 1 entries, 32 bytes' in captured.err
+
+    # a callee returning its argument must neither freeze the caller's array nor hand it out
+    cache = memoization.MemoCache(1 << 20)
+    array = np.ones(4)
+    result = cache.call(lambda x: x, '@id', array)
+    assert array.flags.writeable
+    assert not result.flags.writeable and not np.shares_memory(result, array)
+    assert cache.call(lambda x: x, '@id', array) is result
+
+
+def test_compile_cache(capsys, tmp_path):
+    cache_args = ['-emit=mlir', '-pass-pipeline=func(canonicalize)', f'-cache-dir={tmp_path}', '-cache-stats']
+    toy.main(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=func(canonicalize)'])
+    expected = capsys.readouterr().out
+    toy.main(['tests/transpose.toy', *cache_args])
+    captured = capsys.readouterr()
+    assert captured.out == expected
+    assert 'compile cache: 0 hits, 1 misses' in captured.err
+
+    # a hit is served by a fresh process that never imports the frontend
+    script = ('import sys; from python_mlir_toy.ch2 import toy; toy.main(sys.argv[1:]); '
+              'assert not any(name.startswith("python_mlir_toy.ch1") for name in sys.modules)')
+    result = subprocess.run([sys.executable, '-c', script, 'tests/transpose.toy', *cache_args],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout == expected
+    assert 'compile cache: 1 hits, 1 misses, hit rate 50.0%' in result.stderr
+
+    toy.main(['tests/transpose.toy', *cache_args, '-cache-max-bytes=16'])
+    toy.main(['tests/transpose.mlir', *cache_args, '-cache-max-bytes=16'])
+    captured = capsys.readouterr()
+    assert '2 evictions, 0 entries, 0 bytes' in captured.err
+    # the statistics do not grow with the number of lookups
+    assert (tmp_path / 'stats').stat().st_size == compile_cache.stats_record.size
+
+
+def test_compile_cache_bookkeeping(monkeypatch, tmp_path):
+    cache = compile_cache.CompileCache(str(tmp_path), 1 << 20)
+    num_scans = []
+    list_entries = cache.list_entries
+    monkeypatch.setattr(cache, 'list_entries', lambda: num_scans.append(1) or list_entries())
+    for key in map(str, range(8)):
+        assert cache.get(key) is None
+        cache.put(key, b'output', 0.5)
+    assert cache.get('0') == b'output'
+    # one scan for the running total and no statistics written before the flush
+    assert len(num_scans) == 1
+    assert not (tmp_path / 'stats').exists()
+    cache.flush()
+    stats = compile_cache.CompileCache(str(tmp_path), 1 << 20).get_stats()
+    assert (stats['hit'], stats['miss'], stats['store'], stats['saved_seconds']) == (1, 8, 8, 0.5)
+
+    # going over the budget scans again to evict
+    cache.max_bytes = 5 * len(b'0.5\noutput')
+    cache.put('8', b'output', 0.5)
+    assert len(num_scans) == 2
+    assert cache.num_bytes == cache.max_bytes
+    assert len(list_entries()) == 5
+
+
+def test_function_fingerprints():
+    def get_fingerprints(argv):
+        module = toy.load_mlir(toy.build_arg_parser().parse_args(argv))
+        return {func.function_name: value for func, value in fingerprint.get_function_fingerprints(module).items()}
+
+    fingerprints = get_fingerprints(['tests/transpose.toy'])
+    assert get_fingerprints(['tests/transpose.toy', '-pass-pipeline=func(strip-debuginfo)']) == fingerprints
+    canonicalized = get_fingerprints(['tests/transpose.toy', '-pass-pipeline=func(canonicalize)'])
+    assert canonicalized['@multiply_transpose'] == fingerprints['@multiply_transpose']
+    assert canonicalized['@main'] != fingerprints['@main']
+
+
+def test_incremental_compile(capsys, tmp_path):
+    input_file = tmp_path / 'edited.toy'
+    source = open('tests/transpose.toy').read()
+    cache_args = ['-emit=mlir', '-pass-pipeline=func(canonicalize)', f'-cache-dir={tmp_path / "cache"}', '-incremental',
+                  '-cache-stats']
+    input_file.write_text(source)
+    toy.main([str(input_file), *cache_args])
+    capsys.readouterr()
+
+    # main changes and every function moves down, multiply_transpose is reused with shifted locations
+    input_file.write_text('# edited\n\n' + source.replace('[1, 2, 3, 4]', '[5, 6, 7, 8]'))
+    toy.main([str(input_file), '-emit=mlir', '-pass-pipeline=func(canonicalize)'])
+    expected = capsys.readouterr().out
+    toy.main([str(input_file), *cache_args])
+    captured = capsys.readouterr()
+    assert captured.out == expected
+    assert 'function cache: 1 hits, 3 misses' in captured.err
+
+
+def test_batch_compile(capsys, tmp_path):
+    for name in ('transpose.toy', 'calls.toy'):
+        (tmp_path / 'src' / 'nested').mkdir(parents=True, exist_ok=True)
+        (tmp_path / 'src' / 'nested' / name).write_text(open(f'tests/{name}').read())
+    (tmp_path / 'src' / 'broken.toy').write_text('def main() {')
+
+    output_dir = tmp_path / 'out'
+    status = batch.main([str(tmp_path / 'src' / '**' / '*.toy'), '-o', str(output_dir), '-processes', '2', '-emit=mlir'])
+    captured = capsys.readouterr()
+    assert status == 1
+    assert '2 compiled, 1 failed' in captured.out
+    assert f'error {tmp_path / "src" / "broken.toy"}' in captured.err
+
+    toy.main([str(tmp_path / 'src' / 'nested' / 'calls.toy'), '-emit=mlir'])
+    expected = capsys.readouterr().out
+    assert (output_dir / 'nested' / 'calls.mlir').read_text() == expected
+    assert (output_dir / 'nested' / 'transpose.mlir').exists()
+    assert not (output_dir / 'broken.mlir').exists()
+
+    # inputs that only differ by extension would share an output file
+    (tmp_path / 'src' / 'nested' / 'transpose.mlir').write_text(open('tests/transpose.mlir').read())
+    with pytest.raises(SystemExit):
+        batch.main([str(tmp_path / 'src' / 'nested' / '*'), '-o', str(output_dir), '-emit=mlir'])
+    assert 'would both be written to' in capsys.readouterr().err
+
+
+def test_batch_forwards_compiler_args(monkeypatch, tmp_path):
+    args, compiler_args = batch.build_arg_parser().parse_known_args(
+        ['x.toy', '-o', 'out', '-emit=mlir', '-j', '2', '-processes', '3']
+    )
+    assert args.num_processes == 3
+    assert compiler_args == ['-emit=mlir', '-j', '2']
+
+    toy_argv = []
+    monkeypatch.setattr(toy, 'main', toy_argv.extend)
+    result = batch.compile_file('x.toy', str(tmp_path / 'x.mlir'), compiler_args)
+    assert result.error is None
+    assert toy_argv == ['x.toy', '-emit=mlir', '-j', '2']
+
+
+def test_generated_program_runs(capsys, tmp_path):
+    input_file = tmp_path / 'generated.toy'
+    input_file.write_text(generator.generate_program(generator.ProgramShape(num_functions=5), seed=1))
+    toy.main([str(input_file), '-emit=run'])
+    expected = capsys.readouterr().out
+    assert expected.count('\n') == 4
+    toy.main([str(input_file), '-emit=run', '-pass-pipeline=inline,shape-inference,func(canonicalize,cse),dce'])
+    assert capsys.readouterr().out == expected
+
+
+def test_compile_daemon(capsys, monkeypatch, tmp_path):
+    socket_path = str(tmp_path / 'toy.sock')
+    server = daemon.ToyServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        toy.main(['tests/transpose.toy', '-emit=mlir'])
+        expected = capsys.readouterr().out
+        monkeypatch.setenv('TOY_DAEMON_SOCKET', socket_path)
+        with warnings.catch_warnings():
+            # the client leaves opening the input to the daemon
+            warnings.simplefilter('error', ResourceWarning)
+            assert toy_client.main(['tests/transpose.toy', '-emit=mlir']) == 0
+            gc.collect()
+        assert capsys.readouterr().out == expected
+
+        response = toy_client.request(['tests/transpose.toy', '-emit=mlir', '-pass-pipeline=bogus'], socket_path)
+        assert response['status'] == 1
+        assert 'unknown pass: bogus' in response['stderr']
+        monkeypatch.setattr('sys.stdin', io.StringIO(open('tests/transpose.toy').read()))
+        assert toy_client.main(['-', '-emit=mlir']) == 0
+        assert 'toy.func @multiply_transpose' in capsys.readouterr().out
+        assert server.num_requests == 3
+
+        # only the current user may serve or use the socket
+        assert os.stat(socket_path).st_mode & 0o777 == 0o600
+        shared_dir = tmp_path / 'shared'
+        shared_dir.mkdir()
+        shared_dir.chmod(0o777)
+        with pytest.raises(PermissionError):
+            daemon.ToyServer(str(shared_dir / 'toy.sock'))
+        with pytest.raises(PermissionError):
+            toy_client.request(['tests/transpose.toy', '-emit=mlir'], str(shared_dir / 'toy.sock'))
+        (tmp_path / 'not.sock').write_text('')
+        with pytest.raises(PermissionError):
+            toy_client.request(['tests/transpose.toy', '-emit=mlir'], str(tmp_path / 'not.sock'))
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
 if __name__ == '__main__':
     test_help_info()
+    test_lazy_imports()
     test_convert_toy_to_ast()
     test_convert_toy_to_mlir()
     test_convert_mlir_to_ast()
     test_convert_mlir_to_mlir()
+    test_interpreter_call()
+    test_fused_kernel_blocks()
+    test_batched_execution()
+    test_function_fingerprints()
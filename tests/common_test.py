@@ -0,0 +1,207 @@
+import io
+
+import numpy as np
+import pytest
+
+from python_mlir_toy.ch2 import ops
+from python_mlir_toy.common import location, mlir_literal, td, mlir_type, block, pass_manager, strip_debuginfo, \
+    constant_fold, mlir_op, serializable, liveness, scoped
+
+
+def make_constant(values=(1.0, 2.0, 3.0, 4.0)):
+    return ops.ConstantOp(location.UnknownLocation(), mlir_literal.DenseTensorLiteral([2, 2], list(values)))
+
+
+def test_use_def_chain():
+    loc = location.UnknownLocation()
+    lhs = make_constant()
+    rhs = make_constant()
+    add = ops.AddOp(loc, lhs.output, rhs.output)
+    mul = ops.MulOp(loc, add.output, add.output)
+    assert lhs.output.has_one_use()
+    assert add.output.users() == [mul]
+    assert len(add.output.uses) == 2
+    assert add.output.owner is add
+
+    add.output.replace_all_uses_with(lhs.output)
+    assert add.output.use_empty()
+    assert mul.lhs is lhs.output and mul.rhs is lhs.output
+    assert set(lhs.output.users()) == {add, mul}
+
+    mul.rhs = rhs.output
+    assert lhs.output.users() == [add, mul]
+    assert rhs.output.users() == [add, mul]
+
+    mul.erase()
+    add.erase()
+    assert lhs.output.use_empty() and rhs.output.use_empty()
+
+
+def test_return_operand():
+    loc = location.UnknownLocation()
+    value = td.Value(mlir_type.F64TensorType())
+    ret = ops.ReturnOp(loc)
+    assert ret.operand is None
+    ret = ops.ReturnOp(loc, value)
+    assert ret.operand is value
+    assert ret.get_inputs() == [value]
+
+
+def test_block_insert_and_erase():
+    body = block.Block()
+    first = body.append(make_constant())
+    last = body.append(make_constant())
+    builder = block.Builder()
+    with builder.at(block.InsertionPoint.before_op(last)):
+        middle = [builder.insert(make_constant()) for _ in range(40)]
+    assert builder.insertion_point is None
+    assert list(body) == [first, *middle, last]
+    assert len(body) == 42
+    assert first.is_before_in_block(middle[0])
+    assert middle[-1].is_before_in_block(last)
+    assert all(lhs.is_before_in_block(rhs) for lhs, rhs in zip(middle, middle[1:]))
+    assert not last.is_before_in_block(first)
+
+    for op in body:
+        if op is not first and op is not last:
+            op.erase()
+    assert list(body) == [first, last]
+    assert list(reversed(body)) == [last, first]
+    assert first.next_op is last and last.prev_op is first
+
+
+def test_pass_pipeline_parse():
+    pm = pass_manager.parse_pass_pipeline('module(func(strip-debuginfo),func(strip-debuginfo))')
+    assert pm.to_spec() == 'module(func(strip-debuginfo),func(strip-debuginfo))'
+    assert [type(p) for p in pm.get_pass_list()] == [strip_debuginfo.StripDebugInfoPass] * 2
+    pm = pass_manager.parse_pass_pipeline('strip-debuginfo')
+    assert pm.to_spec() == 'module(func(strip-debuginfo))'
+    with pytest.raises(ValueError):
+        pass_manager.parse_pass_pipeline('func(no-such-pass)')
+    with pytest.raises(ValueError):
+        pass_manager.parse_pass_pipeline('func(strip-debuginfo{no-such-option=1})')
+
+
+def make_function(body_ops, name='@main'):
+    function_type = mlir_type.FunctionType([], [])
+    return ops.ToyFuncOp(location.UnknownLocation(), function_type, name, [], [], [], body_ops)
+
+
+def test_constant_fold_chain():
+    loc = location.UnknownLocation()
+    lhs = make_constant()
+    rhs = make_constant((1e20, -2.0, 0.5, 0.0))
+    add = ops.AddOp(loc, lhs.output, rhs.output)
+    transpose = ops.TransposeOp(loc, add.output)
+    mul = ops.MulOp(loc, transpose.output, lhs.output)
+    print_op = ops.PrintOp(loc, mul.output)
+    func = make_function([lhs, rhs, add, transpose, mul, print_op, ops.ReturnOp(loc)])
+
+    fold_pass = constant_fold.ConstantFoldPass()
+    fold_pass.run_on_function(func)
+    func.verify()
+    assert fold_pass.num_folded == 3
+    assert [op.op_name for op in func.body] == ['toy.constant', 'toy.print', 'toy.return']
+    expected = (np.array([[1.0, 2.0], [3.0, 4.0]]) + np.array([[1e20, -2.0], [0.5, 0.0]])).T * np.array(
+        [[1.0, 2.0], [3.0, 4.0]])
+    assert np.array_equal(func.body.first.get_constant_value(), expected)
+
+    text = mlir_op.print_function(func)
+    parsed = mlir_op.parse_function(text, {})
+    assert np.array_equal(parsed.body.first.get_constant_value(), expected)
+
+
+def test_tensor_literal_does_not_freeze_its_input():
+    array = np.ones((2, 3))
+    literal = mlir_literal.DenseTensorLiteral.from_array(array)
+    assert array.flags.writeable
+    assert not literal.to_array().flags.writeable
+    array[0, 0] = 2.0
+    assert literal.to_array()[0, 0] == 1.0
+    # views of the frozen buffer are shared, not copied
+    assert np.shares_memory(literal.reshape([3, 2]).to_array(), literal.to_array())
+
+
+def test_number_token():
+    parser = serializable.TextParser(io.StringIO('1.5e+20 3 x'))
+    assert parser.last_token() == 1.5e20
+    parser.drop_token()
+    assert parser.last_token() == 3
+    parser.drop_token()
+    assert parser.last_token() == 'x'
+
+
+def test_identifier_and_string_tokens():
+    parser = serializable.TextParser(io.StringIO('_a1.b "x\\"y" c'))
+    assert parser.last_token() == '_a1'
+    parser.drop_token()
+    assert parser.last_token() == '.'
+    parser.drop_token()
+    assert parser.last_token() == 'b'
+    parser.drop_token()
+    assert (parser.last_token(), parser.last_token_kind()) == ('x"y', serializable.TokenKind.String)
+    parser.drop_token()
+    assert parser.last_token() == 'c'
+
+
+def test_next_unused_symbol():
+    table = scoped.SymbolTable[int]()
+    table.insert('%1', 1)
+    assert table.next_unused_symbol() == '%0'
+    table.insert('%0', 0)
+    assert table.next_unused_symbol() == '%2'
+    with table:
+        table.insert(table.next_unused_symbol(), 2)
+        table.insert(table.next_unused_symbol(), 3)
+        assert table.next_unused_symbol() == '%4'
+        assert table.next_unused_symbol('%arg') == '%arg0'
+    # symbols of the inner scope are free again
+    assert table.next_unused_symbol() == '%2'
+
+
+def test_memory_profiler(mem_profiler):
+    with mem_profiler.scope('outer'):
+        with mem_profiler.scope('inner'):
+            garbage = [object() for _ in range(10_000)]
+            del garbage
+        kept = [object() for _ in range(1_000)]
+    mem_profiler.stop()
+
+    outer = mem_profiler.root.children['outer']
+    inner = outer.children['inner']
+    # the peak of the freed list survives the nested scope, the retained bytes are only the kept list
+    assert outer.peak_bytes >= inner.peak_bytes > 10_000 * 16
+    assert inner.retained_bytes < 10_000
+    assert outer.retained_bytes >= 1_000 * 16 > inner.retained_bytes
+    assert len(kept) == 1_000
+
+
+def test_liveness():
+    loc = location.UnknownLocation()
+    lhs = make_constant()
+    rhs = make_constant()
+    add = ops.AddOp(loc, lhs.output, rhs.output)
+    unused = ops.TransposeOp(loc, add.output)
+    mul = ops.MulOp(loc, add.output, lhs.output)
+    ret = ops.ReturnOp(loc, mul.output)
+    func = make_function([lhs, rhs, add, unused, mul, ret])
+
+    func_liveness = liveness.Liveness(func)
+    assert func_liveness.get_last_use(rhs.output) is add
+    assert func_liveness.get_last_use(add.output) is mul
+    assert func_liveness.get_last_use(unused.output) is unused
+    assert func_liveness.is_last_use(mul.output, ret)
+    assert set(func_liveness.get_dying_values(mul)) == {add.output, lhs.output}
+
+
+if __name__ == '__main__':
+    test_use_def_chain()
+    test_return_operand()
+    test_block_insert_and_erase()
+    test_pass_pipeline_parse()
+    test_constant_fold_chain()
+    test_tensor_literal_does_not_freeze_its_input()
+    test_number_token()
+    test_identifier_and_string_tokens()
+    test_next_unused_symbol()
+    test_liveness()
@@ -0,0 +1,14 @@
+import pytest
+
+from python_mlir_toy.common import mem_profile
+
+
+@pytest.fixture
+def mem_profiler():
+    """A started MemoryProfiler, to be passed as the timer of the compiler phases whose memory budgets a test asserts.
+
+    Its phases are the children of mem_profiler.root once mem_profiler.stop() is called. Allocation sites are not
+    collected, budgets only need the byte and object counts."""
+    profiler = mem_profile.MemoryProfiler(num_top_sites=0)
+    yield profiler
+    profiler.stop()
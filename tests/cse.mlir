@@ -0,0 +1,15 @@
+module {
+  toy.func @main() {
+    %0 = toy.constant dense<[[1.0, 2.0], [3.0, 4.0]]> : tensor<2x2xf64> loc("tests/cse.mlir":3:10)
+    %1 = toy.constant dense<[[1.0, 2.0], [3.0, 4.0]]> : tensor<2x2xf64> loc("tests/cse.mlir":4:10)
+    %2 = toy.constant dense<[[5.0, 6.0], [7.0, 8.0]]> : tensor<2x2xf64> loc("tests/cse.mlir":5:10)
+    %3 = toy.transpose(%0 : tensor<2x2xf64>) to tensor<2x2xf64> loc("tests/cse.mlir":6:10)
+    %4 = toy.transpose(%1 : tensor<2x2xf64>) to tensor<2x2xf64> loc("tests/cse.mlir":7:10)
+    %5 = toy.add %3, %2 : tensor<2x2xf64> loc("tests/cse.mlir":8:10)
+    %6 = toy.add %4, %2 : tensor<2x2xf64> loc("tests/cse.mlir":9:10)
+    %7 = toy.mul %5, %6 : tensor<2x2xf64> loc("tests/cse.mlir":10:10)
+    toy.print %7 : tensor<2x2xf64> loc("tests/cse.mlir":11:5)
+    toy.print %7 : tensor<2x2xf64> loc("tests/cse.mlir":12:5)
+    toy.return loc("tests/cse.mlir":13:5)
+  } loc("tests/cse.mlir":2:3)
+} loc("tests/cse.mlir":1:1)